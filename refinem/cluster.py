@@ -20,7 +20,10 @@
 ###############################################################################
 
 import os
+import sys
 import logging
+import traceback
+import multiprocessing as mp
 
 from numpy import (where as np_where,
                    mean as np_mean,
@@ -29,14 +32,18 @@ from numpy import (where as np_where,
                    append as np_append,
                    ones as np_ones,
                    zeros as np_zeros,
-                   all as np_all)
+                   all as np_all,
+                   isnan as np_isnan)
 
 from biolib.common import remove_extension
-from biolib.pca import PCA
 import biolib.seq_io as seq_io
 from biolib.genomic_signature import GenomicSignature
 
-from scipy.cluster.vq import whiten, kmeans2, ClusterError
+from scipy.cluster.vq import whiten
+
+from refinem.kmeans import multi_restart_kmeans, kmeans_range, silhouette, bic
+from refinem.pca import TruncatedPCA
+from refinem.dbscan import dbscan, NOISE
 
 
 class Cluster():
@@ -49,23 +56,42 @@ class Cluster():
 
         self.cpus = cpus
 
-    def pca(self, data_matrix):
+    def pca(self, data_matrix, num_components=3, genome_id=None, scaffold_ids=None, pca_cache=None):
         """Perform PCA.
 
-        Principal components are given in self.pca,
-        and the variance in self.variance.
+        Only the leading principal components are computed. If a
+        PCA cache is given, results are reused for genomes with
+        the same id and scaffolds.
 
         Parameters
         ----------
         data_matrix : list of lists
           List of tetranucleotide signatures
+        num_components : int
+          Number of principal components to compute.
+        genome_id : str
+          Unique identifier of genome.
+        scaffold_ids : list of str
+          Scaffold corresponding to each signature.
+        pca_cache : PcaCache
+          Cache of PCA results.
+
+        Returns
+        -------
+        ndarray (n x k)
+          Projection of signatures onto the leading principal components.
+        ndarray
+          Proportion of variance captured by each principal component.
         """
 
         cols = len(data_matrix[0])
         data_matrix = np_reshape(np_array(data_matrix), (len(data_matrix), cols))
 
-        pca = PCA()
-        pc, variance = pca.pca_matrix(data_matrix, 3, bCenter=True, bScale=False)
+        if pca_cache is not None:
+            pc, variance = pca_cache.pca(genome_id, scaffold_ids, data_matrix, max(3, num_components))
+        else:
+            pca = TruncatedPCA(max(3, num_components))
+            pc, variance = pca.fit_transform(data_matrix)
 
         # ensure pc matrix has at least 3 dimensions
         if pc.shape[1] == 1:
@@ -77,9 +103,28 @@ class Cluster():
 
         return pc, variance
 
-    def run(self, scaffold_stats, num_clusters, num_components, K, no_coverage, no_pca, iterations, genome_file, output_dir):
+    def run(self, scaffold_stats, num_clusters, num_components, K, no_coverage, no_pca, iterations, genome_file, output_dir,
+                restarts=10, seed=1, max_clusters=None, k_score='silhouette', silhouette_sample=2000,
+                method='kmeans', eps=0.5, min_samples=5, pca_cache=None):
         """Calculate statistics for genomes.
 
+        Clusters are found with k-means using k-means++ seeding. Restarts
+        are performed in parallel with seeds seed, seed + 1, ..., and the
+        partition with the lowest inertia is reported.
+
+        If max_clusters is greater than num_clusters, partitions with
+        num_clusters to max_clusters clusters are found from the same
+        feature matrix and the partition with the best silhouette
+        coefficient or BIC is reported.
+
+        Alternatively, sequences can be partitioned with DBSCAN. The number
+        of clusters is then determined by the density of sequences in the
+        feature space, and sequences in sparse regions are written to a
+        separate noise file.
+
+        PCA of tetranucleotide signatures is taken from the
+        PCA cache, if given, when the genome is unchanged.
+
         Parameters
         ----------
         scaffold_stats : ScaffoldStats
@@ -100,8 +145,33 @@ class Cluster():
             Sequences being clustered.
         output_dir : str
             Directory to write results.
+        restarts : int
+            Number of k-means restarts.
+        seed : int
+            Seed for random number generator of first restart.
+        max_clusters : int
+            Maximum number of clusters to consider when selecting the number of clusters.
+        k_score : str
+            Score used to select the number of clusters ('silhouette' or 'bic').
+        silhouette_sample : int
+            Number of sequences sampled to calculate silhouette coefficients (0 = all).
+        method : str
+            Clustering method ('kmeans' or 'dbscan').
+        eps : float
+            Maximum distance between neighbouring sequences for DBSCAN.
+        min_samples : int
+            Minimum number of sequences in the neighbourhood of a core sequence for DBSCAN.
+        pca_cache : PcaCache
+            Cache of PCA results, updated with the PCA of this genome.
+
+        Returns
+        -------
+        int
+            Number of clusters formed.
         """
 
+        genome_id = remove_extension(genome_file)
+
         # get GC and mean coverage for each scaffold in genome
         self.logger.info('')
         self.logger.info('  Determining mean coverage and genomic signatures.')
@@ -109,8 +179,10 @@ class Cluster():
         genome_stats = []
         signature_matrix = []
         seqs = seq_io.read(genome_file)
-        for seq_id, seq in seqs.iteritems():
-            stats = scaffold_stats.stats[seq_id]
+        seq_ids = seqs.keys()
+        for seq_id in seq_ids:
+            seq = seqs[seq_id]
+            stats = scaffold_stats.get(seq_id)
 
             if not no_coverage:
                 genome_stats.append((np_mean(stats.coverage)))
@@ -132,7 +204,10 @@ class Cluster():
         if K != 0:
             if not no_pca:
                 self.logger.info('  Calculating PCA of genomic signatures.')
-                pc, variance = self.pca(signature_matrix)
+                if K == 4:
+                    pc, variance = self.pca(signature_matrix, num_components, genome_id, seq_ids, pca_cache)
+                else:
+                    pc, variance = self.pca(signature_matrix, num_components)
                 self.logger.info('    First %d PCs capture %.1f%% of the variance.' % (num_components, sum(variance[0:num_components]) * 100))
     
                 for i, stats in enumerate(genome_stats):
@@ -144,31 +219,299 @@ class Cluster():
 
         # whiten data if feature matrix contains coverage and genomic signature data
         if not no_coverage and K != 0:
-            print '  Whitening data.'
+            self.logger.info('  Whitening data.')
             genome_stats = whiten(genome_stats)
         else:
             genome_stats = np_array(genome_stats)
 
-        # cluster
-        self.logger.info('  Partitioning genome into %d clusters.' % num_clusters)
+        if method == 'dbscan':
+            self.logger.info('  Partitioning genome with DBSCAN (eps = %.3g, min. samples = %d).' % (eps, min_samples))
+            labels = dbscan(genome_stats, eps, min_samples)
+            num_clusters = labels.max() + 1
 
-        bError = True
-        while bError:
-            try:
-                bError = False
-                _centroids, labels = kmeans2(genome_stats, num_clusters, iterations, minit='points', missing='raise')
-            except ClusterError:
-                bError = True
+            noise = np_where(labels == NOISE)[0]
+            self.logger.info('    Identified %d clusters and %d noise sequences.' % (num_clusters, len(noise)))
+
+            fout = open(os.path.join(output_dir, genome_id + '_noise.fna'), 'w')
+            for i in noise:
+                seq_id = seq_ids[i]
+                fout.write('>' + seq_id + '\n')
+                fout.write(seqs[seq_id] + '\n')
+            fout.close()
+        elif num_clusters > len(genome_stats):
+            self.logger.error('  [Error] Number of clusters exceeds number of sequences (%d).' % len(genome_stats))
+            sys.exit()
+        elif max_clusters and max_clusters > num_clusters:
+            score_file = os.path.join(output_dir, genome_id + '_cluster_scores.tsv')
+            num_clusters, labels = self._select_num_clusters(genome_stats,
+                                                                range(num_clusters, min(max_clusters, len(genome_stats)) + 1),
+                                                                iterations,
+                                                                restarts,
+                                                                seed,
+                                                                k_score,
+                                                                silhouette_sample,
+                                                                score_file)
+            self.logger.info('  Scores for each number of clusters written to: ' + score_file)
+        else:
+            labels = self._partition(genome_stats, num_clusters, iterations, restarts, seed)
 
         for k in range(num_clusters):
             self.logger.info('    Placed %d sequences in cluster %d.' % (sum(labels == k), (k + 1)))
 
         # write out clusters
-        genome_id = remove_extension(genome_file)
         for k in range(num_clusters):
             fout = open(os.path.join(output_dir, genome_id + '_c%d' % (k + 1) + '.fna'), 'w')
             for i in np_where(labels == k)[0]:
-                seq_id = seqs.keys()[i]
+                seq_id = seq_ids[i]
                 fout.write('>' + seq_id + '\n')
                 fout.write(seqs[seq_id] + '\n')
             fout.close()
+
+        return num_clusters
+
+    def _batch_worker(self, scaffold_stats, run_args, pca_cache, queue_in, queue_out):
+        """Cluster genomes in parallel.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        run_args : dict
+            Keyword arguments passed to run().
+        pca_cache : PcaCache
+            Cache of PCA results.
+        queue_in : queue
+            Queue containing genome files.
+        queue_out : queue
+            Queue to hold number of clusters formed and new PCA results for each genome.
+        """
+
+        # per-genome progress is reported by the parent process
+        logging.getLogger().setLevel(logging.WARNING)
+
+        cluster = Cluster(1)
+        while True:
+            genome_file = queue_in.get(block=True, timeout=None)
+            if genome_file == None:
+                break
+
+            try:
+                num_clusters = cluster.run(scaffold_stats, genome_file=genome_file, pca_cache=pca_cache, **run_args)
+            except SystemExit:
+                num_clusters = None
+            except:
+                self.logger.warning('  [Warning] Failed to cluster genome: %s' % genome_file)
+                self.logger.warning(traceback.format_exc())
+                num_clusters = None
+
+            pca_entries, pca_used = {}, set()
+            if pca_cache is not None:
+                pca_entries, pca_used = pca_cache.new_entries()
+
+            queue_out.put((genome_file, num_clusters, pca_entries, pca_used))
+
+    def run_batch(self, scaffold_stats, genome_files, num_clusters, num_components, K, no_coverage, no_pca, iterations, output_dir,
+                    restarts=10, seed=1, max_clusters=None, k_score='silhouette', silhouette_sample=2000,
+                    method='kmeans', eps=0.5, min_samples=5, pca_cache=None):
+        """Partition each genome into clusters.
+
+        Statistics are read once and genomes are clustered
+        in parallel, with each genome processed as in run().
+        PCA results calculated by the worker processes are
+        added to the PCA cache.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for scaffolds in all genomes.
+        genome_files : list of str
+            Sequences of each genome being clustered.
+
+        See run() for a description of the remaining parameters.
+
+        Returns
+        -------
+        dict : d[genome_file] -> number of clusters
+            Number of clusters formed for each genome, or None if the genome could not be clustered.
+        """
+
+        run_args = {'num_clusters': num_clusters,
+                    'num_components': num_components,
+                    'K': K,
+                    'no_coverage': no_coverage,
+                    'no_pca': no_pca,
+                    'iterations': iterations,
+                    'output_dir': output_dir,
+                    'restarts': restarts,
+                    'seed': seed,
+                    'max_clusters': max_clusters,
+                    'k_score': k_score,
+                    'silhouette_sample': silhouette_sample,
+                    'method': method,
+                    'eps': eps,
+                    'min_samples': min_samples}
+
+        self.logger.info('')
+        self.logger.info('  Partitioning %d genomes into clusters:' % len(genome_files))
+
+        worker_queue = mp.Queue()
+        writer_queue = mp.Queue()
+
+        for genome_file in genome_files:
+            worker_queue.put(genome_file)
+
+        num_workers = max(1, min(self.cpus, len(genome_files)))
+        for _ in range(num_workers):
+            worker_queue.put(None)
+
+        clusters = {}
+        try:
+            worker_proc = [mp.Process(target=self._batch_worker, args=(scaffold_stats, run_args, pca_cache, worker_queue, writer_queue)) for _ in range(num_workers)]
+            for p in worker_proc:
+                p.start()
+
+            for processed_items in xrange(1, len(genome_files) + 1):
+                genome_file, genome_clusters, pca_entries, pca_used = writer_queue.get(block=True, timeout=None)
+                clusters[genome_file] = genome_clusters
+                if pca_cache is not None:
+                    pca_cache.update(pca_entries, pca_used)
+
+                statusStr = '    Finished processing %d of %d (%.2f%%) genomes.' % (processed_items, len(genome_files), float(processed_items) * 100 / len(genome_files))
+                sys.stdout.write('%s\r' % statusStr)
+                sys.stdout.flush()
+
+            sys.stdout.write('\n')
+
+            for p in worker_proc:
+                p.join()
+        except:
+            print traceback.format_exc()
+            for p in worker_proc:
+                p.terminate()
+            sys.exit()
+
+        failed = [genome_file for genome_file, genome_clusters in clusters.iteritems() if genome_clusters is None]
+        if failed:
+            self.logger.warning('  [Warning] Failed to cluster %d genomes:' % len(failed))
+            for genome_file in sorted(failed):
+                self.logger.warning('    %s' % genome_file)
+
+        return clusters
+
+    def _partition(self, genome_stats, num_clusters, iterations, restarts, seed):
+        """Partition feature matrix into a fixed number of clusters.
+
+        Parameters
+        ----------
+        genome_stats : ndarray
+            Feature matrix.
+        num_clusters : int
+            Number of cluster to form.
+        iterations : int
+            Iterations of clustering to perform.
+        restarts : int
+            Number of k-means restarts.
+        seed : int
+            Seed for random number generator of first restart.
+
+        Returns
+        -------
+        ndarray
+            Cluster of each sequence.
+        """
+
+        self.logger.info('  Partitioning genome into %d clusters.' % num_clusters)
+
+        inertia, _centroids, labels = multi_restart_kmeans(genome_stats,
+                                                            num_clusters,
+                                                            iterations,
+                                                            restarts,
+                                                            seed,
+                                                            self.cpus)
+        if inertia is None:
+            self.logger.error('  [Error] Failed to partition genome into %d non-empty clusters.' % num_clusters)
+            sys.exit()
+
+        self.logger.info('    Best of %d restarts has an inertia of %.4g.' % (restarts, inertia))
+
+        return labels
+
+    def _select_num_clusters(self, genome_stats, cluster_counts, iterations, restarts, seed, k_score, silhouette_sample, score_file):
+        """Partition feature matrix into the best number of clusters.
+
+        Parameters
+        ----------
+        genome_stats : ndarray
+            Feature matrix.
+        cluster_counts : list of int
+            Numbers of clusters to consider.
+        iterations : int
+            Iterations of clustering to perform.
+        restarts : int
+            Number of k-means restarts.
+        seed : int
+            Seed for random number generator of first restart.
+        k_score : str
+            Score used to select the number of clusters ('silhouette' or 'bic').
+        silhouette_sample : int
+            Number of sequences sampled to calculate silhouette coefficients (0 = all).
+        score_file : str
+            Output file with score for each number of clusters.
+
+        Returns
+        -------
+        int
+            Selected number of clusters.
+        ndarray
+            Cluster of each sequence.
+        """
+
+        self.logger.info('  Partitioning genome into %d to %d clusters.' % (cluster_counts[0], cluster_counts[-1]))
+
+        partitions = kmeans_range(genome_stats, cluster_counts, iterations, restarts, seed, self.cpus)
+
+        scores = {}
+        for num_clusters in cluster_counts:
+            inertia, centroids, labels = partitions[num_clusters]
+            if inertia is None:
+                continue
+
+            if k_score == 'silhouette':
+                scores[num_clusters] = silhouette(genome_stats, labels, silhouette_sample, seed)
+            else:
+                scores[num_clusters] = bic(genome_stats, centroids, labels)
+
+        if not scores:
+            self.logger.error('  [Error] Failed to partition genome into non-empty clusters.')
+            sys.exit()
+
+        # higher silhouette coefficients and lower BIC values
+        # indicate better partitions, with ties resolved in
+        # favour of fewer clusters; undefined (NaN) scores are
+        # never selected unless no partition has a defined score
+        defined = [k for k in sorted(scores) if not np_isnan(scores[k])]
+        if not defined:
+            self.logger.warning('  [Warning] No partition has a defined %s score; selecting %d clusters.' % (k_score, min(scores)))
+            best_num_clusters = min(scores)
+        elif k_score == 'silhouette':
+            best_num_clusters = max(defined, key=lambda k: scores[k])
+        else:
+            best_num_clusters = min(defined, key=lambda k: scores[k])
+
+        fout = open(score_file, 'w')
+        fout.write('Clusters\tInertia\t%s\tSelected\n' % ('Silhouette' if k_score == 'silhouette' else 'BIC'))
+        for num_clusters in cluster_counts:
+            inertia = partitions[num_clusters][0]
+            if inertia is None:
+                fout.write('%d\tNA\tNA\tno\n' % num_clusters)
+                continue
+
+            fout.write('%d\t%.4g\t%.4f\t%s\n' % (num_clusters,
+                                                  inertia,
+                                                  scores[num_clusters],
+                                                  'yes' if num_clusters == best_num_clusters else 'no'))
+        fout.close()
+
+        self.logger.info('    Selected %d clusters (%s = %.4f).' % (best_num_clusters, k_score, scores[best_num_clusters]))
+
+        return best_num_clusters, partitions[best_num_clusters][2]
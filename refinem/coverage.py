@@ -88,8 +88,12 @@ class Coverage():
 
         self.cpus = cpus
 
-    def run(self, bam_files, out_file, all_reads, min_align_per, max_edit_dist_per):
-        """Calculate coverage of sequences for each BAM file."""
+    def run(self, bam_files, out_file, all_reads, min_align_per, max_edit_dist_per, min_len=0):
+        """Calculate coverage of sequences for each BAM file.
+
+        Reads are not fetched for reference sequences shorter
+        than min_len and these sequences are not reported.
+        """
 
         # make sure all BAM files are sorted
         for bam_file in bam_files:
@@ -104,7 +108,7 @@ class Coverage():
             self.logger.info('  Calculating coverage profile for %s (%d of %d):' % (ntpath.basename(bam_file), i + 1, len(bam_files)))
 
             coverage_info[bam_file] = mp.Manager().dict()
-            coverage_info[bam_file] = self._process_bam(bam_file, all_reads, min_align_per, max_edit_dist_per, coverage_info[bam_file])
+            coverage_info[bam_file] = self._process_bam(bam_file, all_reads, min_align_per, max_edit_dist_per, min_len, coverage_info[bam_file])
 
         fout = open(out_file, 'w')
         header = 'Scaffold Id\tLength (bp)'
@@ -122,7 +126,7 @@ class Coverage():
 
         fout.close()
 
-    def _process_bam(self, bam_file, all_reads, min_align_per, max_edit_dist_per, coverage_info):
+    def _process_bam(self, bam_file, all_reads, min_align_per, max_edit_dist_per, min_len, coverage_info):
         """Calculate coverage of scaffolds in BAM file."""
 
         # determine coverage for each reference scaffolds
@@ -130,8 +134,12 @@ class Coverage():
         writer_queue = mp.Queue()
 
         bamfile = pysam.Samfile(bam_file, 'rb')
-        ref_seq_ids = bamfile.references
-        ref_seq_lens = bamfile.lengths
+        ref_seq_ids = []
+        ref_seq_lens = []
+        for ref_seq_id, ref_len in zip(bamfile.references, bamfile.lengths):
+            if ref_len >= min_len:
+                ref_seq_ids.append(ref_seq_id)
+                ref_seq_lens.append(ref_len)
 
         # populate each thread with reference scaffolds to process
         # Note: reference scaffolds are sorted by number of mapped reads
@@ -311,13 +319,16 @@ class Coverage():
             print '      # reads failing edit distance: %d (%.1f%%)' % (total_failed_edit_dist, float(total_failed_edit_dist) * 100 / total_reads)
             print '      # reads not properly paired: %d (%.1f%%)' % (total_failed_proper_pair, float(total_failed_proper_pair) * 100 / total_reads)
 
-    def read(self, coverage_file):
+    def read(self, coverage_file, registry=None):
         """Read coverage information from file.
 
         Parameters
         ----------
         coverage_file : str
             File containing coverage profiles.
+        registry : IdRegistry
+            Registry used to key profiles by integer
+            scaffold id, or None to key profiles by name.
 
         Returns
         -------
@@ -337,6 +348,8 @@ class Coverage():
                 for line in f:
                     line_split = line.split('\t')
                     scaffold_id = line_split[0]
+                    if registry is not None:
+                        scaffold_id = registry.intern(scaffold_id)
                     scaffold_len = int(line_split[1])
 
                     length[scaffold_id] = scaffold_len
@@ -0,0 +1,107 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+"""Density-based clustering (DBSCAN) backed by a k-d tree.
+
+All pairs of points within eps of each other are found with a
+single k-d tree query. Core points are those with at least
+min_samples points (including themselves) in their neighbourhood,
+clusters are the connected components of core points, and each
+remaining point within eps of a core point is assigned to the
+cluster of its nearest core point. All other points are noise.
+"""
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# label given to points not assigned to a cluster
+NOISE = -1
+
+
+def dbscan(data, eps, min_samples):
+    """Partition points into density-connected clusters.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    eps : float
+        Maximum distance between neighbouring points.
+    min_samples : int
+        Minimum number of points in the neighbourhood of a core point, including the point itself.
+
+    Returns
+    -------
+    ndarray
+        Cluster of each point, with clusters numbered from 0 in order of
+        decreasing number of core points, or NOISE if the point is not in a cluster.
+    """
+
+    data = np.asarray(data, dtype=float).reshape(len(data), -1)
+    num_points = data.shape[0]
+
+    labels = np.empty(num_points, dtype=int)
+    labels.fill(NOISE)
+    if num_points == 0:
+        return labels
+
+    tree = cKDTree(data)
+    pairs = tree.query_pairs(eps, output_type='ndarray')
+    if len(pairs) == 0:
+        pairs = np.zeros((0, 2), dtype=int)
+
+    # identify core points
+    num_neighbours = np.bincount(pairs.ravel(), minlength=num_points) + 1
+    core = num_neighbours >= min_samples
+    if not core.any():
+        return labels
+
+    # clusters are connected components of core points
+    core_pairs = pairs[core[pairs[:, 0]] & core[pairs[:, 1]]]
+    graph = coo_matrix((np.ones(len(core_pairs)), (core_pairs[:, 0], core_pairs[:, 1])),
+                       shape=(num_points, num_points))
+    _num_components, component = connected_components(graph, directed=False)
+
+    core_index = np.flatnonzero(core)
+    clusters, core_labels = np.unique(component[core_index], return_inverse=True)
+
+    # number clusters by decreasing number of core points,
+    # with ties resolved by the first point in each cluster
+    sizes = np.bincount(core_labels)
+    first_point = np.empty(len(clusters), dtype=int)
+    first_point.fill(num_points)
+    np.minimum.at(first_point, core_labels, core_index)
+    order = np.lexsort((first_point, -sizes))
+    rank = np.empty(len(clusters), dtype=int)
+    rank[order] = np.arange(len(clusters))
+    labels[core_index] = rank[core_labels]
+
+    # assign border points to the cluster of their nearest core point
+    border_pairs = np.vstack([pairs[core[pairs[:, 0]] & ~core[pairs[:, 1]]][:, ::-1],
+                              pairs[~core[pairs[:, 0]] & core[pairs[:, 1]]]])
+    if len(border_pairs):
+        dist = np.sqrt(((data[border_pairs[:, 0]] - data[border_pairs[:, 1]]) ** 2).sum(axis=1))
+        order = np.lexsort((border_pairs[:, 1], dist, border_pairs[:, 0]))
+        border_pairs = border_pairs[order]
+        first = np.r_[True, border_pairs[1:, 0] != border_pairs[:-1, 0]]
+        nearest = border_pairs[first]
+        labels[nearest[:, 0]] = labels[nearest[:, 1]]
+
+    return labels
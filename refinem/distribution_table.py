@@ -0,0 +1,259 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+import os
+import ast
+import logging
+import zipfile
+
+import numpy as np
+
+from refinem.errors import ParsingError
+
+
+class DistributionTable(object):
+    """Reference distribution compiled into sorted numpy arrays.
+
+    Distributions are read from the text files in the distributions
+    directory and stored as a table of critical values indexed by
+    [mean GC][scaffold length][percentile] for the GC distribution or
+    by [scaffold length][percentile] for the TD distribution. The
+    compiled table is cached in a binary file next to the text file
+    and rebuilt whenever the text file changes.
+
+    Nearest keys are found with a binary search and ties are
+    resolved to the smaller key.
+    """
+
+    def __init__(self, dist_file):
+        """Initialization.
+
+        Parameters
+        ----------
+        dist_file : str
+            Text file with distribution.
+        """
+
+        self.logger = logging.getLogger()
+
+        self.dist_file = dist_file
+        self.cache_file = os.path.splitext(dist_file)[0] + '.npz'
+
+        self.gc = None
+        self.lengths = None
+        self.percentiles = None
+        self.values = None
+
+        if not self._load_cache():
+            self._compile()
+            self._write_cache()
+
+    def _source_stamp(self):
+        """Size and modification time of distribution file."""
+
+        stat = os.stat(self.dist_file)
+        return np.array([stat.st_size, stat.st_mtime], dtype=float)
+
+    def _load_cache(self):
+        """Load compiled table if it is up-to-date.
+
+        Returns
+        -------
+        bool
+            True if table was loaded from cache.
+        """
+
+        if not os.path.exists(self.cache_file):
+            return False
+
+        try:
+            with np.load(self.cache_file) as data:
+                if not np.array_equal(data['source_stamp'], self._source_stamp()):
+                    return False
+
+                if data['gc'].size:
+                    self.gc = data['gc']
+                self.lengths = data['lengths']
+                self.percentiles = data['percentiles']
+                self.values = data['values']
+        except (IOError, KeyError, ValueError, zipfile.BadZipfile):
+            return False
+
+        return True
+
+    def _compile(self):
+        """Compile distribution from text file."""
+
+        with open(self.dist_file) as f:
+            d = ast.literal_eval(f.read())
+
+        # GC distributions have an additional outer key
+        # giving the mean GC of the genome
+        sample = d.itervalues().next()
+        sample = sample.itervalues().next()
+        if isinstance(sample, dict):
+            self.gc = np.array(sorted(d), dtype=float)
+            tables = [d[gc] for gc in sorted(d)]
+        else:
+            tables = [d]
+
+        length_keys = sorted(tables[0])
+        percentile_keys = sorted(tables[0][length_keys[0]])
+
+        values = np.zeros((len(tables), len(length_keys), len(percentile_keys)))
+        for i, table in enumerate(tables):
+            if sorted(table) != length_keys:
+                raise ParsingError('[Error] Scaffold lengths differ between GC values in distribution: %s' % self.dist_file)
+
+            for j, length in enumerate(length_keys):
+                if sorted(table[length]) != percentile_keys:
+                    raise ParsingError('[Error] Percentiles differ between scaffold lengths in distribution: %s' % self.dist_file)
+
+                values[i, j, :] = [table[length][p] for p in percentile_keys]
+
+        self.lengths = np.array(length_keys, dtype=float)
+        self.percentiles = np.array(percentile_keys, dtype=float)
+
+        if self.gc is None:
+            values = values[0]
+
+        self.values = values
+
+    def _write_cache(self):
+        """Write compiled table next to distribution file.
+
+        The table is written to a temporary file which then replaces
+        the compiled file, so concurrent runs never see a partial table.
+        """
+
+        gc = self.gc if self.gc is not None else np.zeros(0)
+
+        tmp_file = self.cache_file + '.%d.tmp' % os.getpid()
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f,
+                         source_stamp=self._source_stamp(),
+                         gc=gc,
+                         lengths=self.lengths,
+                         percentiles=self.percentiles,
+                         values=self.values)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError):
+            self.logger.warning('Unable to write compiled distribution: %s' % self.cache_file)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def nearest(self, keys, values):
+        """Find index of nearest key for each value.
+
+        Parameters
+        ----------
+        keys : ndarray
+            Sorted keys.
+        values : float or ndarray
+            Value(s) of interest.
+
+        Returns
+        -------
+        ndarray
+            Index of nearest key for each value.
+        """
+
+        values = np.asarray(values, dtype=float)
+
+        upper = np.clip(np.searchsorted(keys, values), 0, len(keys) - 1)
+        lower = np.clip(upper - 1, 0, len(keys) - 1)
+
+        use_upper = np.abs(keys[upper] - values) < np.abs(keys[lower] - values)
+        return np.where(use_upper, upper, lower)
+
+    def lookup(self, lengths, percentile, gc=None):
+        """Critical values of distribution.
+
+        Parameters
+        ----------
+        lengths : int or ndarray
+            Length of scaffold(s).
+        percentile : float
+            Percentile of interest.
+        gc : float or ndarray
+            Mean GC of genome(s) as a fraction, required for GC distributions.
+
+        Returns
+        -------
+        ndarray
+            Critical value at the nearest GC, length, and percentile.
+        """
+
+        length_index = self.nearest(self.lengths, lengths)
+        percentile_index = self.nearest(self.percentiles, percentile)
+
+        if self.gc is None:
+            return self.values[length_index, percentile_index]
+
+        gc_index = self.nearest(self.gc, gc)
+        return self.values[gc_index, length_index, percentile_index]
+
+    def curve(self, percentile, gc=None):
+        """Critical values across all scaffold lengths.
+
+        Parameters
+        ----------
+        percentile : float
+            Percentile of interest.
+        gc : float
+            Mean GC of genome as a fraction, required for GC distributions.
+
+        Returns
+        -------
+        ndarray
+            Scaffold lengths in ascending order.
+        ndarray
+            Critical value for each scaffold length.
+        """
+
+        percentile_index = self.nearest(self.percentiles, percentile)
+
+        if self.gc is None:
+            return self.lengths, self.values[:, percentile_index]
+
+        gc_index = self.nearest(self.gc, gc)
+        return self.lengths, self.values[gc_index, :, percentile_index]
+
+
+_tables = {}
+
+
+def read_distribution(prefix):
+    """Read reference distribution shared across the current process.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of distibution to read (gc_dist or td_dist).
+
+    Returns
+    -------
+    DistributionTable
+        Compiled distribution.
+    """
+
+    if prefix not in _tables:
+        dist_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'distributions', prefix + '.txt')
+        _tables[prefix] = DistributionTable(dist_file)
+
+    return _tables[prefix]
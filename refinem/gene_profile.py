@@ -26,6 +26,10 @@ import os
 import sys
 import logging
 import operator
+import traceback
+import multiprocessing as mp
+from array import array
+from cStringIO import StringIO
 from collections import defaultdict, namedtuple
 
 import biolib.seq_io as seq_io
@@ -37,10 +41,13 @@ from biolib.external.diamond import Diamond
 from biolib.taxonomy import Taxonomy
 from biolib.plots.krona import Krona
 
+import numpy as np
 from numpy import mean
 
 from refinem.common import concatenate_gene_files
 from refinem.scaffold_stats import ScaffoldStats
+from refinem.taxonomy_index import TaxonomyIndex, UNCLASSIFIED
+from refinem.id_registry import IdRegistry
 
 
 """
@@ -91,29 +98,28 @@ class GeneProfile(object):
         # profile for each genome
         self.profiles = {}
 
-    def taxonomic_profiles(self, table, taxonomy):
+    def taxonomic_profiles(self, table):
         """Create taxonomic profiles.
 
         Parameters
         ----------
         table : str
             Table containing hits to genes.
-        taxonomy : d[ref_genome_id] -> [domain, phylum, ..., species]
-            Taxonomic assignment of each reference genome.
         """
 
         blast_parser = BlastParser()
 
-        processed_gene_id = set()
+        prev_query_id = None
         for hit in blast_parser.read_hit(table):
-            gene_id, genome_id = hit.query_id.split('~')
-            if gene_id in processed_gene_id:
+            if hit.query_id == prev_query_id:
                 # Only consider the first hit as diamond/blast
-                # tables are sorted by bitscore. In practice, few
+                # tables list the hits of each query consecutively
+                # and sorted by bitscore. In practice, few
                 # genes will have multiple top hits.
                 continue
 
-            processed_gene_id.add(gene_id)
+            prev_query_id = hit.query_id
+            gene_id, genome_id = hit.query_id.split('~')
             scaffold_id = gene_id[0:gene_id.rfind('_')]
 
             subject_gene_id, subject_genome_id = hit.subject_id.split('~')
@@ -121,19 +127,20 @@ class GeneProfile(object):
                                              scaffold_id,
                                              subject_gene_id,
                                              subject_genome_id,
-                                             taxonomy[subject_genome_id],
                                              hit.evalue,
                                              hit.perc_identity,
                                              hit.aln_length,
                                              hit.query_end - hit.query_start + 1)
 
-    def write_genome_summary(self, output_file):
+    def write_genome_summary(self, output_file, genome_summaries):
         """Summarize classification of each genome.
 
         Parameters
         ----------
         output_file : str
             Output file.
+        genome_summaries : d[genome_id] -> str
+            Summary line of each genome.
         """
 
         fout = open(output_file, 'w')
@@ -148,12 +155,133 @@ class GeneProfile(object):
             fout.write('\t' + rank + ': avg. align. length (aa)')
         fout.write('\n')
 
-        sorted_genome_ids = alphanumeric_sort(self.profiles.keys())
+        sorted_genome_ids = alphanumeric_sort(genome_summaries.keys())
         for genome_id in sorted_genome_ids:
-            self.profiles[genome_id].write_genome_summary(fout)
+            fout.write(genome_summaries[genome_id])
 
         fout.close()
 
+    def _report_worker(self, scaffold_stats, report_dir, queue_in, queue_out):
+        """Classify genomes and write their reports in parallel.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        report_dir : str
+            Directory to store reports for individual genomes.
+        queue_in : queue
+            Queue containing gene files.
+        queue_out : queue
+            Queue to hold genome summary and Krona counts for each genome.
+        """
+
+        while True:
+            aa_file = queue_in.get(block=True, timeout=None)
+            if aa_file == None:
+                break
+
+            genome_id = remove_extension(aa_file)
+
+            try:
+                profile = self.profiles[genome_id]
+
+                scaffold_summary_out = os.path.join(report_dir, genome_id + '.scaffolds.tsv')
+                profile.write_scaffold_summary(scaffold_stats, scaffold_summary_out)
+
+                gene_summary_out = os.path.join(report_dir, genome_id + '.gene.tsv')
+                profile.write_gene_summary(gene_summary_out, seq_io.read(aa_file))
+
+                genome_profile_out = os.path.join(report_dir, genome_id + '.profile.tsv')
+                profile.write_genome_profile(genome_profile_out)
+
+                genome_summary = StringIO()
+                profile.write_genome_summary(genome_summary)
+
+                queue_out.put((genome_id,
+                               genome_summary.getvalue(),
+                               profile.scaffold_taxa_counts(),
+                               profile.gene_taxa_counts()))
+            except:
+                self.logger.error('  [Error] Failed to create reports for genome: %s' % genome_id)
+                self.logger.error(traceback.format_exc())
+                queue_out.put((genome_id, None, None, None))
+
+    def _write_reports(self, gene_files, scaffold_stats, report_dir):
+        """Classify genomes and write reports for each genome in parallel.
+
+        Parameters
+        ----------
+        gene_files : list of str
+            Fasta files of called genes to process.
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        report_dir : str
+            Directory to store reports for individual genomes.
+
+        Returns
+        -------
+        dict : d[genome_id] -> str
+            Summary line of each genome.
+        dict : d[genome_id][taxonomy_str] -> count
+            Number of genes in scaffolds assigned to each lineage.
+        dict : d[genome_id][taxonomy_str] -> count
+            Number of genes assigned to each lineage by their best hit.
+        """
+
+        worker_queue = mp.Queue()
+        writer_queue = mp.Queue()
+
+        for aa_file in gene_files:
+            worker_queue.put(aa_file)
+
+        num_workers = max(1, min(self.cpus, len(gene_files)))
+        self.logger.info('  Writing taxonomic profile for each genome with %d processes.' % num_workers)
+        for _ in range(num_workers):
+            worker_queue.put(None)
+
+        genome_summaries = {}
+        krona_scaffolds = defaultdict(lambda: defaultdict(int))
+        krona_genes = defaultdict(lambda: defaultdict(int))
+        failed = []
+        try:
+            worker_proc = [mp.Process(target=self._report_worker, args=(scaffold_stats, report_dir, worker_queue, writer_queue)) for _ in range(num_workers)]
+            for p in worker_proc:
+                p.start()
+
+            for processed_items in xrange(1, len(gene_files) + 1):
+                genome_id, genome_summary, scaffold_counts, gene_counts = writer_queue.get(block=True, timeout=None)
+
+                if genome_summary is None:
+                    failed.append(genome_id)
+                else:
+                    # reduce worker outputs into summary and Krona profiles
+                    genome_summaries[genome_id] = genome_summary
+                    for taxa_str, count in scaffold_counts.iteritems():
+                        krona_scaffolds[genome_id][taxa_str] += count
+                    for taxa_str, count in gene_counts.iteritems():
+                        krona_genes[genome_id][taxa_str] += count
+
+                statusStr = '    Finished processing %d of %d (%.2f%%) genomes.' % (processed_items, len(gene_files), float(processed_items) * 100 / len(gene_files))
+                sys.stdout.write('%s\r' % statusStr)
+                sys.stdout.flush()
+
+            sys.stdout.write('\n')
+
+            for p in worker_proc:
+                p.join()
+        except:
+            print traceback.format_exc()
+            for p in worker_proc:
+                p.terminate()
+            sys.exit()
+
+        if failed:
+            self.logger.error('  [Error] Failed to create reports for %d genomes.' % len(failed))
+            sys.exit()
+
+        return genome_summaries, krona_scaffolds, krona_genes
+
     def run(self, gene_files, stat_file, db_file, taxonomy_file, percent_to_classify, evalue, per_identity):
         """Create taxonomic profiles for a set of genomes.
 
@@ -193,22 +321,17 @@ class GeneProfile(object):
         self.logger.info('')
         self.logger.info('  Reading taxonomic assignment of reference genomes.')
 
-        t = Taxonomy()
-        taxonomy = t.read(taxonomy_file)
-        if not t.validate(taxonomy, check_prefixes=True, check_ranks=True, check_hierarchy=False, check_species=False, report_errors=True):
-            self.logger.error('[Error]  Invalid taxonomy file.')
-            sys.exit()
+        taxonomy_index = TaxonomyIndex.load(taxonomy_file)
 
         # record length and number of genes in each scaffold
         for aa_file in gene_files:
             genome_id = remove_extension(aa_file)
-            self.profiles[genome_id] = Profile(genome_id, percent_to_classify, taxonomy)
+            self.profiles[genome_id] = Profile(genome_id, percent_to_classify, taxonomy_index)
 
             for seq_id, seq in seq_io.read_seq(aa_file):
                 seq_id = seq_id[0:seq_id.rfind('~')]
                 scaffold_id = seq_id[0:seq_id.rfind('_')]
-                self.profiles[genome_id].genes_in_scaffold[scaffold_id] += 1
-                self.profiles[genome_id].coding_bases[scaffold_id] += len(seq) * 3  # length in nucleotide space
+                self.profiles[genome_id].add_gene(scaffold_id, len(seq) * 3)  # length in nucleotide space
 
         # run diamond and create taxonomic profile for each genome
         self.logger.info('')
@@ -224,69 +347,64 @@ class GeneProfile(object):
         # create taxonomic profile for each genome
         self.logger.info('')
         self.logger.info('  Creating taxonomic profile for each genome.')
-        self.taxonomic_profiles(diamond_table_out, taxonomy)
+        self.taxonomic_profiles(diamond_table_out)
 
         # write out taxonomic profile
         self.logger.info('')
-        self.logger.info('  Writing taxonomic profile for each genome.')
         report_dir = os.path.join(self.output_dir, 'bin_reports')
         make_sure_path_exists(report_dir)
-        for aa_file in gene_files:
-            genome_id = remove_extension(aa_file)
-            profile = self.profiles[genome_id]
-
-            scaffold_summary_out = os.path.join(report_dir, genome_id + '.scaffolds.tsv')
-            profile.write_scaffold_summary(scaffold_stats, scaffold_summary_out)
-
-            gene_summary_out = os.path.join(report_dir, genome_id + '.gene.tsv')
-            profile.write_gene_summary(gene_summary_out, seq_io.read(aa_file))
-
-            genome_profile_out = os.path.join(report_dir, genome_id + '.profile.tsv')
-            profile.write_genome_profile(genome_profile_out)
+        genome_summaries, krona_scaffolds, krona_genes = self._write_reports(gene_files, scaffold_stats, report_dir)
 
         # create summary report for all genomes
         genome_summary_out = os.path.join(self.output_dir, 'genome_summary.tsv')
-        self.write_genome_summary(genome_summary_out)
+        self.write_genome_summary(genome_summary_out, genome_summaries)
 
         # create Krona plot based on classification of scaffolds
-        krona_profiles = defaultdict(lambda: defaultdict(int))
-        for genome_id, profile in self.profiles.iteritems():
-            seq_assignments = profile.classify_seqs()
-
-            for seq_id, classification in seq_assignments.iteritems():
-                taxa = []
-                for r in xrange(0, len(Taxonomy.rank_labels)):
-                    taxa.append(classification[r][0])
-
-                krona_profiles[genome_id][';'.join(taxa)] += profile.genes_in_scaffold[seq_id]
-
         krona = Krona()
         krona_output_file = os.path.join(self.output_dir, 'gene_profiles.scaffolds.html')
-        krona.create(krona_profiles, krona_output_file)
+        krona.create(krona_scaffolds, krona_output_file)
 
         # create Krona plot based on best hit of each gene
-        krona_profiles = defaultdict(lambda: defaultdict(int))
-
-        for aa_file in gene_files:
-            genome_id = remove_extension(aa_file)
+        krona_output_file = os.path.join(self.output_dir, 'gene_profiles.genes.html')
+        krona.create(krona_genes, krona_output_file)
+
+
+# classification of scaffolds in a profile:
+#   seq_ids: unique identifier of each scaffold
+#   taxa: ndarray (num_seqs x num_ranks) of taxon ids, or UNCLASSIFIED
+#   num_hits: ndarray (num_seqs x num_ranks) of hits to the assigned taxon
+#   evalue, perc_identity, aln_length: ndarrays (num_seqs x num_ranks)
+#       with the sum of each statistic over hits to the assigned taxon
+Classification = namedtuple('Classification', """seq_ids
+                                                taxa
+                                                num_hits
+                                                evalue
+                                                perc_identity
+                                                aln_length""")
 
-            profile = self.profiles[genome_id]
-            for gene_id, _seq in seq_io.read_seq(aa_file):
 
-                taxa_str = Taxonomy.unclassified_taxon
-                if gene_id in profile.gene_hits:
-                    taxa_str, _hit_info = profile.gene_hits[gene_id]
+def _column(values):
+    """Convert a hit column to a numpy array."""
 
-                krona_profiles[genome_id][taxa_str] += 1
+    if len(values) == 0:
+        return np.zeros(0, dtype=values.typecode)
 
-        krona_output_file = os.path.join(self.output_dir, 'gene_profiles.genes.html')
-        krona.create(krona_profiles, krona_output_file)
+    return np.frombuffer(values, dtype=values.typecode)
 
 
 class Profile(object):
-    """Profile of hits to reference genomes."""
+    """Profile of hits to reference genomes.
 
-    def __init__(self, genome_id, percent_to_classify, taxonomy):
+    Hits are stored in columns indexed by gene, with scaffolds
+    and subject genomes given as integer indices and taxa given
+    by the integer-coded lineage of each subject genome.
+
+    The classification of scaffolds and the profile derived from it
+    are computed once and reused by all reports. They are invalidated
+    when a gene or hit is added to the profile.
+    """
+
+    def __init__(self, genome_id, percent_to_classify, taxonomy_index):
         """Initialization.
 
         Parameters
@@ -295,7 +413,7 @@ class Profile(object):
             Unique identify of genome.
         percent_to_classify : float
             Minimum percentage of genes to assign scaffold to a taxon [0, 100].
-        taxonomy : d[ref_genome_id] -> [domain, phylum, ..., species]
+        taxonomy_index : TaxonomyIndex
             Taxonomic assignment of each reference genome.
         """
 
@@ -304,7 +422,7 @@ class Profile(object):
         self.unclassified = Taxonomy.unclassified_rank
 
         self.genome_id = genome_id
-        self.taxonomy = taxonomy
+        self.taxonomy_index = taxonomy_index
 
         self.TaxaInfo = namedtuple('TaxaInfo', """evalue
                                                 perc_identity
@@ -313,17 +431,20 @@ class Profile(object):
                                                 num_genes
                                                 num_basepairs""")
 
-        # track hits at each rank: dict[scaffold_id][rank][taxa] -> [HitInfo, ...]
-        self.HitInfo = namedtuple('HitInfo', """subject_genome_id
-                                                subject_gene_id
-                                                evalue
-                                                perc_identity
-                                                aln_length
-                                                query_aln_length""")
-        self.hits = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-
-        # hit information for individual genes: d[gene_id] -> [taxonomy_str, HitInfo]
-        self.gene_hits = {}
+        # interned identifiers of scaffolds with hits and subject genes
+        self.seq_registry = IdRegistry()
+        self.subject_gene_registry = IdRegistry()
+
+        # hit information for individual genes, with one hit per gene
+        # and each gene given by its scaffold and gene number
+        self.hit_seq = array('i')
+        self.hit_gene = array('i')
+        self.hit_subject_gene = array('i')
+        self.hit_genome = array('i')
+        self.hit_evalue = array('d')
+        self.hit_perc_identity = array('d')
+        self.hit_aln_length = array('i')
+        self.hit_query_aln_length = array('i')
 
         # number of coding bases in scaffold in nucleotide space
         self.coding_bases = defaultdict(int)
@@ -331,25 +452,49 @@ class Profile(object):
         # number of genes in each scaffold
         self.genes_in_scaffold = defaultdict(int)
 
+        # cached classification and profile
+        self._classification = None
+        self._profile = None
+
+    def _invalidate(self):
+        """Discard cached classification and profile."""
+
+        self._classification = None
+        self._profile = None
+
+    def add_gene(self, scaffold_id, coding_bases):
+        """Add gene to profile.
+
+        Parameters
+        ----------
+        scaffold_id : str
+            Unique identifier of scaffold containing gene.
+        coding_bases : int
+            Length of gene in nucleotide space.
+        """
+
+        self.genes_in_scaffold[scaffold_id] += 1
+        self.coding_bases[scaffold_id] += coding_bases
+
+        self._invalidate()
+
     def add_hit(self,
                 query_gene_id, query_scaffold_id,
                 subject_gene_id, subject_genome_id,
-                tax_list, evalue, perc_identity,
+                evalue, perc_identity,
                 aln_length, query_aln_length):
         """Add hit to profile.
 
         Parameters
         ----------
         query_gene_id : str
-            Unique identifier of query gene.
+            Unique identifier of query gene, given as <scaffold_id>_<gene number>.
         query_scaffold_id : str
             Unique identifier of query scaffold.
         subject_gene_id : str
             Unique identifier of subject gene.
         subject_genome_id : str
             Unique identifier of subject gene.
-        tax_list : list
-            List indication taxa at each taxonomic rank.
         evalue : float
             E-value of hit.
         per_identity: float
@@ -360,15 +505,16 @@ class Profile(object):
             Length of query sequence in alignment.
         """
 
-        hit_info = self.HitInfo(subject_genome_id, subject_gene_id,
-                                evalue, perc_identity,
-                                aln_length, query_aln_length)
-
-        self.gene_hits[query_gene_id] = [';'.join(tax_list), hit_info]
+        self.hit_seq.append(self.seq_registry.intern(query_scaffold_id))
+        self.hit_gene.append(int(query_gene_id[len(query_scaffold_id) + 1:]))
+        self.hit_subject_gene.append(self.subject_gene_registry.intern(subject_gene_id))
+        self.hit_genome.append(self.taxonomy_index.genome_index[subject_genome_id])
+        self.hit_evalue.append(evalue)
+        self.hit_perc_identity.append(perc_identity)
+        self.hit_aln_length.append(aln_length)
+        self.hit_query_aln_length.append(query_aln_length)
 
-        d = self.hits[query_scaffold_id]
-        for i, taxa in enumerate(tax_list):
-            d[i][taxa].append(hit_info)
+        self._invalidate()
 
     def classify_seqs(self):
         """Classify scaffold.
@@ -379,42 +525,91 @@ class Profile(object):
         Classification is performed from the highest (domain)
         to lowest (species) rank. If a rank is taxonomically
         inconsistent with a higher ranks classification, this
-        rank and all lower ranks are set to unclassified.
+        rank and all lower ranks are set to unclassified. Hits to
+        reference genomes without a named taxon at a rank vote
+        for the scaffold being unclassified. Ties in the majority
+        vote are resolved in favour of taxa consistent with the
+        classification at the higher rank and then in favour of
+        the taxon with the lowest id.
 
         Returns
         -------
-        dict : d[scaffold_id][rank] -> [taxon, HitInfo]
+        Classification
             Classification of each scaffold along with summary statistics
-            of hits to the specified taxon.
+            of hits to the assigned taxon at each rank.
         """
 
-        expected_parent = Taxonomy().taxonomic_consistency(self.taxonomy)
-
-        # classify each scaffold using a majority vote
-        seq_assignments = defaultdict(lambda: defaultdict(list))
-        for seq_id, rank_hits in self.hits.iteritems():
-            parent_taxa = None
-            for rank in xrange(0, len(Taxonomy.rank_prefixes)):
-                taxa = max(rank_hits[rank], key=lambda x: len(rank_hits[rank][x]))
-                count = len(rank_hits[rank][taxa])
-
-                if ((count >= self.percent_to_classify * self.genes_in_scaffold[seq_id])
-                    and (rank == 0 or expected_parent[taxa] == parent_taxa)):
-                        seq_assignments[seq_id][rank] = [taxa, rank_hits[rank][taxa]]
-                        parent_taxa = taxa
-                else:
-                    # set to unclassified at all lower ranks
-                    for r in xrange(rank, len(Taxonomy.rank_prefixes)):
-                        seq_assignments[seq_id][r] = [self.unclassified, None]
-                    break
-
-        # identify scaffold with no hits
-        for seq_id in self.genes_in_scaffold:
-            if seq_id not in seq_assignments:
-                for rank in xrange(0, len(Taxonomy.rank_prefixes)):
-                    seq_assignments[seq_id][rank] = [self.unclassified, None]
-
-        return seq_assignments
+        if self._classification is not None:
+            return self._classification
+
+        num_ranks = len(Taxonomy.rank_prefixes)
+        num_taxa = self.taxonomy_index.num_taxa()
+
+        # scaffolds with hits are followed by scaffolds with no hits
+        seq_ids = self.seq_registry.names + [seq_id for seq_id in self.genes_in_scaffold if seq_id not in self.seq_registry]
+        num_seqs = len(seq_ids)
+        genes = np.array([self.genes_in_scaffold.get(seq_id, 0) for seq_id in seq_ids], dtype=float)
+
+        hit_seq = _column(self.hit_seq)
+        hit_taxa = self.taxonomy_index.lineages[_column(self.hit_genome)]
+        hit_evalue = _column(self.hit_evalue)
+        hit_perc_identity = _column(self.hit_perc_identity)
+        hit_aln_length = _column(self.hit_aln_length)
+
+        taxa = np.empty((num_seqs, num_ranks), dtype=np.int32)
+        taxa.fill(UNCLASSIFIED)
+        num_hits = np.zeros((num_seqs, num_ranks), dtype=int)
+        evalue = np.zeros((num_seqs, num_ranks))
+        perc_identity = np.zeros((num_seqs, num_ranks))
+        aln_length = np.zeros((num_seqs, num_ranks))
+
+        # scaffolds classified at all higher ranks
+        active = np.zeros(num_seqs, dtype=bool)
+        active[0:len(self.seq_registry)] = True
+
+        for rank in xrange(0, num_ranks):
+            # count votes for each taxon in each scaffold, with taxa
+            # offset by one so UNCLASSIFIED votes are counted
+            keys, counts = np.unique(hit_seq.astype(np.int64) * (num_taxa + 1) + (hit_taxa[:, rank] + 1), return_counts=True)
+            vote_seq = keys // (num_taxa + 1)
+            vote_taxon = keys % (num_taxa + 1) - 1
+
+            # taxa consistent with the classification at the higher rank
+            consistent = np.ones(len(keys), dtype=bool)
+            if rank != 0:
+                consistent = ((vote_taxon == UNCLASSIFIED)
+                                | (self.taxonomy_index.parents[vote_taxon] == taxa[vote_seq, rank - 1]))
+
+            # select taxon with the most votes in each scaffold
+            order = np.lexsort((vote_taxon, ~consistent, -counts, vote_seq))
+            vote_seq = vote_seq[order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = vote_seq[1:] != vote_seq[:-1]
+
+            vote_seq = vote_seq[first]
+            vote_taxon = vote_taxon[order][first]
+            counts = counts[order][first]
+            consistent = consistent[order][first]
+
+            classified = (active[vote_seq]
+                            & consistent
+                            & (vote_taxon != UNCLASSIFIED)
+                            & (counts >= self.percent_to_classify * genes[vote_seq]))
+
+            taxa[vote_seq[classified], rank] = vote_taxon[classified]
+            active[vote_seq[~classified]] = False
+
+            # summarize hits to the assigned taxon
+            hit_mask = (taxa[hit_seq, rank] == hit_taxa[:, rank]) & (hit_taxa[:, rank] != UNCLASSIFIED)
+            seqs = hit_seq[hit_mask]
+            num_hits[:, rank] = np.bincount(seqs, minlength=num_seqs)
+            evalue[:, rank] = np.bincount(seqs, weights=hit_evalue[hit_mask], minlength=num_seqs)
+            perc_identity[:, rank] = np.bincount(seqs, weights=hit_perc_identity[hit_mask], minlength=num_seqs)
+            aln_length[:, rank] = np.bincount(seqs, weights=hit_aln_length[hit_mask], minlength=num_seqs)
+
+        self._classification = Classification(seq_ids, taxa, num_hits, evalue, perc_identity, aln_length)
+
+        return self._classification
 
     def profile(self):
         """Relative abundance profile at each taxonomic rank.
@@ -422,11 +617,6 @@ class Profile(object):
         Relative abundance is derived from the number
         of base pairs assigned to a given taxa.
 
-        Parameters
-        ----------
-        rank : int
-            Desired rank.
-
         Returns
         -------
         dict : d[rank][taxa] -> percentage
@@ -437,49 +627,88 @@ class Profile(object):
            Statistics for each taxa.
         """
 
-        seq_assignments = self.classify_seqs()
+        if self._profile is not None:
+            return self._profile
+
+        classification = self.classify_seqs()
 
         total_genes = sum(self.genes_in_scaffold.values())
 
+        genes = np.array([self.genes_in_scaffold.get(seq_id, 0) for seq_id in classification.seq_ids])
+        coding_bases = np.array([self.coding_bases.get(seq_id, 0) for seq_id in classification.seq_ids])
+
         profile = defaultdict(lambda: defaultdict(float))
         stats = defaultdict(dict)
 
         for r in xrange(0, len(Taxonomy.rank_labels)):
-            num_seqs = defaultdict(int)
-            num_genes = defaultdict(int)
-            num_basepairs = defaultdict(int)
-            hit_stats = defaultdict(list)
-            for seq_id, data in seq_assignments.iteritems():
-                taxa, hit_info = data[r]
-                profile[r][taxa] += float(self.genes_in_scaffold[seq_id]) / total_genes
-                num_seqs[taxa] += 1
-                num_genes[taxa] += self.genes_in_scaffold[seq_id]
-                num_basepairs[taxa] += self.coding_bases[seq_id]
+            rank_taxa = classification.taxa[:, r]
+            for taxon_id in np.unique(rank_taxa):
+                seqs = rank_taxa == taxon_id
+                taxa = self.taxonomy_index.taxon(taxon_id)
 
-                if taxa != self.unclassified:
-                    hit_stats[taxa].extend(hit_info)
+                num_genes = int(genes[seqs].sum())
+                profile[r][taxa] += float(num_genes) / total_genes
 
-            # calculate averages of hit statistics
-            for taxa, hit_info in hit_stats.iteritems():
-                avg_evalue = mean([x.evalue for x in hit_info])
-                avg_perc_identity = mean([x.perc_identity for x in hit_info])
-                avg_aln_length = mean([x.aln_length for x in hit_info])
+                avg_evalue = avg_perc_identity = avg_aln_length = None
+                if taxon_id != UNCLASSIFIED:
+                    num_hits = float(classification.num_hits[seqs, r].sum())
+                    avg_evalue = classification.evalue[seqs, r].sum() / num_hits
+                    avg_perc_identity = classification.perc_identity[seqs, r].sum() / num_hits
+                    avg_aln_length = classification.aln_length[seqs, r].sum() / num_hits
 
                 stats[r][taxa] = self.TaxaInfo(avg_evalue,
-                                            avg_perc_identity,
-                                            avg_aln_length,
-                                            num_seqs[taxa],
-                                            num_genes[taxa],
-                                            num_basepairs[taxa])
+                                                avg_perc_identity,
+                                                avg_aln_length,
+                                                int(seqs.sum()),
+                                                num_genes,
+                                                int(coding_bases[seqs].sum()))
+
+            if self.unclassified not in stats[r]:
+                stats[r][self.unclassified] = self.TaxaInfo(None, None, None, 0, 0, 0)
+
+        self._profile = (profile, stats)
+
+        return self._profile
+
+    def scaffold_taxa_counts(self):
+        """Number of genes in scaffolds assigned to each lineage.
+
+        Returns
+        -------
+        dict : d[taxonomy_str] -> count
+            Number of genes in scaffolds classified to the given lineage.
+        """
 
-            stats[r][self.unclassified] = self.TaxaInfo(None,
-                                                     None,
-                                                     None,
-                                                     num_seqs[self.unclassified],
-                                                     num_genes[self.unclassified],
-                                                     num_basepairs[self.unclassified])
+        classification = self.classify_seqs()
 
-        return profile, stats
+        counts = defaultdict(int)
+        for i, seq_id in enumerate(classification.seq_ids):
+            taxa = [self.taxonomy_index.taxon(taxon_id) for taxon_id in classification.taxa[i]]
+            counts[';'.join(taxa)] += self.genes_in_scaffold.get(seq_id, 0)
+
+        return counts
+
+    def gene_taxa_counts(self):
+        """Number of genes assigned to each lineage by their best hit.
+
+        Returns
+        -------
+        dict : d[taxonomy_str] -> count
+            Number of genes with a best hit to a reference genome with
+            the given lineage, with genes without a hit counted as unclassified.
+        """
+
+        counts = defaultdict(int)
+
+        genomes, genome_counts = np.unique(_column(self.hit_genome), return_counts=True)
+        for genome_index, count in zip(genomes, genome_counts):
+            counts[self.taxonomy_index.lineage(genome_index)] += int(count)
+
+        genes_without_hits = sum(self.genes_in_scaffold.values()) - len(self.hit_seq)
+        if genes_without_hits > 0:
+            counts[Taxonomy.unclassified_taxon] += genes_without_hits
+
+        return counts
 
     def write_genome_summary(self, fout):
         """Write profile of most abundant taxon at each rank.
@@ -601,7 +830,7 @@ class Profile(object):
             Output file.
         """
 
-        seq_assignments = self.classify_seqs()
+        classification = self.classify_seqs()
 
         fout = open(output_file, 'w')
         fout.write('Scaffold id')
@@ -615,7 +844,7 @@ class Profile(object):
             fout.write('\t' + rank + ': avg. align. length (aa)')
         fout.write('\n')
 
-        for seq_id in seq_assignments:
+        for i, seq_id in enumerate(classification.seq_ids):
             fout.write('%s\t%s\t%.2f\t%d\t%d' % (seq_id,
                                        scaffold_stats.print_stats(seq_id),
                                        mean(scaffold_stats.coverage(seq_id)),
@@ -623,14 +852,15 @@ class Profile(object):
                                        self.coding_bases[seq_id]))
 
             for r in xrange(0, len(Taxonomy.rank_labels)):
-                taxa, hit_info = seq_assignments[seq_id][r]
+                taxa = self.taxonomy_index.taxon(classification.taxa[i, r])
 
                 if taxa != self.unclassified:
-                    avg_evalue = mean([x.evalue for x in hit_info])
-                    avg_perc_identity = mean([x.perc_identity for x in hit_info])
-                    avg_aln_length = mean([x.aln_length for x in hit_info])
+                    num_hits = classification.num_hits[i, r]
+                    avg_evalue = classification.evalue[i, r] / num_hits
+                    avg_perc_identity = classification.perc_identity[i, r] / num_hits
+                    avg_aln_length = classification.aln_length[i, r] / num_hits
 
-                    hit_str = '%.2f' % (len(hit_info) * 100.0 / self.genes_in_scaffold[seq_id])
+                    hit_str = '%.2f' % (num_hits * 100.0 / self.genes_in_scaffold[seq_id])
                     fout.write('\t%s\t%s\t%.2g\t%.2f\t%.2f' % (taxa,
                                                                hit_str,
                                                                avg_evalue,
@@ -655,11 +885,19 @@ class Profile(object):
             Amino acid sequence of each gene.
         """
 
+        # identify genes by their scaffold and gene number
+        gene_names = {}
+        for gene_id in gene_seqs:
+            scaffold_id = gene_id[0:gene_id.rfind('_')]
+            if scaffold_id in self.seq_registry:
+                gene_names[(self.seq_registry.index(scaffold_id), int(gene_id[len(scaffold_id) + 1:]))] = gene_id
+
         fout = open(output_file, 'w')
         fout.write('Gene id\tCoding bases (nt)\tSubject genome id\tSubject gene id\tTaxonomy\te-value\t% identity\talign. length (aa)\t% query aligned\tQuery sequence\n')
 
-        for gene_id, data in self.gene_hits.iteritems():
-            taxonomy, hit_info = data
+        for i in xrange(len(self.hit_seq)):
+            gene_id = gene_names[(self.hit_seq[i], self.hit_gene[i])]
+            genome_index = self.hit_genome[i]
 
             seq = gene_seqs[gene_id]
             if seq[-1] == '*':
@@ -667,11 +905,11 @@ class Profile(object):
 
             fout.write('%s\t%d\t%s\t%s\t%s\t%.2g\t%.2f\t%d\t%.2f\t%s\n' % (gene_id,
                                                                      len(seq) * 3,
-                                                                     hit_info.subject_genome_id,
-                                                                     hit_info.subject_gene_id,
-                                                                     taxonomy,
-                                                                     hit_info.evalue,
-                                                                     hit_info.perc_identity,
-                                                                     hit_info.aln_length,
-                                                                     hit_info.query_aln_length * 100.0 / len(seq),
+                                                                     self.taxonomy_index.genome_ids[genome_index],
+                                                                     self.subject_gene_registry.name(self.hit_subject_gene[i]),
+                                                                     self.taxonomy_index.lineage(genome_index),
+                                                                     self.hit_evalue[i],
+                                                                     self.hit_perc_identity[i],
+                                                                     self.hit_aln_length[i],
+                                                                     self.hit_query_aln_length[i] * 100.0 / len(seq),
                                                                      seq))
@@ -20,12 +20,13 @@
 ###############################################################################
 
 import logging
-from collections import namedtuple, defaultdict
+from collections import namedtuple
 
-from numpy import mean
+import numpy as np
 
 from biolib.common import alphanumeric_sort
-from biolib.genomic_signature import GenomicSignature
+
+from refinem.kernels import manhattan, paired_manhattan
 
 
 class GenomeStats():
@@ -40,6 +41,12 @@ class GenomeStats():
      - mean coverage
      - mean tetranucleotide signature
      - mean tetranucleotide distance (TD) from mean of genome
+
+    Statistics are keyed by the integer genome ids assigned
+    by ScaffoldStats. The length-weighted sums underlying each
+    genome are retained so statistics can be updated as scaffolds
+    are added to or removed from a genome without recalculating
+    statistics for all genomes.
     """
 
     def __init__(self):
@@ -62,6 +69,11 @@ class GenomeStats():
         ----------
         scaffold_stats : ScaffoldStats
             Statistics for individual scaffolds.
+
+        Returns
+        -------
+        dict : d[genome_id] -> GenomeStats
+            Statistics for each genome keyed by integer genome id.
         """
 
         self.logger.info('')
@@ -70,48 +82,190 @@ class GenomeStats():
 
         self.coverage_headers = scaffold_stats.coverage_headers
         self.signature_headers = scaffold_stats.signature_headers
+        self.genome_registry = scaffold_stats.genome_registry
 
-        running_genomes_stats = defaultdict(lambda:
-                                            [0,  # genome size
-                                             0,  # mean_gc
-                                             0,  # mean scaffold length
-                                             [0] * scaffold_stats.coverage_profile_length(),  # coverage profile
-                                             [0] * scaffold_stats.signature_length()])  # genomic signature
+        self.genome_stats = {}
+        self.weighted_sums = {}
 
-        for _scaffold_id, stats in scaffold_stats.stats.iteritems():
-            if stats.genome_id == scaffold_stats.unbinned:
-                continue
+        _scaffold_ids, genome_ids, gc, length, coverage, signature = scaffold_stats.matrices()
+
+        binned = genome_ids != scaffold_stats.unbinned_id
+        if not binned.any():
+            return self.genome_stats
 
-            genome_size, mean_gc, mean_length, mean_coverage, mean_signature = running_genomes_stats[stats.genome_id]
+        # group scaffolds by genome so statistics can be
+        # calculated with a single reduction per genome
+        genome_index, inverse = np.unique(genome_ids[binned], return_inverse=True)
+        order = np.argsort(inverse, kind='mergesort')
+        inverse = inverse[order]
+        starts = np.searchsorted(inverse, np.arange(len(genome_index)))
 
-            genome_size += stats.length
-            weight = float(stats.length) / genome_size
+        length = length[binned][order]
+        gc = gc[binned][order]
+        coverage = coverage[binned][order]
+        signature = signature[binned][order]
 
-            mean_gc = stats.gc * weight + mean_gc * (1.0 - weight)
-            mean_length = stats.length * weight + mean_length * (1.0 - weight)
+        # length-weighted means of scaffold statistics
+        weights = length.astype(float)
+        genome_size = np.add.reduceat(length, starts)
+        total_weight = genome_size.astype(float)
 
-            for i, cov in enumerate(stats.coverage):
-                mean_coverage[i] = cov * weight + mean_coverage[i] * (1.0 - weight)
+        gc_sum = np.add.reduceat(weights * gc, starts)
+        length_sum = np.add.reduceat(weights * weights, starts)
+        coverage_sum = np.add.reduceat(weights[:, np.newaxis] * coverage, starts, axis=0)
+        signature_sum = np.add.reduceat(weights[:, np.newaxis] * signature, starts, axis=0)
 
-            for i, freq in enumerate(stats.signature):
-                mean_signature[i] = freq * weight + mean_signature[i] * (1.0 - weight)
+        mean_gc = gc_sum / total_weight
+        mean_length = length_sum / total_weight
+        mean_coverage = coverage_sum / total_weight[:, np.newaxis]
+        mean_signature = signature_sum / total_weight[:, np.newaxis]
 
-            running_genomes_stats[stats.genome_id] = genome_size, mean_gc, mean_length, mean_coverage, mean_signature
+        # mean tetranucleotide distance of scaffolds from genome
+        td = paired_manhattan(signature, mean_signature[inverse])
+        mean_td = np.bincount(inverse, weights=td) / np.bincount(inverse)
 
         # record statistics for each genome
-        genomic_signature = GenomicSignature(0)
+        for i, genome_id in enumerate(genome_index):
+            self.weighted_sums[int(genome_id)] = [int(genome_size[i]),
+                                                    gc_sum[i],
+                                                    length_sum[i],
+                                                    coverage_sum[i],
+                                                    signature_sum[i]]
+
+            self.genome_stats[int(genome_id)] = self.GenomeStats(int(genome_size[i]),
+                                                                    mean_gc[i],
+                                                                    mean_length[i],
+                                                                    mean_coverage[i].tolist(),
+                                                                    mean_signature[i].tolist(),
+                                                                    mean_td[i])
 
-        self.genome_stats = {}
-        for genome_id, gs in running_genomes_stats.iteritems():
-            # calculate mean tetranucleotide distance
-            td = []
-            for scaffold_id in scaffold_stats.scaffolds_in_genome[genome_id]:
-                stats = scaffold_stats.stats[scaffold_id]
-                td.append(genomic_signature.manhattan(stats.signature, gs[4]))
+        return self.genome_stats
 
-            self.genome_stats[genome_id] = self.GenomeStats(gs[0], gs[1], gs[2], gs[3], gs[4], mean(td))
+    def _update_sums(self, genome_id, stats, sign):
+        """Add or subtract a scaffold from the weighted sums of a genome.
 
-        return self.genome_stats
+        Parameters
+        ----------
+        genome_id : int
+            Integer id of genome.
+        stats : namedtuple
+            Statistics of scaffold.
+        sign : int
+            1 to add scaffold, -1 to remove scaffold.
+        """
+
+        sums = self.weighted_sums.get(genome_id)
+        if sums is None:
+            sums = [0, 0.0, 0.0,
+                    np.zeros(len(self.coverage_headers)),
+                    np.zeros(len(self.signature_headers))]
+            self.weighted_sums[genome_id] = sums
+
+        weight = sign * float(stats.length)
+        sums[0] += sign * stats.length
+        sums[1] += weight * stats.gc
+        sums[2] += weight * stats.length
+        sums[3] += weight * np.array(stats.coverage)
+        sums[4] += weight * np.array(stats.signature)
+
+    def _recalculate(self, scaffold_stats, genome_id):
+        """Recalculate statistics of a genome from its weighted sums.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_id : int
+            Integer id of genome.
+        """
+
+        scaffold_ids = scaffold_stats.scaffolds_in_genome.get(genome_id)
+        if not scaffold_ids:
+            self.weighted_sums.pop(genome_id, None)
+            self.genome_stats.pop(genome_id, None)
+            return
+
+        genome_size, gc_sum, length_sum, coverage_sum, signature_sum = self.weighted_sums[genome_id]
+        total_weight = float(genome_size)
+
+        mean_signature = signature_sum / total_weight
+        signatures = np.array([scaffold_stats.stats[scaffold_id].signature for scaffold_id in scaffold_ids])
+        mean_td = manhattan(signatures, mean_signature[np.newaxis, :])[:, 0].mean()
+
+        self.genome_stats[genome_id] = self.GenomeStats(genome_size,
+                                                        gc_sum / total_weight,
+                                                        length_sum / total_weight,
+                                                        (coverage_sum / total_weight).tolist(),
+                                                        mean_signature.tolist(),
+                                                        mean_td)
+
+    def add_scaffolds(self, scaffold_stats, genome_id, scaffold_ids):
+        """Add scaffolds to a genome and update affected statistics.
+
+        Scaffolds currently assigned to another genome are moved
+        to the specified genome. Only the weighted sums of affected
+        genomes are updated and the mean TD is recalculated over the
+        scaffolds of these genomes.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_id : int
+            Integer id of genome, or the unbinned id to
+            remove scaffolds from their current genome.
+        scaffold_ids : iterable
+            Integer ids of scaffolds to add.
+
+        Returns
+        -------
+        set
+            Integer ids of genomes with modified statistics.
+        """
+
+        affected_genomes = set()
+        for scaffold_id in scaffold_ids:
+            stats = scaffold_stats.stats[scaffold_id]
+            if stats.genome_id == genome_id:
+                continue
+
+            if stats.genome_id != scaffold_stats.unbinned_id:
+                self._update_sums(stats.genome_id, stats, -1)
+                affected_genomes.add(stats.genome_id)
+
+            if genome_id != scaffold_stats.unbinned_id:
+                self._update_sums(genome_id, stats, 1)
+                affected_genomes.add(genome_id)
+
+            scaffold_stats.assign(scaffold_id, genome_id)
+
+        for affected_genome_id in affected_genomes:
+            self._recalculate(scaffold_stats, affected_genome_id)
+
+        return affected_genomes
+
+    def remove_scaffolds(self, scaffold_stats, genome_id, scaffold_ids):
+        """Remove scaffolds from a genome and update its statistics.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_id : int
+            Integer id of genome.
+        scaffold_ids : iterable
+            Integer ids of scaffolds to remove.
+
+        Returns
+        -------
+        set
+            Integer ids of genomes with modified statistics.
+        """
+
+        in_genome = scaffold_stats.scaffolds_in_genome.get(genome_id, set())
+        return self.add_scaffolds(scaffold_stats,
+                                  scaffold_stats.unbinned_id,
+                                  [scaffold_id for scaffold_id in scaffold_ids if scaffold_id in in_genome])
 
     def write(self, output_file):
         """Write genome statistics to file.
@@ -128,10 +282,14 @@ class GenomeStats():
         fout.write('\t' + '\t'.join(self.signature_headers))
         fout.write('\n')
 
-        for genome_id in alphanumeric_sort(self.genome_stats.keys()):
-            stats = self.genome_stats[genome_id]
+        genome_names = {}
+        for genome_id in self.genome_stats:
+            genome_names[self.genome_registry.name(genome_id)] = genome_id
+
+        for genome_name in alphanumeric_sort(genome_names.keys()):
+            stats = self.genome_stats[genome_names[genome_name]]
 
-            fout.write(genome_id)
+            fout.write(genome_name)
             fout.write('\t%d' % stats.genome_size)
             fout.write('\t%.2f' % stats.mean_gc)
             fout.write('\t%.2f' % stats.mean_scaffold_length)
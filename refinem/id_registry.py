@@ -0,0 +1,96 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+
+class IdRegistry(object):
+    """Map string identifiers to dense integer identifiers.
+
+    Identifiers are assigned in the order names are first
+    interned, starting at zero. Internal data structures are
+    keyed by these integers and names are only resolved when
+    results are written.
+    """
+
+    def __init__(self):
+        """Initialization."""
+
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        """Number of interned names."""
+
+        return len(self.names)
+
+    def __contains__(self, name):
+        """Check if name has been interned."""
+
+        return name in self.ids
+
+    def intern(self, name):
+        """Get integer identifier of name, assigning one if required.
+
+        Parameters
+        ----------
+        name : str
+            Name to intern.
+
+        Returns
+        -------
+        int
+            Integer identifier of name.
+        """
+
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self.ids[name] = idx
+            self.names.append(name)
+
+        return idx
+
+    def index(self, name):
+        """Integer identifier of a previously interned name.
+
+        Parameters
+        ----------
+        name : str
+            Name of interest.
+
+        Returns
+        -------
+        int
+            Integer identifier of name.
+        """
+
+        return self.ids[name]
+
+    def name(self, idx):
+        """Name associated with an integer identifier.
+
+        Parameters
+        ----------
+        idx : int
+            Integer identifier of interest.
+
+        Returns
+        -------
+        str
+            Name associated with identifier.
+        """
+
+        return self.names[idx]
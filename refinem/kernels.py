@@ -0,0 +1,318 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+"""Batched distance kernels between scaffold and genome statistics.
+
+Paired kernels compare corresponding rows of two (n x d) matrices while
+pairwise kernels compare every row of an (n x d) matrix with every row of
+an (m x d) matrix. Pairwise kernels process blocks of rows so at most
+max_block_elements values are held in temporary matrices.
+
+Values are identical to GenomicSignature.manhattan(), scipy.stats.pearsonr(),
+and the mean absolute percent error used to identify outliers.
+"""
+
+import numpy as np
+
+# minimum coverage of a genome for a coverage value
+# to be considered when calculating percent error
+MIN_REQUIRED_COVERAGE = 0.01
+
+# maximum number of values in temporary block matrices
+MAX_BLOCK_ELEMENTS = 2 ** 22
+
+
+def _block_rows(num_cols, num_values, max_block_elements):
+    """Number of rows to process per block."""
+
+    return max(1, max_block_elements // max(1, num_cols * num_values))
+
+
+def _unique_rows(x):
+    """Unique rows of a matrix and the unique row matching each row.
+
+    Rows are viewed as single opaque values so np.unique can
+    be applied without requiring its axis argument.
+    """
+
+    x = np.ascontiguousarray(x)
+    rows = x.view(np.dtype((np.void, x.dtype.itemsize * x.shape[1]))).ravel()
+    _unique, first_index, row_index = np.unique(rows, return_index=True, return_inverse=True)
+
+    return x[first_index], row_index
+
+
+def paired_manhattan(x, y, dtype=np.float64):
+    """Manhattan distance between corresponding rows.
+
+    Terms are accumulated in column order so distances
+    match GenomicSignature.manhattan() exactly.
+
+    Parameters
+    ----------
+    x : ndarray (n x d)
+        First set of profiles.
+    y : ndarray (n x d)
+        Second set of profiles.
+    dtype : numpy.dtype
+        Precision of calculations.
+
+    Returns
+    -------
+    ndarray : n
+        Distance between each pair of rows.
+    """
+
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+
+    dist = np.zeros(x.shape[0], dtype=dtype)
+    for i in xrange(x.shape[1]):
+        dist += np.abs(x[:, i] - y[:, i])
+
+    return dist
+
+
+def manhattan(x, y, dtype=np.float64, max_block_elements=MAX_BLOCK_ELEMENTS):
+    """Manhattan distance between all pairs of rows.
+
+    Parameters
+    ----------
+    x : ndarray (n x d)
+        First set of profiles.
+    y : ndarray (m x d)
+        Second set of profiles.
+    dtype : numpy.dtype
+        Precision of calculations.
+    max_block_elements : int
+        Maximum number of values in temporary matrices.
+
+    Returns
+    -------
+    ndarray : n x m
+        Distance between each row of x and each row of y.
+    """
+
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+
+    dist = np.zeros((x.shape[0], y.shape[0]), dtype=dtype)
+    block_rows = _block_rows(y.shape[0], 1, max_block_elements)
+    for start in xrange(0, x.shape[0], block_rows):
+        block = x[start:start + block_rows]
+        block_dist = dist[start:start + block_rows]
+        for i in xrange(x.shape[1]):
+            block_dist += np.abs(block[:, i][:, np.newaxis] - y[:, i][np.newaxis, :])
+
+    return dist
+
+
+def _centre(x):
+    """Subtract mean of each row."""
+
+    return x - x.mean(axis=-1)[..., np.newaxis]
+
+
+def _correlation(xm, ym):
+    """Pearson correlation between rows of centred profiles."""
+
+    r_num = np.add.reduce(xm * ym, axis=-1)
+    r_den = np.sqrt(np.sum(xm * xm, axis=-1) * np.sum(ym * ym, axis=-1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = r_num / r_den
+
+    return np.clip(r, -1.0, 1.0)
+
+
+def paired_pearson(x, y, dtype=np.float64):
+    """Pearson correlation between corresponding rows.
+
+    Calculated as in scipy.stats.pearsonr so correlations are
+    identical, with NaN reported for constant rows.
+
+    Parameters
+    ----------
+    x : ndarray (n x d)
+        First set of profiles.
+    y : ndarray (n x d)
+        Second set of profiles.
+    dtype : numpy.dtype
+        Precision of calculations.
+
+    Returns
+    -------
+    ndarray : n
+        Correlation between each pair of rows.
+    """
+
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+
+    return _correlation(_centre(x), _centre(y))
+
+
+def pearson(x, y, dtype=np.float64, max_block_elements=MAX_BLOCK_ELEMENTS):
+    """Pearson correlation between all pairs of rows.
+
+    Parameters
+    ----------
+    x : ndarray (n x d)
+        First set of profiles.
+    y : ndarray (m x d)
+        Second set of profiles.
+    dtype : numpy.dtype
+        Precision of calculations.
+    max_block_elements : int
+        Maximum number of values in temporary matrices.
+
+    Returns
+    -------
+    ndarray : n x m
+        Correlation between each row of x and each row of y.
+    """
+
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+
+    xm = _centre(x)
+    ym = _centre(y)[np.newaxis, :, :]
+
+    r = np.zeros((x.shape[0], y.shape[0]), dtype=dtype)
+    block_rows = _block_rows(y.shape[0], x.shape[1], max_block_elements)
+    for start in xrange(0, x.shape[0], block_rows):
+        block = xm[start:start + block_rows][:, np.newaxis, :]
+        r[start:start + block_rows] = _correlation(block, ym)
+
+    return r
+
+
+def _mean_percent_error(genome_coverage, coverage, absolute):
+    """Mean percent error over all values of profiles."""
+
+    error = (coverage - genome_coverage) * 100.0 / genome_coverage
+    if absolute:
+        error = np.abs(error)
+
+    return np.mean(error, axis=-1)
+
+
+def paired_percent_error(genome_coverage, coverage,
+                            min_required_coverage=MIN_REQUIRED_COVERAGE,
+                            absolute=True,
+                            dtype=np.float64):
+    """Mean percent error between corresponding coverage profiles.
+
+    Only coverage values where the genome has at least the
+    minimum required coverage are considered. NaN is reported
+    if no such values exist.
+
+    Parameters
+    ----------
+    genome_coverage : ndarray (n x d)
+        Mean coverage profile of genome for each scaffold.
+    coverage : ndarray (n x d)
+        Coverage profile of each scaffold.
+    min_required_coverage : float
+        Minimum genome coverage for values to be considered.
+    absolute : boolean
+        Flag indicating if absolute percent error should be calculated.
+    dtype : numpy.dtype
+        Precision of calculations.
+
+    Returns
+    -------
+    ndarray : n
+        Mean percent error of each scaffold.
+    """
+
+    genome_coverage = np.asarray(genome_coverage, dtype=dtype)
+    coverage = np.asarray(coverage, dtype=dtype)
+
+    error = np.empty(coverage.shape[0], dtype=dtype)
+    error.fill(np.nan)
+    if coverage.shape[0] == 0 or coverage.shape[1] == 0:
+        return error
+
+    # process scaffolds with the same set of usable coverage
+    # values together so only these values are averaged
+    usable = genome_coverage >= min_required_coverage
+    patterns, pattern_index = _unique_rows(usable)
+    for i, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+
+        sel = (pattern_index == i)
+        error[sel] = _mean_percent_error(genome_coverage[sel][:, pattern],
+                                         coverage[sel][:, pattern],
+                                         absolute)
+
+    return error
+
+
+def percent_error(genome_coverage, coverage,
+                    min_required_coverage=MIN_REQUIRED_COVERAGE,
+                    absolute=True,
+                    dtype=np.float64,
+                    max_block_elements=MAX_BLOCK_ELEMENTS):
+    """Mean percent error between all pairs of coverage profiles.
+
+    Parameters
+    ----------
+    genome_coverage : ndarray (m x d)
+        Mean coverage profile of each genome.
+    coverage : ndarray (n x d)
+        Coverage profile of each scaffold.
+    min_required_coverage : float
+        Minimum genome coverage for values to be considered.
+    absolute : boolean
+        Flag indicating if absolute percent error should be calculated.
+    dtype : numpy.dtype
+        Precision of calculations.
+    max_block_elements : int
+        Maximum number of values in temporary matrices.
+
+    Returns
+    -------
+    ndarray : n x m
+        Mean percent error of each scaffold relative to each genome.
+    """
+
+    genome_coverage = np.asarray(genome_coverage, dtype=dtype)
+    coverage = np.asarray(coverage, dtype=dtype)
+
+    error = np.empty((coverage.shape[0], genome_coverage.shape[0]), dtype=dtype)
+    error.fill(np.nan)
+    if error.size == 0 or coverage.shape[1] == 0:
+        return error
+
+    usable = genome_coverage >= min_required_coverage
+    patterns, pattern_index = _unique_rows(usable)
+    for i, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+
+        genome_index = np.flatnonzero(pattern_index == i)
+        genomes = genome_coverage[genome_index][:, pattern][np.newaxis, :, :]
+        scaffolds = coverage[:, pattern]
+
+        block_rows = _block_rows(len(genome_index), pattern.sum(), max_block_elements)
+        for start in xrange(0, coverage.shape[0], block_rows):
+            block = scaffolds[start:start + block_rows][:, np.newaxis, :]
+            error[start:start + block_rows, genome_index] = _mean_percent_error(genomes, block, absolute)
+
+    return error
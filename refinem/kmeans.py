@@ -0,0 +1,332 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+"""K-means clustering with k-means++ seeding and multiple restarts.
+
+Each restart is seeded with k-means++ and refined with
+scipy.cluster.vq.kmeans2. Restarts use deterministic seeds
+(seed + restart index) so results are reproducible regardless
+of the number of processes used, and the partition with the
+lowest inertia is kept.
+
+Partitions with different numbers of clusters can be compared
+with the silhouette coefficient or the Bayesian information
+criterion (BIC) of a spherical Gaussian mixture.
+"""
+
+import multiprocessing as mp
+
+import numpy as np
+
+from scipy.cluster.vq import kmeans2, ClusterError
+
+# maximum number of times a restart is re-seeded
+# if k-means produces an empty cluster
+MAX_RETRIES = 10
+
+
+def kmeans_pp(data, num_clusters, rng):
+    """Select initial centroids with k-means++ seeding.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    num_clusters : int
+        Number of clusters.
+    rng : numpy.random.RandomState
+        Random number generator.
+
+    Returns
+    -------
+    ndarray (k x d)
+        Initial centroids.
+    """
+
+    num_points = data.shape[0]
+
+    centroids = np.empty((num_clusters, data.shape[1]))
+    centroids[0] = data[rng.randint(num_points)]
+    closest_dist = ((data - centroids[0]) ** 2).sum(axis=1)
+
+    for c in xrange(1, num_clusters):
+        total = closest_dist.sum()
+        if total > 0:
+            index = np.searchsorted(np.cumsum(closest_dist), rng.random_sample() * total, side='right')
+            index = min(index, num_points - 1)
+        else:
+            index = rng.randint(num_points)
+
+        centroids[c] = data[index]
+        closest_dist = np.minimum(closest_dist, ((data - centroids[c]) ** 2).sum(axis=1))
+
+    return centroids
+
+
+def inertia(data, centroids, labels):
+    """Sum of squared distances of points to their centroid."""
+
+    return float(((data - centroids[labels]) ** 2).sum())
+
+
+def kmeans(data, num_clusters, iterations, seed, max_retries=MAX_RETRIES):
+    """Single k-means restart with k-means++ seeding.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    num_clusters : int
+        Number of clusters.
+    iterations : int
+        Maximum iterations of k-means.
+    seed : int
+        Seed for random number generator.
+    max_retries : int
+        Maximum number of times to re-seed if a cluster becomes empty.
+
+    Returns
+    -------
+    float
+        Inertia of partition, or None if all attempts failed.
+    ndarray (k x d)
+        Centroid of each cluster.
+    ndarray
+        Cluster of each point.
+    """
+
+    rng = np.random.RandomState(seed)
+    for _ in xrange(max_retries + 1):
+        init = kmeans_pp(data, num_clusters, rng)
+        try:
+            centroids, labels = kmeans2(data, init, iterations, minit='matrix', missing='raise')
+        except ClusterError:
+            continue
+
+        return inertia(data, centroids, labels), centroids, labels
+
+    return None, None, None
+
+
+def _kmeans_worker(args):
+    """Run a k-means restart in a worker process."""
+
+    return kmeans(*args)
+
+
+def multi_restart_kmeans(data, num_clusters, iterations, restarts, seed, cpus=1, max_retries=MAX_RETRIES):
+    """K-means with multiple restarts executed in parallel.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    num_clusters : int
+        Number of clusters.
+    iterations : int
+        Maximum iterations of k-means.
+    restarts : int
+        Number of k-means restarts.
+    seed : int
+        Seed of first restart.
+    cpus : int
+        Number of processes to use.
+    max_retries : int
+        Maximum number of times to re-seed a restart if a cluster becomes empty.
+
+    Returns
+    -------
+    float
+        Inertia of best partition, or None if all restarts failed.
+    ndarray (k x d)
+        Centroid of each cluster.
+    ndarray
+        Cluster of each point.
+    """
+
+    return kmeans_range(data, [num_clusters], iterations, restarts, seed, cpus, max_retries)[num_clusters]
+
+
+def kmeans_range(data, cluster_counts, iterations, restarts, seed, cpus=1, max_retries=MAX_RETRIES):
+    """K-means with multiple restarts for several numbers of clusters.
+
+    All restarts for all numbers of clusters are executed in a
+    single process pool. Restarts for each number of clusters
+    use the same seeds so results do not depend on the range
+    of clusters considered.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    cluster_counts : list of int
+        Numbers of clusters to consider.
+    iterations : int
+        Maximum iterations of k-means.
+    restarts : int
+        Number of k-means restarts.
+    seed : int
+        Seed of first restart.
+    cpus : int
+        Number of processes to use.
+    max_retries : int
+        Maximum number of times to re-seed a restart if a cluster becomes empty.
+
+    Returns
+    -------
+    dict : d[num_clusters] -> (inertia, centroids, labels)
+        Best partition for each number of clusters, with an
+        inertia of None if all restarts failed.
+    """
+
+    data = np.asarray(data, dtype=float).reshape(len(data), -1)
+
+    tasks = []
+    for num_clusters in cluster_counts:
+        for i in xrange(restarts):
+            tasks.append((data, num_clusters, iterations, seed + i, max_retries))
+
+    if cpus > 1 and len(tasks) > 1:
+        pool = mp.Pool(min(cpus, len(tasks)))
+        try:
+            results = pool.map(_kmeans_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_kmeans_worker(task) for task in tasks]
+
+    # select restart with lowest inertia, with ties
+    # resolved in favour of the earliest restart
+    best = {}
+    for task, result in zip(tasks, results):
+        num_clusters = task[1]
+        cur_best = best.get(num_clusters, (None, None, None))
+        if result[0] is not None and (cur_best[0] is None or result[0] < cur_best[0]):
+            cur_best = result
+        best[num_clusters] = cur_best
+
+    return best
+
+
+def silhouette(data, labels, sample_size=0, seed=0):
+    """Mean silhouette coefficient of a partition.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    labels : ndarray
+        Cluster of each point.
+    sample_size : int
+        Number of points to sample for large data sets, or 0 to use all points.
+    seed : int
+        Seed for random number generator used to sample points.
+
+    Returns
+    -------
+    float
+        Mean silhouette coefficient, or NaN if fewer than two clusters are sampled.
+    """
+
+    data = np.asarray(data, dtype=float).reshape(len(data), -1)
+    labels = np.asarray(labels)
+
+    if sample_size and len(labels) > sample_size:
+        rng = np.random.RandomState(seed)
+        sample = np.sort(rng.choice(len(labels), sample_size, replace=False))
+        data = data[sample]
+        labels = labels[sample]
+
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if len(clusters) < 2:
+        return float('nan')
+
+    sq_norm = (data ** 2).sum(axis=1)
+    dist = sq_norm[:, np.newaxis] + sq_norm[np.newaxis, :] - 2 * np.dot(data, data.T)
+    dist = np.sqrt(np.maximum(dist, 0))
+    np.fill_diagonal(dist, 0)
+
+    # mean distance of each point to the points in each cluster
+    sizes = np.bincount(labels, minlength=len(clusters)).astype(float)
+    cluster_dist = np.zeros((len(labels), len(clusters)))
+    for c in xrange(len(clusters)):
+        cluster_dist[:, c] = dist[:, labels == c].sum(axis=1)
+
+    own = np.arange(len(labels)), labels
+    own_size = sizes[labels] - 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = cluster_dist[own] / own_size
+        mean_dist = cluster_dist / sizes
+        mean_dist[own] = np.inf
+        b = mean_dist.min(axis=1)
+        s = (b - a) / np.maximum(a, b)
+
+    # points in singleton clusters have a silhouette of zero
+    s[own_size == 0] = 0
+    s[~np.isfinite(s)] = 0
+
+    return float(s.mean())
+
+
+def bic(data, centroids, labels):
+    """Bayesian information criterion of a partition.
+
+    The partition is treated as a mixture of spherical Gaussians
+    with a shared variance, as in X-means (Pelleg and Moore, 2000).
+    Lower values indicate a better partition.
+
+    Parameters
+    ----------
+    data : ndarray (n x d)
+        Feature matrix.
+    centroids : ndarray (k x d)
+        Centroid of each cluster.
+    labels : ndarray
+        Cluster of each point.
+
+    Returns
+    -------
+    float
+        BIC of partition.
+    """
+
+    data = np.asarray(data, dtype=float).reshape(len(data), -1)
+    centroids = np.asarray(centroids, dtype=float).reshape(len(centroids), -1)
+
+    num_points, num_dims = data.shape
+    num_clusters = centroids.shape[0]
+
+    sizes = np.bincount(labels, minlength=num_clusters).astype(float)
+    sizes = sizes[sizes > 0]
+
+    if num_points <= num_clusters:
+        return float('inf')
+
+    variance = inertia(data, centroids, labels) / (num_dims * (num_points - num_clusters))
+    if variance <= 0:
+        return float('-inf')
+
+    log_likelihood = (sizes * np.log(sizes)
+                      - sizes * np.log(num_points)
+                      - sizes * num_dims / 2.0 * np.log(2 * np.pi * variance)
+                      - num_dims * (sizes - 1) / 2.0).sum()
+
+    num_params = (num_clusters - 1) + num_clusters * num_dims + 1
+
+    return float(-2 * log_likelihood + num_params * np.log(num_points))
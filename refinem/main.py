@@ -31,6 +31,8 @@ from refinem.coverage import Coverage
 from refinem.tetranucleotide import Tetranucleotide
 from refinem.outliers import Outliers
 from refinem.cluster import Cluster
+from refinem.pca_cache import PcaCache, pca_cache_file
+from refinem.null_distributions import NullDistributions, DEFAULT_FRAGMENT_LENGTHS
 from refinem.plots.gc_plots import GcPlots
 from refinem.plots.td_plots import TdPlots
 from refinem.plots.cov_perc_plots import CovPercPlots
@@ -172,7 +174,7 @@ class OptionsParser():
             else:
                 coverage = Coverage(options.cpus)
                 coverage_file = os.path.join(options.output_dir, 'coverage.tsv')
-                coverage.run(options.bam_files, coverage_file, options.cov_all_reads, options.cov_min_align, options.cov_max_edit_dist)
+                coverage.run(options.bam_files, coverage_file, options.cov_all_reads, options.cov_min_align, options.cov_max_edit_dist, options.min_len)
                 self.logger.info('')
                 self.logger.info('  Coverage profiles written to: %s' % coverage_file)
         else:
@@ -183,7 +185,7 @@ class OptionsParser():
             self.logger.info('')
             tetra = Tetranucleotide(options.cpus)
             tetra_file = os.path.join(options.output_dir, 'tetra.tsv')
-            signatures = tetra.run(options.scaffold_file)
+            signatures = tetra.run(options.scaffold_file, options.min_len)
             tetra.write(signatures, tetra_file)
             self.logger.info('  Tetranucleotide signatures written to: %s' % tetra_file)
         else:
@@ -192,7 +194,7 @@ class OptionsParser():
         # write out scaffold statistics
         stats_output = os.path.join(options.output_dir, 'scaffold_stats.tsv')
         stats = ScaffoldStats(options.cpus)
-        stats.run(options.scaffold_file, genome_files, tetra_file, coverage_file, stats_output)
+        stats.run(options.scaffold_file, genome_files, tetra_file, coverage_file, stats_output, options.min_len)
 
         self.logger.info('  Scaffold statistic written to: %s' % stats_output)
 
@@ -262,6 +264,29 @@ class OptionsParser():
         check_file_exists(options.scaffold_stats_file)
         make_sure_path_exists(options.output_dir)
 
+        sweep_options = [options.sweep_gc_perc, options.sweep_td_perc, options.sweep_cov_corr, options.sweep_cov_perc]
+
+        if options.streaming:
+            if any(sweep_options):
+                self.logger.warning('  [Warning] Threshold sweeps are not supported in streaming mode.\n')
+                sys.exit()
+
+            self.logger.info('')
+            self.logger.info('  Identifying outliers in batches of genomes.')
+            outlier_file = os.path.join(options.output_dir, 'outliers.tsv')
+            outliers = Outliers()
+            outliers.identify_streaming(options.scaffold_stats_file,
+                                            options.gc_perc, options.td_perc,
+                                            options.cov_corr, options.cov_perc,
+                                            options.report_type, outlier_file,
+                                            options.min_len,
+                                            options.max_scaffolds,
+                                            options.tmp_dir)
+            self.logger.info('  Outlier information written to: ' + outlier_file)
+
+            self.time_keeper.print_time_stamp()
+            return
+
         self.logger.info('')
         self.logger.info('  Reading scaffold statistics.')
         scaffold_stats = ScaffoldStats()
@@ -272,11 +297,30 @@ class OptionsParser():
 
         # identify outliers
         outliers = Outliers()
+
+        if any(sweep_options):
+            summary_file = os.path.join(options.output_dir, 'outlier_sweep.tsv')
+            sweep_scaffold_file = os.path.join(options.output_dir, 'outlier_sweep_scaffolds.tsv')
+            outliers.sweep(scaffold_stats, genome_stats,
+                                    options.sweep_gc_perc or [options.gc_perc],
+                                    options.sweep_td_perc or [options.td_perc],
+                                    options.sweep_cov_corr or [options.cov_corr],
+                                    options.sweep_cov_perc or [options.cov_perc],
+                                    options.report_type,
+                                    summary_file, sweep_scaffold_file,
+                                    options.min_len)
+            self.logger.info('  Outliers for each combination of thresholds written to: ' + summary_file)
+            self.logger.info('  Outlying scaffolds for each combination written to: ' + sweep_scaffold_file)
+
+            self.time_keeper.print_time_stamp()
+            return
+
         outlier_file = os.path.join(options.output_dir, 'outliers.tsv')
         outliers.identify(scaffold_stats, genome_stats,
                                       options.gc_perc, options.td_perc,
                                       options.cov_corr, options.cov_perc,
-                                      options.report_type, outlier_file)
+                                      options.report_type, outlier_file,
+                                      options.min_len)
         self.logger.info('  Outlier information written to: ' + outlier_file)
 
         # create outlier plots
@@ -306,8 +350,10 @@ class OptionsParser():
         plot_dir = os.path.join(options.output_dir, 'plots')
         make_sure_path_exists(plot_dir)
         genome_plots = defaultdict(list)
-        for genome_id, gs in genome_stats.iteritems():
+        pca_cache = PcaCache(pca_cache_file(options.scaffold_stats_file), options.scaffold_stats_file)
+        for genome_index, gs in genome_stats.iteritems():
             genomes_processed += 1
+            genome_id = scaffold_stats.genome_name(genome_index)
 
             sys.stdout.write('  Plotting scaffold distribution for %d of %d (%.1f%%) genomes.\r' %
                                                                                             (genomes_processed,
@@ -316,8 +362,8 @@ class OptionsParser():
             sys.stdout.flush()
 
             genome_scaffold_stats = {}
-            for scaffold_id in scaffold_stats.scaffolds_in_genome[genome_id]:
-                genome_scaffold_stats[scaffold_id] = scaffold_stats.stats[scaffold_id]
+            for scaffold_id in scaffold_stats.scaffolds_in_genome[genome_index]:
+                genome_scaffold_stats[scaffold_stats.scaffold_name(scaffold_id)] = scaffold_stats.stats[scaffold_id]
 
             if options.individual_plots:
                 #~ # GC plot
@@ -354,7 +400,7 @@ class OptionsParser():
                     #~ cov_corr_plots.save_html(os.path.join(plot_dir, genome_id + '.cov_corr.html'))
 
             #~ # combined distribution, GC vs. coverage, and tetranucleotide signature plots
-            #~ combined_plots = CombinedPlots(options)
+            #~ combined_plots = CombinedPlots(options, genome_id, pca_cache)
             #~ combined_plots.plot(genome_scaffold_stats,
                             #~ highlight_scaffolds_ids, link_scaffold_ids, gs,
                             #~ outliers.gc_dist, outliers.td_dist,
@@ -394,7 +440,7 @@ class OptionsParser():
             #~ genome_plots[genome_id].append(('GC vs. coverage', genome_id + '.gc_coverge.html'))
 
             # tetranucleotide signature PCA plot
-            tetra = TetraPcaPlot(options)
+            tetra = TetraPcaPlot(options, genome_id, pca_cache)
             tetra.plot(genome_scaffold_stats, highlight_scaffolds_ids, link_scaffold_ids)
 
             output_plot = os.path.join(plot_dir, genome_id + '.tetra_pca.' + options.image_type)
@@ -405,6 +451,8 @@ class OptionsParser():
 
         sys.stdout.write('\n')
 
+        pca_cache.save()
+
         outliers.create_html_index(plot_dir, genome_plots)
 
         self.logger.info('  Outlier plots written to: ' + plot_dir)
@@ -419,15 +467,52 @@ class OptionsParser():
         self.logger.info('*******************************************************************************')
 
         check_file_exists(options.scaffold_stats_file)
-        check_file_exists(options.genome_file)
         make_sure_path_exists(options.output_dir)
 
+        if os.path.isdir(options.genome_file):
+            genome_files = self._genome_files(options.genome_file, options.genome_ext)
+        else:
+            check_file_exists(options.genome_file)
+            genome_files = [options.genome_file]
+
         self.logger.info('')
         self.logger.info('  Reading scaffold statistics.')
+        scaffold_ids = []
+        for genome_file in genome_files:
+            scaffold_ids.extend([seq_id for seq_id, _seq in seq_io.read_seq(genome_file)])
         scaffold_stats = ScaffoldStats()
-        scaffold_stats.read(options.scaffold_stats_file)
+        scaffold_stats.read(options.scaffold_stats_file, scaffold_ids=scaffold_ids)
+
+        pca_cache = PcaCache(pca_cache_file(options.scaffold_stats_file), options.scaffold_stats_file)
 
         cluster = Cluster(options.cpus)
+        if os.path.isdir(options.genome_file):
+            cluster.run_batch(scaffold_stats,
+                                genome_files,
+                                options.num_clusters,
+                                options.num_components,
+                                options.K,
+                                options.no_coverage,
+                                options.no_pca,
+                                options.iterations,
+                                options.output_dir,
+                                options.restarts,
+                                options.seed,
+                                options.max_clusters,
+                                options.k_score,
+                                options.silhouette_sample,
+                                options.method,
+                                options.eps,
+                                options.min_samples,
+                                pca_cache)
+            pca_cache.save()
+
+            self.logger.info('')
+            self.logger.info('  Partitioned sequences written to: ' + options.output_dir)
+
+            self.time_keeper.print_time_stamp()
+            return
+
         cluster.run(scaffold_stats,
                     options.num_clusters,
                     options.num_components,
@@ -436,7 +521,17 @@ class OptionsParser():
                     options.no_pca,
                     options.iterations,
                     options.genome_file,
-                    options.output_dir)
+                    options.output_dir,
+                    options.restarts,
+                    options.seed,
+                    options.max_clusters,
+                    options.k_score,
+                    options.silhouette_sample,
+                    options.method,
+                    options.eps,
+                    options.min_samples,
+                    pca_cache)
+        pca_cache.save()
 
         self.logger.info('')
         self.logger.info('  Partitioned sequences written to: ' + options.output_dir)
@@ -504,7 +599,8 @@ class OptionsParser():
         outliers.compatible(putative_homologs, scaffold_stats, genome_stats,
                                       options.gc_perc, options.td_perc,
                                       options.cov_corr, options.cov_perc,
-                                      options.report_type, output_file)
+                                      options.report_type, output_file,
+                                      options.top_k)
 
         self.logger.info('')
         self.logger.info('  Results written to: ' + output_file)
@@ -565,6 +661,66 @@ class OptionsParser():
 
         self.time_keeper.print_time_stamp()
 
+    def modify_bins(self, options):
+        """Modify bins command"""
+        self.logger.info('')
+        self.logger.info('*******************************************************************************')
+        self.logger.info(' [RefineM - modify_bins] Modifying scaffolds in all genomes.')
+        self.logger.info('*******************************************************************************')
+
+        if not (options.outlier_file or options.compatible_file):
+            self.logger.warning('  [Warning] No modification to bins requested.\n')
+            sys.exit()
+
+        check_file_exists(options.scaffold_file)
+        if options.outlier_file:
+            check_file_exists(options.outlier_file)
+        if options.compatible_file:
+            check_file_exists(options.compatible_file)
+
+        if os.path.realpath(options.genome_nt_dir) == os.path.realpath(options.output_dir):
+            self.logger.warning('  [Warning] Output directory must differ from the genome directory.\n')
+            sys.exit()
+
+        genome_files = self._genome_files(options.genome_nt_dir, options.genome_ext)
+        make_sure_path_exists(options.output_dir)
+
+        outliers = Outliers()
+        changes = outliers.modify_bins(options.scaffold_file,
+                                        genome_files,
+                                        options.outlier_file,
+                                        options.compatible_file,
+                                        options.unique_only,
+                                        options.output_dir)
+
+        num_removed = sum([len(removed) for removed, _added in changes.values()])
+        num_added = sum([len(added) for _removed, added in changes.values()])
+
+        self.logger.info('')
+        self.logger.info('  Removed %d and added %d scaffolds across %d genomes.' % (num_removed, num_added, len(changes)))
+        self.logger.info('  Modified genomes written to: ' + options.output_dir)
+
+        if options.scaffold_stats_file:
+            check_file_exists(options.scaffold_stats_file)
+
+            self.logger.info('')
+            self.logger.info('  Re-scoring modified genomes.')
+            scaffold_stats = ScaffoldStats()
+            scaffold_stats.read(options.scaffold_stats_file)
+
+            genome_stats = GenomeStats()
+            genome_stats.run(scaffold_stats)
+
+            outlier_file = os.path.join(options.output_dir, 'outliers.tsv')
+            outliers.rescore(scaffold_stats, genome_stats, changes,
+                                options.gc_perc, options.td_perc,
+                                options.cov_corr, options.cov_perc,
+                                options.report_type, outlier_file,
+                                options.min_len, options.outlier_file)
+            self.logger.info('  Outlier information written to: ' + outlier_file)
+
+        self.time_keeper.print_time_stamp()
+
     def call_genes(self, options):
         """Call genes command"""
         self.logger.info('')
@@ -593,6 +749,41 @@ class OptionsParser():
 
         self.time_keeper.print_time_stamp()
 
+    def null_dist(self, options):
+        """Null distribution command"""
+        self.logger.info('')
+        self.logger.info('*******************************************************************************')
+        self.logger.info(' [RefineM - null_dist] Creating GC and TD distributions from reference genomes.')
+        self.logger.info('*******************************************************************************')
+
+        genome_files = self._genome_files(options.genome_nt_dir, options.genome_ext)
+        if not self._check_nuclotide_seqs(genome_files):
+            self.logger.warning('[Warning] All files must contain nucleotide sequences.')
+            sys.exit()
+
+        make_sure_path_exists(options.output_dir)
+
+        frag_lens = options.frag_lens
+        if not frag_lens:
+            frag_lens = DEFAULT_FRAGMENT_LENGTHS
+
+        gc_dist_file = os.path.join(options.output_dir, 'gc_dist.txt')
+        td_dist_file = os.path.join(options.output_dir, 'td_dist.txt')
+
+        null_dists = NullDistributions(options.cpus)
+        null_dists.run(genome_files,
+                        frag_lens,
+                        options.gc_bin_size,
+                        options.max_fragments,
+                        gc_dist_file,
+                        td_dist_file)
+
+        self.logger.info('  GC distribution written to: ' + gc_dist_file)
+        self.logger.info('  TD distribution written to: ' + td_dist_file)
+        self.logger.info('  Copy these files to the RefineM distributions directory to use them when identifying outliers.')
+
+        self.time_keeper.print_time_stamp()
+
     def unique(self, options):
         """Unique command"""
         self.logger.info('')
@@ -755,8 +946,12 @@ class OptionsParser():
             self.bin_compare(options)
         elif(options.subparser_name == 'modify'):
             self.modify(options)
+        elif(options.subparser_name == 'modify_bins'):
+            self.modify_bins(options)
         elif(options.subparser_name == 'call_genes'):
             self.call_genes(options)
+        elif(options.subparser_name == 'null_dist'):
+            self.null_dist(options)
         elif(options.subparser_name == 'unbinned'):
             self.unbinned(options)
         elif (options.subparser_name == 'tetra_compare'):
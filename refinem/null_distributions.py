@@ -0,0 +1,484 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+import os
+import sys
+import logging
+import itertools
+import traceback
+import multiprocessing as mp
+
+import numpy as np
+
+import biolib.seq_io as seq_io
+from biolib.genomic_signature import GenomicSignature
+
+from refinem.kernels import paired_manhattan
+
+
+# scaffold lengths of the distributions shipped with RefineM
+DEFAULT_FRAGMENT_LENGTHS = [500, 600, 700, 800, 900, 1000, 1200, 1400, 1600, 1800,
+                            2000, 2500, 3000, 3500, 4000, 4500, 5000, 6000, 7000, 8000,
+                            9000, 10000, 15000, 20000, 25000, 30000, 35000, 40000, 45000,
+                            50000, 60000, 70000, 80000, 90000, 100000, 200000, 300000,
+                            400000, 600000, 800000, 1000000]
+
+
+class NullDistributions(object):
+    """Create GC and TD distributions from reference genomes.
+
+    Each reference genome is fragmented into non-overlapping windows
+    at a set of fragment lengths. The change in GC and the tetranucleotide
+    distance (TD) of each fragment from its genome is binned into a
+    fine-grained histogram so distributions over many thousands of
+    genomes can be accumulated in constant memory. Only the range of
+    bins occupied at each fragment length is stored. Percentiles are
+    interpolated from the cumulative histograms and written in the
+    format read by DistributionTable.
+    """
+
+    def __init__(self, cpus=1):
+        """Initialization.
+
+        Parameters
+        ----------
+        cpus : int
+            Number of cpus to use.
+        """
+
+        self.logger = logging.getLogger()
+
+        self.cpus = cpus
+
+        # resolution of histograms used to accumulate
+        # changes in GC and tetranucleotide distances
+        self.gc_range = (-1.0, 1.0)
+        self.td_range = (0.0, 2.0)
+        self.num_bins = 40000
+
+        self.percentiles = np.arange(0, 100.5, 0.5)
+
+        # map each of the 256 tetranucleotides, encoded with
+        # A=0, C=1, G=2, T=3, to its canonical column
+        self.signatures = GenomicSignature(4)
+        canonical_order = self.signatures.canonical_order()
+        canonical_index = dict((kmer, i) for i, kmer in enumerate(canonical_order))
+        rev_comp = dict(zip('ACGT', 'TGCA'))
+
+        self.kmer_to_canonical = np.zeros(256, dtype=np.int64)
+        for code, kmer in enumerate(itertools.product('ACGT', repeat=4)):
+            kmer = ''.join(kmer)
+            kmer_rc = ''.join([rev_comp[ch] for ch in reversed(kmer)])
+            self.kmer_to_canonical[code] = canonical_index.get(kmer, canonical_index.get(kmer_rc))
+        self.num_canonical = len(canonical_order)
+
+        self.base_codes = np.empty(256, dtype=np.int8)
+        self.base_codes.fill(-1)
+        for code, base in enumerate('ACGT'):
+            self.base_codes[ord(base)] = code
+            self.base_codes[ord(base.lower())] = code
+
+    def _encode(self, seq):
+        """Encode sequence as GC indicators and tetranucleotide codes.
+
+        Parameters
+        ----------
+        seq : str
+            Nucleotide sequence.
+
+        Returns
+        -------
+        ndarray
+            Flag indicating if each base is valid (A, C, G, or T).
+        ndarray
+            Flag indicating if each base is a G or C.
+        ndarray
+            Code of tetranucleotide starting at each position, or -1 if it contains an invalid base.
+        """
+
+        bases = self.base_codes[np.frombuffer(seq, dtype=np.uint8)]
+
+        valid = bases >= 0
+        gc = (bases == 1) | (bases == 2)
+
+        if len(bases) < 4:
+            return valid, gc, np.zeros(0, dtype=np.int64)
+
+        kmers = np.zeros(len(bases) - 3, dtype=np.int64)
+        kmer_valid = np.ones(len(bases) - 3, dtype=bool)
+        for i in xrange(4):
+            b = bases[i:len(bases) - 3 + i]
+            kmers = kmers * 4 + np.where(b >= 0, b, 0)
+            kmer_valid &= (b >= 0)
+        kmers[~kmer_valid] = -1
+
+        return valid, gc, kmers
+
+    def _fragment(self, valid, gc, kmers, frag_len, max_fragments, rng):
+        """GC and tetranucleotide counts of non-overlapping fragments.
+
+        Parameters
+        ----------
+        valid : ndarray
+            Flag indicating if each base is valid.
+        gc : ndarray
+            Flag indicating if each base is a G or C.
+        kmers : ndarray
+            Code of tetranucleotide starting at each position.
+        frag_len : int
+            Length of fragments.
+        max_fragments : int
+            Maximum number of fragments to sample, or 0 for all fragments.
+        rng : numpy.random.RandomState
+            Random number generator used to sample fragments.
+
+        Returns
+        -------
+        ndarray
+            GC of each fragment as a fraction.
+        ndarray (n x 136)
+            Tetranucleotide counts of each fragment in canonical order.
+        """
+
+        num_frags = len(valid) // frag_len
+        if num_frags == 0 or frag_len < 4:
+            return np.zeros(0), np.zeros((0, self.num_canonical))
+
+        frags = np.arange(num_frags)
+        if max_fragments and num_frags > max_fragments:
+            frags = np.sort(rng.choice(num_frags, max_fragments, replace=False))
+
+        end = num_frags * frag_len
+        valid_count = valid[:end].reshape(num_frags, frag_len).sum(axis=1)[frags]
+        gc_count = gc[:end].reshape(num_frags, frag_len).sum(axis=1)[frags]
+
+        # only consider tetranucleotides fully contained in a fragment
+        kmer_pos = np.arange(frag_len - 3)
+        frag_kmers = kmers[(frags * frag_len)[:, np.newaxis] + kmer_pos[np.newaxis, :]]
+        frag_index = np.repeat(np.arange(len(frags)), frag_len - 3)
+        frag_kmers = frag_kmers.ravel()
+        sel = frag_kmers >= 0
+
+        counts = np.bincount(frag_index[sel] * self.num_canonical + self.kmer_to_canonical[frag_kmers[sel]],
+                             minlength=len(frags) * self.num_canonical)
+        counts = counts.reshape(len(frags), self.num_canonical)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frag_gc = gc_count.astype(float) / valid_count
+
+        return frag_gc, counts
+
+    def _bin_index(self, values, value_range):
+        """Histogram bin of each value.
+
+        Parameters
+        ----------
+        values : ndarray
+            Values to bin.
+        value_range : (float, float)
+            Range of histogram.
+
+        Returns
+        -------
+        ndarray
+            Bin of each value.
+        """
+
+        lower, upper = value_range
+        width = (upper - lower) / self.num_bins
+
+        index = np.floor((values - lower) / width).astype(np.int64)
+        return np.clip(index, 0, self.num_bins - 1).astype(np.uint16)
+
+    def _process_genome(self, genome_file, frag_lens, max_fragments):
+        """Change in GC and TD of fragments from a genome.
+
+        Parameters
+        ----------
+        genome_file : str
+            Fasta file of reference genome.
+        frag_lens : list of int
+            Lengths of fragments.
+        max_fragments : int
+            Maximum number of fragments to sample per fragment length and scaffold, or 0 for all.
+
+        Returns
+        -------
+        float
+            GC of genome as a fraction.
+        list of (ndarray, ndarray)
+            Histogram bins of change in GC and TD for fragments of each length.
+        """
+
+        rng = np.random.RandomState(abs(hash(os.path.basename(genome_file))) % (2 ** 32))
+
+        genome_valid = 0
+        genome_gc = 0
+        genome_counts = np.zeros(self.num_canonical)
+        frag_gc = [[] for _ in frag_lens]
+        frag_counts = [[] for _ in frag_lens]
+        for _seq_id, seq in seq_io.read_seq(genome_file):
+            valid, gc, kmers = self._encode(seq)
+
+            genome_valid += valid.sum()
+            genome_gc += gc.sum()
+            sel = kmers >= 0
+            genome_counts += np.bincount(self.kmer_to_canonical[kmers[sel]], minlength=self.num_canonical)
+
+            for i, frag_len in enumerate(frag_lens):
+                f_gc, f_counts = self._fragment(valid, gc, kmers, frag_len, max_fragments, rng)
+                if len(f_gc):
+                    frag_gc[i].append(f_gc)
+                    frag_counts[i].append(f_counts)
+
+        if genome_valid == 0 or genome_counts.sum() == 0:
+            return None, None
+
+        genome_gc = float(genome_gc) / genome_valid
+        genome_signature = genome_counts / genome_counts.sum()
+
+        bins = []
+        for i in xrange(len(frag_lens)):
+            if not frag_gc[i]:
+                bins.append((np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint16)))
+                continue
+
+            f_gc = np.concatenate(frag_gc[i])
+            f_counts = np.vstack(frag_counts[i]).astype(float)
+            total_kmers = f_counts.sum(axis=1)
+
+            sel = (total_kmers > 0) & np.isfinite(f_gc)
+            f_gc = f_gc[sel]
+            f_signature = f_counts[sel] / total_kmers[sel][:, np.newaxis]
+
+            delta_gc = f_gc - genome_gc
+            delta_td = paired_manhattan(f_signature, np.tile(genome_signature, (len(f_signature), 1)))
+
+            bins.append((self._bin_index(delta_gc, self.gc_range),
+                         self._bin_index(delta_td, self.td_range)))
+
+        return genome_gc, bins
+
+    def _worker(self, frag_lens, max_fragments, queue_in, queue_out):
+        """Process genomes in parallel.
+
+        Parameters
+        ----------
+        frag_lens : list of int
+            Lengths of fragments.
+        max_fragments : int
+            Maximum number of fragments to sample per fragment length and scaffold, or 0 for all.
+        queue_in : queue
+            Queue containing genome files.
+        queue_out : queue
+            Queue to hold binned fragment statistics.
+        """
+
+        while True:
+            genome_file = queue_in.get(block=True, timeout=None)
+            if genome_file == None:
+                break
+
+            try:
+                genome_gc, bins = self._process_genome(genome_file, frag_lens, max_fragments)
+            except:
+                self.logger.warning('  [Warning] Failed to process genome: %s' % genome_file)
+                self.logger.warning(traceback.format_exc())
+                genome_gc, bins = None, None
+
+            queue_out.put((genome_file, genome_gc, bins))
+
+    def _accumulate(self, hists, key, bins):
+        """Add binned values to a histogram spanning its occupied bins.
+
+        Parameters
+        ----------
+        hists : d[key] -> (first bin, ndarray)
+            Histograms to update.
+        key : object
+            Key of histogram to update.
+        bins : ndarray
+            Bin of each value.
+        """
+
+        if len(bins) == 0:
+            return
+
+        bins = bins.astype(np.int64)
+        lo = int(bins.min())
+        hi = int(bins.max()) + 1
+        counts = np.bincount(bins - lo, minlength=hi - lo)
+
+        if key not in hists:
+            hists[key] = (lo, counts)
+            return
+
+        first_bin, hist = hists[key]
+        end_bin = first_bin + len(hist)
+        if lo < first_bin or hi > end_bin:
+            grown = np.zeros(max(end_bin, hi) - min(first_bin, lo), dtype=np.int64)
+            offset = first_bin - min(first_bin, lo)
+            grown[offset:offset + len(hist)] = hist
+            first_bin, hist = min(first_bin, lo), grown
+            hists[key] = (first_bin, hist)
+
+        hist[lo - first_bin:hi - first_bin] += counts
+
+    def _percentiles(self, hist, value_range, first_bin=0):
+        """Interpolate percentiles from a histogram.
+
+        Parameters
+        ----------
+        hist : ndarray
+            Count of values in each bin.
+        value_range : (float, float)
+            Range of histogram.
+        first_bin : int
+            Bin corresponding to the first count in the histogram.
+
+        Returns
+        -------
+        ndarray
+            Value at each percentile.
+        """
+
+        lower, upper = value_range
+        width = (upper - lower) / self.num_bins
+
+        cdf = np.cumsum(hist)
+        total = cdf[-1]
+        last_bin = np.flatnonzero(hist)[-1]
+
+        target = self.percentiles / 100.0 * total
+        index = np.minimum(np.searchsorted(cdf, target, side='right'), last_bin)
+        frac = np.clip((target - (cdf[index] - hist[index])) / hist[index], 0.0, 1.0)
+
+        return lower + (first_bin + index + frac) * width
+
+    def run(self, genome_files, frag_lens, gc_bin_size, max_fragments, gc_dist_file, td_dist_file):
+        """Create GC and TD distributions.
+
+        Parameters
+        ----------
+        genome_files : list of str
+            Fasta files of reference genomes.
+        frag_lens : list of int
+            Lengths of fragments.
+        gc_bin_size : float
+            Size of bins used to group genomes by GC (e.g., 0.01).
+        max_fragments : int
+            Maximum number of fragments to sample per fragment length and scaffold, or 0 for all.
+        gc_dist_file : str
+            Output file for GC distribution.
+        td_dist_file : str
+            Output file for TD distribution.
+        """
+
+        frag_lens = sorted(set(frag_lens))
+
+        self.logger.info('  Fragmenting %d reference genomes:' % len(genome_files))
+
+        worker_queue = mp.Queue()
+        writer_queue = mp.Queue()
+
+        for genome_file in genome_files:
+            worker_queue.put(genome_file)
+
+        for _ in range(self.cpus):
+            worker_queue.put(None)
+
+        # histograms of change in GC for each genome GC bin
+        # and of TD across all genomes for each fragment length,
+        # with lengths without fragments having no histogram
+        gc_hist = {}
+        td_hist = {}
+
+        try:
+            worker_proc = [mp.Process(target=self._worker, args=(frag_lens, max_fragments, worker_queue, writer_queue)) for _ in range(self.cpus)]
+            for p in worker_proc:
+                p.start()
+
+            num_failed = 0
+            for processed_items in xrange(1, len(genome_files) + 1):
+                _genome_file, genome_gc, bins = writer_queue.get(block=True, timeout=None)
+
+                if genome_gc is None:
+                    num_failed += 1
+                else:
+                    gc_key = round(round(genome_gc / gc_bin_size) * gc_bin_size, 4)
+                    if gc_key not in gc_hist:
+                        gc_hist[gc_key] = {}
+
+                    for i, (gc_bins, td_bins) in enumerate(bins):
+                        self._accumulate(gc_hist[gc_key], i, gc_bins)
+                        self._accumulate(td_hist, i, td_bins)
+
+                statusStr = '    Finished processing %d of %d (%.2f%%) genomes.' % (processed_items, len(genome_files), float(processed_items) * 100 / len(genome_files))
+                sys.stdout.write('%s\r' % statusStr)
+                sys.stdout.flush()
+
+            sys.stdout.write('\n')
+
+            for p in worker_proc:
+                p.join()
+        except:
+            print traceback.format_exc()
+            for p in worker_proc:
+                p.terminate()
+            sys.exit()
+
+        if num_failed:
+            self.logger.warning('  [Warning] Failed to process %d genomes.' % num_failed)
+
+        if not gc_hist:
+            self.logger.error('  [Error] No fragments were generated from the reference genomes.')
+            sys.exit()
+
+        # lengths without any fragments can not be reported
+        frag_index = [i for i in xrange(len(frag_lens)) if i in td_hist]
+        for i in xrange(len(frag_lens)):
+            if i not in frag_index:
+                self.logger.warning('  [Warning] No reference genome contains fragments of length %d.' % frag_lens[i])
+
+        # GC bins without fragments of a given length use
+        # the distribution of the nearest GC bin with fragments
+        gc_keys = sorted(gc_hist)
+        gc_dist = {}
+        for gc_key in gc_keys:
+            gc_dist[gc_key] = {}
+            for i in frag_index:
+                with_frags = [k for k in gc_keys if i in gc_hist[k]]
+                nearest_key = min(with_frags, key=lambda k: (abs(k - gc_key), k))
+                first_bin, hist = gc_hist[nearest_key][i]
+                values = self._percentiles(hist, self.gc_range, first_bin)
+                gc_dist[gc_key][frag_lens[i]] = dict(zip([float(p) for p in self.percentiles],
+                                                         [float(v) for v in values]))
+
+        td_dist = {}
+        for i in frag_index:
+            first_bin, hist = td_hist[i]
+            values = self._percentiles(hist, self.td_range, first_bin)
+            td_dist[frag_lens[i]] = dict(zip([float(p) for p in self.percentiles],
+                                             [float(v) for v in values]))
+
+        with open(gc_dist_file, 'w') as fout:
+            fout.write(repr(gc_dist))
+
+        with open(td_dist_file, 'w') as fout:
+            fout.write(repr(td_dist))
+
+        self.logger.info('  Distributions created from %d genomes spanning %d GC bins.' % (len(genome_files) - num_failed, len(gc_keys)))
@@ -17,17 +17,21 @@
 
 import os
 import sys
-import ast
-import itertools
+import heapq
 import logging
-from collections import defaultdict
+import itertools
+from collections import namedtuple, defaultdict, Counter
 
-from scipy.stats import pearsonr
-from numpy import (mean as np_mean)
+import numpy as np
+from scipy.spatial import cKDTree
 
 import biolib.seq_io as seq_io
-from biolib.common import find_nearest, alphanumeric_sort, remove_extension
-from biolib.genomic_signature import GenomicSignature
+from biolib.common import alphanumeric_sort, remove_extension
+
+from refinem.scaffold_stats import ScaffoldStats
+from refinem.genome_stats import GenomeStats
+from refinem.distribution_table import read_distribution
+from refinem.kernels import paired_manhattan, paired_pearson, paired_percent_error
 
 
 class Outliers():
@@ -40,6 +44,41 @@ class Outliers():
 
         self.min_required_coverage = 0.01
 
+        self.gc_dist = None
+        self.td_dist = None
+
+        # maximum number of elements in matrices
+        # created when comparing scaffolds to genomes
+        self.max_chunk_elements = 2 ** 22
+
+        # number of principal components of tetranucleotide
+        # signatures used to index genomes
+        self.signature_components = 10
+
+        # number of bases buffered for a genome
+        # before scaffolds are written to disk
+        self.max_buffer_size = 2 ** 24
+
+        self.OutlierTests = namedtuple('OutlierTests', """scaffold_ids
+                                                        genome_ids
+                                                        length
+                                                        gc
+                                                        mean_gc
+                                                        gc_lower_bound
+                                                        gc_upper_bound
+                                                        delta_td
+                                                        mean_td
+                                                        td_bound
+                                                        mean_coverage
+                                                        mean_genome_coverage
+                                                        corr_r
+                                                        mean_cp
+                                                        gc_outlier
+                                                        td_outlier
+                                                        cov_corr_outlier
+                                                        cov_perc_outlier
+                                                        """)
+
     def remove_outliers(self, genome_file, outlier_file, out_genome):
         """Remove sequences specified as outliers.
 
@@ -92,23 +131,7 @@ class Outliers():
         cur_bin_id = remove_extension(genome_file)
 
         # determine scaffolds compatible with genome
-        scaffold_ids = []
-        bin_ids = {}
-        with open(compatible_file) as f:
-            f.readline()
-
-            for line in f:
-                line_split = line.split('\t')
-                scaffold_id = line_split[0]
-                bin_id = line_split[1].strip()
-
-                scaffold_ids.append(scaffold_id)
-                bin_ids[scaffold_id] = bin_id
-
-        compatible_scaffolds = set()
-        for scaffold_id, bin_id in bin_ids.iteritems():
-            if scaffold_ids.count(scaffold_id) == 1 and bin_id == cur_bin_id:
-                compatible_scaffolds.add(scaffold_id)
+        compatible_scaffolds = self._compatible_unique(compatible_file).get(cur_bin_id, set())
 
         # add compatible sequences to genome
         genome_seqs = seq_io.read(genome_file)
@@ -140,6 +163,93 @@ class Outliers():
 
         cur_bin_id = remove_extension(genome_file)
 
+        # determine scaffolds closest to genome
+        compatible_scaffolds = self._compatible_closest(compatible_file).get(cur_bin_id, set())
+
+        # add compatible sequences to genome
+        genome_seqs = seq_io.read(genome_file)
+        for seq_id, seq in seq_io.read_seq(scaffold_file):
+            if seq_id in compatible_scaffolds:
+                genome_seqs[seq_id] = seq
+
+        # save modified bin
+        seq_io.write_fasta(genome_seqs, out_genome)
+
+    def _read_outliers(self, outlier_file):
+        """Read outlying scaffolds of each genome.
+
+        Parameters
+        ----------
+        outlier_file : str
+            File specifying outlying scaffolds.
+
+        Returns
+        -------
+        dict : d[bin_id] -> set of scaffold ids
+            Outlying scaffolds of each genome.
+        """
+
+        outliers = defaultdict(set)
+        with open(outlier_file) as f:
+            f.readline()
+
+            for line in f:
+                line_split = line.split('\t')
+                scaffold_id = line_split[0]
+                bin_id = line_split[1].strip()
+
+                outliers[bin_id].add(scaffold_id)
+
+        return outliers
+
+    def _compatible_unique(self, compatible_file):
+        """Determine scaffolds compatible with a single genome.
+
+        Parameters
+        ----------
+        compatible_file : str
+            File specifying compatible scaffolds.
+
+        Returns
+        -------
+        dict : d[bin_id] -> set of scaffold ids
+            Scaffolds specified exactly once and the genome they are compatible with.
+        """
+
+        scaffold_count = Counter()
+        bin_ids = {}
+        with open(compatible_file) as f:
+            f.readline()
+
+            for line in f:
+                line_split = line.split('\t')
+                scaffold_id = line_split[0]
+                bin_id = line_split[1].strip()
+
+                scaffold_count[scaffold_id] += 1
+                bin_ids[scaffold_id] = bin_id
+
+        compatible_scaffolds = defaultdict(set)
+        for scaffold_id, bin_id in bin_ids.iteritems():
+            if scaffold_count[scaffold_id] == 1:
+                compatible_scaffolds[bin_id].add(scaffold_id)
+
+        return compatible_scaffolds
+
+    def _compatible_closest(self, compatible_file):
+        """Determine scaffolds closest to a single genome.
+
+        Parameters
+        ----------
+        compatible_file : str
+            File specifying compatible scaffolds.
+
+        Returns
+        -------
+        dict : d[bin_id] -> set of scaffold ids
+            Scaffolds closest to a genome in GC, tetranucleotide, and coverage space.
+        """
+
         # determine statistics for each potentially compatible scaffold
         scaffold_ids = defaultdict(dict)
         with open(compatible_file) as f:
@@ -169,7 +279,7 @@ class Outliers():
 
         # determine scaffolds that are closest to a single bin
         # in terms of GC, tetranucleotide distance, and coverage
-        compatible_scaffolds = set()
+        compatible_scaffolds = defaultdict(set)
         for scaffold_id, bin_stats in scaffold_ids.iteritems():
             best_gc = [1e9, None]
             best_td = [1e9, None]
@@ -184,22 +294,126 @@ class Outliers():
                     best_cov = [cov, bin_id]
 
             # check if scaffold is closest to a single bin
-            if (best_gc[1] == best_td[1] == best_cov[1]) and best_gc[1] == cur_bin_id:
-                compatible_scaffolds.add(scaffold_id)
+            if best_gc[1] == best_td[1] == best_cov[1]:
+                compatible_scaffolds[best_gc[1]].add(scaffold_id)
 
-        # add compatible sequences to genome
-        genome_seqs = seq_io.read(genome_file)
-        for seq_id, seq in seq_io.read_seq(scaffold_file):
-            if seq_id in compatible_scaffolds:
-                genome_seqs[seq_id] = seq
+        return compatible_scaffolds
 
-        # save modified bin
-        seq_io.write_fasta(genome_seqs, out_genome)
+    def modify_bins(self, scaffold_file, genome_files,
+                        outlier_file, compatible_file,
+                        unique_only, output_dir):
+        """Apply outlier and compatibility results to all genomes.
+
+        The outlier and compatible files are read once and
+        the scaffold file is streamed once. Scaffolds to
+        add are buffered per genome and appended to the
+        modified genomes so only a single output file is
+        open at a time.
+
+        Parameters
+        ----------
+        scaffold_file : str
+            Fasta file containing scaffolds to add.
+        genome_files : list of str
+            Fasta files of binned scaffolds.
+        outlier_file : str
+            File specifying outlying scaffolds, or None.
+        compatible_file : str
+            File specifying compatible scaffolds, or None.
+        unique_only : boolean
+            Only add scaffolds specified exactly once in the compatible file.
+        output_dir : str
+            Directory to write modified genomes.
+
+        Returns
+        -------
+        dict : d[bin_id] -> (removed scaffolds, added scaffolds)
+            Scaffolds removed from and added to each genome.
+        """
+
+        remove = {}
+        if outlier_file:
+            remove = self._read_outliers(outlier_file)
+
+        add = {}
+        if compatible_file:
+            if unique_only:
+                add = self._compatible_unique(compatible_file)
+            else:
+                add = self._compatible_closest(compatible_file)
+
+        # remove outliers while copying each genome
+        out_files = {}
+        changes = {}
+        add_to_bins = defaultdict(list)
+        for genome_file in genome_files:
+            bin_id = remove_extension(genome_file)
+            out_file = os.path.join(output_dir, os.path.basename(genome_file))
+            out_files[bin_id] = out_file
+
+            bin_remove = remove.get(bin_id, set())
+            bin_add = set(add.get(bin_id, set()))
+
+            removed = []
+            fout = open(out_file, 'w')
+            for seq_id, seq in seq_io.read_seq(genome_file):
+                if seq_id in bin_remove:
+                    removed.append(seq_id)
+                    continue
+
+                # scaffold is already in the genome
+                bin_add.discard(seq_id)
+                fout.write('>' + seq_id + '\n')
+                fout.write(seq + '\n')
+            fout.close()
+
+            for scaffold_id in bin_add:
+                add_to_bins[scaffold_id].append(bin_id)
+            changes[bin_id] = (removed, [])
+
+        # add compatible scaffolds to all genomes in a single pass
+        # over the scaffold file, flushing large buffers as required
+        buffers = defaultdict(list)
+        buffer_size = defaultdict(int)
+        if add_to_bins:
+            for seq_id, seq in seq_io.read_seq(scaffold_file):
+                bin_ids = add_to_bins.get(seq_id)
+                if not bin_ids:
+                    continue
+
+                for bin_id in bin_ids:
+                    buffers[bin_id].append('>' + seq_id + '\n' + seq + '\n')
+                    buffer_size[bin_id] += len(seq)
+                    changes[bin_id][1].append(seq_id)
+
+                    if buffer_size[bin_id] >= self.max_buffer_size:
+                        self._append_seqs(out_files[bin_id], buffers.pop(bin_id))
+                        buffer_size.pop(bin_id)
+
+        for bin_id, seqs in buffers.iteritems():
+            self._append_seqs(out_files[bin_id], seqs)
+
+        return changes
+
+    def _append_seqs(self, out_file, seqs):
+        """Append formatted sequences to file.
+
+        Parameters
+        ----------
+        out_file : str
+            Name of fasta file.
+        seqs : list of str
+            Sequences in fasta format.
+        """
+
+        with open(out_file, 'a') as fout:
+            fout.write(''.join(seqs))
 
     def identify(self, scaffold_stats, genome_stats,
                         gc_per, td_per,
                         cov_corr, cov_perc,
-                        report_type, output_file):
+                        report_type, output_file,
+                        min_len=0, genome_ids=None, report_file=None):
         """Identify scaffolds with divergent genomic characteristics.
 
         Outliers are identified independently based on GC content,
@@ -207,6 +421,11 @@ class Outliers():
         mean absolute percent error of coverage profile. The coverage correlation
         check is ignored if the coverage profile consists of a single value.
 
+        Outliers can be restricted to a subset of genomes, such as those
+        returned by GenomeStats.add_scaffolds() after a genome is modified,
+        in order to re-score only affected genomes. Rows for all other
+        genomes are copied unchanged from an existing outlier report.
+
         Parameters
         ----------
         scaffold_stats : ScaffoldStats
@@ -225,104 +444,517 @@ class Outliers():
             Report scaffolds that are outliers in 'all' or 'any' distribution.
         output_file : str
             Name of output file.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
+        genome_ids : iterable
+            Integer ids of genomes to process, or None to process all genomes.
+        report_file : str
+            Existing outlier report to update when genome ids are
+            specified, or None to update the output file if it exists.
         """
 
-        # read reference distributions from file
-        self.logger.info('  Reading reference distributions.')
-        self.gc_dist = self._read_distribution('gc_dist')
-        self.td_dist = self._read_distribution('td_dist')
+        tests = self.evaluate(scaffold_stats, genome_stats,
+                                gc_per, td_per,
+                                cov_corr, cov_perc,
+                                min_len, genome_ids)
+
+        if genome_ids is not None and report_file is None and os.path.exists(output_file):
+            report_file = output_file
+
+        # report outliers in each genome, retaining the rows of
+        # unprocessed genomes when updating an existing report
+        tmp_file = output_file + '.%d.tmp' % os.getpid()
+        fout = open(tmp_file, 'w')
+        self._write_header(fout, gc_per, td_per)
+        if genome_ids is not None and report_file:
+            processed_genomes = set([scaffold_stats.genome_name(genome_id) for genome_id in genome_ids])
+            with open(report_file) as f:
+                f.readline()
+                for line in f:
+                    if line.split('\t', 2)[1] not in processed_genomes:
+                        fout.write(line)
+        self._write_outliers(fout, scaffold_stats, tests, report_type)
+        fout.close()
+
+        os.rename(tmp_file, output_file)
+
+    def rescore(self, scaffold_stats, genome_stats, changes,
+                        gc_per, td_per,
+                        cov_corr, cov_perc,
+                        report_type, output_file,
+                        min_len=0, report_file=None):
+        """Re-score genomes modified by modify_bins().
+
+        Genome statistics are updated incrementally for the
+        scaffolds removed from and added to each genome and
+        outliers are only identified in the affected genomes.
+        Scaffolds or genomes without statistics are ignored.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_stats : GenomeStats
+            Statistics for individual genomes, updated in place.
+        changes : d[bin_id] -> (removed scaffolds, added scaffolds)
+            Scaffolds removed from and added to each genome.
+        gc_per : int.
+            Percentile for identifying GC outliers
+        td_per : int
+            Percentile for identifying TD outliers.
+        cov_corr : int
+            Correlation for identifying divergent coverage profiles.
+        cov_perc : int
+            Mean absolute percent error for identifying divergent coverage profiles.
+        report_type : str
+            Report scaffolds that are outliers in 'all' or 'any' distribution.
+        output_file : str
+            Name of output file.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
+        report_file : str
+            Existing outlier report with rows for unmodified genomes.
+
+        Returns
+        -------
+        set
+            Integer ids of re-scored genomes.
+        """
+
+        affected_genomes = set()
+        for bin_id, (removed, added) in changes.iteritems():
+            if bin_id not in scaffold_stats.genome_registry:
+                continue
+
+            genome_id = scaffold_stats.genome_index(bin_id)
+            removed_ids = [scaffold_stats.scaffold_index(seq_id) for seq_id in removed if seq_id in scaffold_stats.scaffold_registry]
+            added_ids = [scaffold_stats.scaffold_index(seq_id) for seq_id in added if seq_id in scaffold_stats.scaffold_registry]
+
+            affected_genomes.update(genome_stats.remove_scaffolds(scaffold_stats, genome_id, removed_ids))
+            affected_genomes.update(genome_stats.add_scaffolds(scaffold_stats, genome_id, added_ids))
+
+        self.identify(scaffold_stats, genome_stats.genome_stats,
+                        gc_per, td_per,
+                        cov_corr, cov_perc,
+                        report_type, output_file,
+                        min_len, affected_genomes, report_file)
+
+        return affected_genomes
+
+    def identify_streaming(self, stats_file,
+                                gc_per, td_per,
+                                cov_corr, cov_perc,
+                                report_type, output_file,
+                                min_len=0, max_scaffolds=1000000, tmp_dir=None):
+        """Identify outliers without reading all scaffold statistics.
+
+        Scaffold statistics are read in batches of complete genomes
+        (see ScaffoldStats.read_genome_batches) and genome statistics
+        are calculated for each batch, so peak memory is bounded by
+        the larger of max_scaffolds and the largest genome rather than
+        the size of the assembly. Outliers are identified exactly as
+        in identify().
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+        gc_per : int.
+            Percentile for identifying GC outliers
+        td_per : int
+            Percentile for identifying TD outliers.
+        cov_corr : int
+            Correlation for identifying divergent coverage profiles.
+        cov_perc : int
+            Mean absolute percent error for identifying divergent coverage profiles.
+        report_type : str
+            Report scaffolds that are outliers in 'all' or 'any' distribution.
+        output_file : str
+            Name of output file.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
+        max_scaffolds : int
+            Maximum number of scaffolds to process in a batch, unless a single genome is larger.
+        tmp_dir : str
+            Directory for temporary files.
+        """
 
-        # identify outliers in each genome
         fout = open(output_file, 'w')
+        self._write_header(fout, gc_per, td_per)
+
+        scaffold_stats = ScaffoldStats()
+        for batch_stats in scaffold_stats.read_genome_batches(stats_file, max_scaffolds, tmp_dir):
+            genome_stats = GenomeStats()
+            genome_stats = genome_stats.run(batch_stats)
+
+            tests = self.evaluate(batch_stats, genome_stats,
+                                    gc_per, td_per,
+                                    cov_corr, cov_perc,
+                                    min_len)
+            self._write_outliers(fout, batch_stats, tests, report_type)
+
+        fout.close()
+
+    def _write_header(self, fout, gc_per, td_per):
+        """Write header of outlier table.
+
+        Parameters
+        ----------
+        fout : file
+            Output file.
+        gc_per : int.
+            Percentile for identifying GC outliers
+        td_per : int
+            Percentile for identifying TD outliers.
+        """
+
         fout.write('Scaffold id\tGenome id\tScaffold length (bp)\tOutlying distributions')
         fout.write('\tScaffold GC\tMean genome GC\tLower GC bound (%s%%)\tUpper GC bound (%s%%)' % (gc_per, gc_per))
         fout.write('\tScaffold TD\tMean genome TD\tUpper TD bound (%s%%)' % td_per)
         fout.write('\tMean scaffold coverage\tMean genome coverage\tCoverage correlation\tMean coverage error\n')
 
-        genomic_signature = GenomicSignature(0)
+    def _write_outliers(self, fout, scaffold_stats, tests, report_type):
+        """Write outlying scaffolds to outlier table.
 
-        processed_genomes = 0
-        for genome_id, scaffold_ids in scaffold_stats.scaffolds_in_genome.iteritems():
-            processed_genomes += 1
+        Parameters
+        ----------
+        fout : file
+            Output file.
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        tests : namedtuple : OutlierTests
+            Test statistics, bounds, and outlier masks of each scaffold.
+        report_type : str
+            Report scaffolds that are outliers in 'all' or 'any' distribution.
+        """
 
-            sys.stdout.write('    Finding outliers in %d of %d (%.1f%%) genomes.\r' % (processed_genomes,
-                                                                                     scaffold_stats.num_genomes(),
-                                                                                     processed_genomes * 100.0 / scaffold_stats.num_genomes()))
-            sys.stdout.flush()
+        num_outlying = (tests.gc_outlier.astype(int) + tests.td_outlier
+                        + tests.cov_corr_outlier + tests.cov_perc_outlier)
+        if report_type == 'any':
+            reported = num_outlying >= 1
+        else:
+            reported = num_outlying >= 3
+
+        for i in np.flatnonzero(reported):
+            outlying_dists = [test for test, outlier in [('GC', tests.gc_outlier[i]),
+                                                          ('TD', tests.td_outlier[i]),
+                                                          ('COV_CORR', tests.cov_corr_outlier[i]),
+                                                          ('COV_PERC', tests.cov_perc_outlier[i])] if outlier]
+
+            fout.write('%s\t%s\t%s\t%s' % (scaffold_stats.scaffold_name(tests.scaffold_ids[i]),
+                                          scaffold_stats.genome_name(tests.genome_ids[i]),
+                                          tests.length[i],
+                                          ','.join(outlying_dists)))
+            fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (tests.gc[i],
+                                                   tests.mean_gc[i],
+                                                   tests.mean_gc[i] + tests.gc_lower_bound[i] * 100,
+                                                   tests.mean_gc[i] + tests.gc_upper_bound[i] * 100))
+            fout.write('\t%.3f\t%.3f\t%.3f' % (tests.delta_td[i], tests.mean_td[i], tests.td_bound[i]))
+            fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (tests.mean_coverage[i],
+                                                   tests.mean_genome_coverage[i],
+                                                   tests.corr_r[i],
+                                                   tests.mean_cp[i]))
+            fout.write('\n')
+
+    def sweep(self, scaffold_stats, genome_stats,
+                    gc_percs, td_percs,
+                    cov_corrs, cov_percs,
+                    report_type, summary_file, scaffold_file,
+                    min_len=0):
+        """Identify outliers across combinations of thresholds.
+
+        Test statistics are calculated once and then compared to
+        each combination of thresholds. A summary table gives the
+        number of outlying scaffolds and bases for each combination
+        and a second table lists the combinations under which each
+        scaffold is identified as an outlier.
 
-            # find keys into GC and TD distributions
-            # gc -> [mean GC][scaffold length][percentile]
-            # td -> [scaffold length][percentile]
-            gs = genome_stats[genome_id]
-            closest_gc = find_nearest(self.gc_dist.keys(), gs.mean_gc / 100.0)
-            sample_seq_len = self.gc_dist[closest_gc].keys()[0]
-            d = self.gc_dist[closest_gc][sample_seq_len]
-            gc_lower_bound_key = find_nearest(d.keys(), (100 - gc_per) / 2.0)
-            gc_upper_bound_key = find_nearest(d.keys(), (100 + gc_per) / 2.0)
-
-            td_bound_key = find_nearest(self.td_dist[self.td_dist.keys()[0]].keys(), td_per)
-
-            for scaffold_id in scaffold_ids:
-                stats = scaffold_stats.stats[scaffold_id]
-
-                # find GC and TD bounds
-                closest_seq_len = find_nearest(self.gc_dist[closest_gc].keys(), stats.length)
-                gc_lower_bound = self.gc_dist[closest_gc][closest_seq_len][gc_lower_bound_key]
-                gc_upper_bound = self.gc_dist[closest_gc][closest_seq_len][gc_upper_bound_key]
-
-                closest_seq_len = find_nearest(self.td_dist.keys(), stats.length)
-                td_bound = self.td_dist[closest_seq_len][td_bound_key]
-
-                # find changes from mean
-                delta_gc = (stats.gc - gs.mean_gc) / 100.0
-                delta_td = genomic_signature.manhattan(stats.signature, gs.mean_signature)
-
-                # determine if scaffold is an outlier
-                outlying_dists = []
-                if delta_gc < gc_lower_bound or delta_gc > gc_upper_bound:
-                    outlying_dists.append('GC')
-
-                if delta_td > td_bound:
-                    outlying_dists.append('TD')
-
-                corr_r = 1.0
-                if len(gs.mean_coverage) > 1:
-                    corr_r, _corr_p = pearsonr(gs.mean_coverage, stats.coverage)
-                    if  corr_r < cov_corr:
-                        outlying_dists.append('COV_CORR')
-
-                mean_cp = []
-                for cov_genome, cov_scaffold in itertools.izip(gs.mean_coverage, stats.coverage):
-                    if cov_genome >= self.min_required_coverage:
-                        mean_cp.append(abs(cov_scaffold - cov_genome) * 100.0 / cov_genome)
-
-                if len(mean_cp) == 0:
-                    # genome has zero coverage which is general
-                    # will indicate something is wrong
-                    mean_cp = -1
-                    outlying_dists.append('COV_PERC')
-                else:
-                    mean_cp = np_mean(mean_cp)
-                    if mean_cp > cov_perc:
-                        outlying_dists.append('COV_PERC')
-
-                # report outliers
-                if (report_type == 'any' and len(outlying_dists) >= 1) or (report_type == 'all' and len(outlying_dists) >= 3):
-                    fout.write('%s\t%s\t%s\t%s' % (scaffold_id, genome_id, stats.length, ','.join(outlying_dists)))
-                    fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (stats.gc, gs.mean_gc, gs.mean_gc + gc_lower_bound * 100, gs.mean_gc + gc_upper_bound * 100))
-                    fout.write('\t%.3f\t%.3f\t%.3f' % (delta_td, gs.mean_td, td_bound))
-                    fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (np_mean(stats.coverage), np_mean(gs.mean_coverage), corr_r, mean_cp))
-                    fout.write('\n')
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_stats : GenomeStats
+            Statistics for individual genomes.
+        gc_percs : iterable
+            Percentiles for identifying GC outliers
+        td_percs : iterable
+            Percentiles for identifying TD outliers.
+        cov_corrs : iterable
+            Correlations for identifying divergent coverage profiles.
+        cov_percs : iterable
+            Mean absolute percent errors for identifying divergent coverage profiles.
+        report_type : str
+            Report scaffolds that are outliers in 'all' or 'any' distribution.
+        summary_file : str
+            Name of output file summarizing outliers for each combination of thresholds.
+        scaffold_file : str
+            Name of output file indicating combinations under which scaffolds are outliers.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
+        """
+
+        tests = self.evaluate(scaffold_stats, genome_stats,
+                                gc_percs[0], td_percs[0],
+                                cov_corrs[0], cov_percs[0],
+                                min_len)
+
+        # determine outliers for each individual threshold
+        delta_gc = (tests.gc - tests.mean_gc) / 100.0
+        gc_outliers = []
+        for gc_per in gc_percs:
+            gc_lower_bound, gc_upper_bound = self._gc_bounds(tests.mean_gc, tests.length, gc_per)
+            gc_outliers.append((delta_gc < gc_lower_bound) | (delta_gc > gc_upper_bound))
+
+        td_outliers = [tests.delta_td > self._td_bounds(tests.length, td_per) for td_per in td_percs]
+
+        if scaffold_stats.coverage_profile_length() > 1:
+            cov_corr_outliers = [self._cov_corr_outliers(tests.corr_r, cov_corr) for cov_corr in cov_corrs]
+        else:
+            cov_corr_outliers = [np.zeros(len(tests.scaffold_ids), dtype=bool) for _ in cov_corrs]
+
+        # genomes without sufficient coverage have an error of -1
+        no_coverage = tests.mean_cp < 0
+        cov_perc_outliers = [no_coverage | (tests.mean_cp > cov_perc) for cov_perc in cov_percs]
+
+        # determine outliers for each combination of thresholds
+        min_outlying = 1 if report_type == 'any' else 3
+
+        fout = open(summary_file, 'w')
+        fout.write('Combination\tGC percentile\tTD percentile\tCoverage correlation\tMean coverage error')
+        fout.write('\tOutlying scaffolds\tOutlying bases (bp)\n')
+
+        scaffold_combinations = defaultdict(list)
+        combinations = itertools.product(enumerate(gc_percs), enumerate(td_percs),
+                                         enumerate(cov_corrs), enumerate(cov_percs))
+        for combination, ((gi, gc_per), (ti, td_per), (ri, cov_corr), (pi, cov_perc)) in enumerate(combinations):
+            num_outlying = (gc_outliers[gi].astype(int) + td_outliers[ti]
+                            + cov_corr_outliers[ri] + cov_perc_outliers[pi])
+            reported = np.flatnonzero(num_outlying >= min_outlying)
+
+            fout.write('%d\t%s\t%s\t%s\t%s' % (combination + 1, gc_per, td_per, cov_corr, cov_perc))
+            fout.write('\t%d\t%d\n' % (len(reported), tests.length[reported].sum()))
+
+            for i in reported:
+                scaffold_combinations[i].append(combination + 1)
 
-        sys.stdout.write('\n')
         fout.close()
 
+        fout = open(scaffold_file, 'w')
+        fout.write('Scaffold id\tGenome id\tScaffold length (bp)\tOutlying combinations\n')
+        for i in sorted(scaffold_combinations):
+            fout.write('%s\t%s\t%s\t%s\n' % (scaffold_stats.scaffold_name(tests.scaffold_ids[i]),
+                                             scaffold_stats.genome_name(tests.genome_ids[i]),
+                                             tests.length[i],
+                                             ','.join(map(str, scaffold_combinations[i]))))
+        fout.close()
+
+    def evaluate(self, scaffold_stats, genome_stats,
+                        gc_per, td_per,
+                        cov_corr, cov_perc,
+                        min_len=0, genome_ids=None):
+        """Evaluate outlier tests for all scaffolds at once.
+
+        Each scaffold is compared against the mean statistics of
+        the genome it is assigned to. Rows are ordered by genome and
+        then by scaffold as given by ScaffoldStats.scaffolds_in_genome.
+
+        Parameters
+        ----------
+        scaffold_stats : ScaffoldStats
+            Statistics for individual scaffolds.
+        genome_stats : GenomeStats
+            Statistics for individual genomes.
+        gc_per : int.
+            Percentile for identifying GC outliers
+        td_per : int
+            Percentile for identifying TD outliers.
+        cov_corr : int
+            Correlation for identifying divergent coverage profiles.
+        cov_perc : int
+            Mean absolute percent error for identifying divergent coverage profiles.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
+        genome_ids : iterable
+            Integer ids of genomes to process, or None to process all genomes.
+
+        Returns
+        -------
+        namedtuple : OutlierTests
+            Test statistics, bounds, and outlier masks of each scaffold.
+        """
+
+        # read reference distributions from file
+        if self.gc_dist is None or self.td_dist is None:
+            self.logger.info('  Reading reference distributions.')
+            self.gc_dist = read_distribution('gc_dist')
+            self.td_dist = read_distribution('td_dist')
+
+        if genome_ids is None:
+            genomes_to_process = scaffold_stats.scaffolds_in_genome.keys()
+        else:
+            genome_ids = set(genome_ids)
+            genomes_to_process = [genome_id for genome_id in scaffold_stats.scaffolds_in_genome if genome_id in genome_ids]
+
+        self.logger.info('  Finding outliers in %d genomes.' % len(genomes_to_process))
+
+        # determine row of each scaffold and its genome
+        scaffold_ids = []
+        genome_rows = []
+        for genome_row, genome_id in enumerate(genomes_to_process):
+            genome_scaffold_ids = scaffold_stats.scaffolds_in_genome[genome_id]
+            scaffold_ids.extend(genome_scaffold_ids)
+            genome_rows.extend([genome_row] * len(genome_scaffold_ids))
+
+        scaffold_ids = np.array(scaffold_ids, dtype=int)
+        genome_rows = np.array(genome_rows, dtype=int)
+
+        all_scaffold_ids, _genome_ids, gc, length, coverage, signature = scaffold_stats.matrices()
+        rows = np.searchsorted(all_scaffold_ids, scaffold_ids)
+
+        keep = length[rows] >= min_len
+        scaffold_ids = scaffold_ids[keep]
+        genome_rows = genome_rows[keep]
+        rows = rows[keep]
+
+        gc = gc[rows]
+        length = length[rows]
+        coverage = coverage[rows]
+        signature = signature[rows]
+
+        # statistics of the genome each scaffold is assigned to
+        genomes = [genome_stats[genome_id] for genome_id in genomes_to_process]
+        num_coverage = scaffold_stats.coverage_profile_length()
+        mean_gc = np.array([gs.mean_gc for gs in genomes], dtype=float)[genome_rows]
+        mean_td = np.array([gs.mean_td for gs in genomes], dtype=float)[genome_rows]
+        genome_coverage = np.array([gs.mean_coverage for gs in genomes], dtype=float).reshape(len(genomes), num_coverage)[genome_rows]
+        genome_signature = np.array([gs.mean_signature for gs in genomes], dtype=float).reshape(len(genomes), scaffold_stats.signature_length())[genome_rows]
+
+        # find GC and TD bounds
+        gc_lower_bound, gc_upper_bound = self._gc_bounds(mean_gc, length, gc_per)
+        td_bound = self._td_bounds(length, td_per)
+
+        # find changes from mean
+        delta_gc = (gc - mean_gc) / 100.0
+        delta_td = paired_manhattan(signature, genome_signature)
+
+        corr_r = np.ones(len(rows))
+        if num_coverage > 1:
+            corr_r = paired_pearson(genome_coverage, coverage)
+
+        mean_cp = paired_percent_error(genome_coverage, coverage, self.min_required_coverage)
+
+        # determine if scaffolds are outliers
+        gc_outlier = (delta_gc < gc_lower_bound) | (delta_gc > gc_upper_bound)
+        td_outlier = delta_td > td_bound
+
+        cov_corr_outlier = np.zeros(len(rows), dtype=bool)
+        if num_coverage > 1:
+            cov_corr_outlier = self._cov_corr_outliers(corr_r, cov_corr)
+
+        # genomes with zero coverage will generally
+        # indicate something is wrong
+        no_coverage = np.isnan(mean_cp)
+        mean_cp[no_coverage] = -1
+        cov_perc_outlier = no_coverage | (mean_cp > cov_perc)
+
+        with np.errstate(invalid='ignore'):
+            mean_coverage = coverage.mean(axis=1)
+            mean_genome_coverage = genome_coverage.mean(axis=1)
+
+        return self.OutlierTests(scaffold_ids,
+                                    np.array(genomes_to_process, dtype=int)[genome_rows],
+                                    length,
+                                    gc,
+                                    mean_gc,
+                                    gc_lower_bound,
+                                    gc_upper_bound,
+                                    delta_td,
+                                    mean_td,
+                                    td_bound,
+                                    mean_coverage,
+                                    mean_genome_coverage,
+                                    corr_r,
+                                    mean_cp,
+                                    gc_outlier,
+                                    td_outlier,
+                                    cov_corr_outlier,
+                                    cov_perc_outlier)
+
+    def _gc_bounds(self, mean_gc, length, gc_per):
+        """Lower and upper bounds on change in GC.
+
+        Parameters
+        ----------
+        mean_gc : ndarray
+            Mean GC of genome for each scaffold.
+        length : ndarray
+            Length of each scaffold.
+        gc_per : int
+            Percentile for identifying GC outliers.
+
+        Returns
+        -------
+        ndarray
+            Lower bound on change in GC for each scaffold.
+        ndarray
+            Upper bound on change in GC for each scaffold.
+        """
+
+        gc_lower_bound = self.gc_dist.lookup(length, (100 - gc_per) / 2.0, mean_gc / 100.0)
+        gc_upper_bound = self.gc_dist.lookup(length, (100 + gc_per) / 2.0, mean_gc / 100.0)
+
+        return gc_lower_bound, gc_upper_bound
+
+    def _td_bounds(self, length, td_per):
+        """Upper bound on TD.
+
+        Parameters
+        ----------
+        length : ndarray
+            Length of each scaffold.
+        td_per : int
+            Percentile for identifying TD outliers.
+
+        Returns
+        -------
+        ndarray
+            Upper bound on TD for each scaffold.
+        """
+
+        return self.td_dist.lookup(length, td_per)
+
+    def _cov_corr_outliers(self, corr_r, cov_corr):
+        """Scaffolds with divergent coverage profiles.
+
+        Scaffolds with an undefined correlation (e.g., constant
+        coverage) are not considered outliers.
+
+        Parameters
+        ----------
+        corr_r : ndarray
+            Correlation between each scaffold and its genome.
+        cov_corr : float
+            Correlation for identifying divergent coverage profiles.
+
+        Returns
+        -------
+        ndarray
+            Boolean array indicating outlying scaffolds.
+        """
+
+        outlier = np.zeros(len(corr_r), dtype=bool)
+        defined = ~np.isnan(corr_r)
+        outlier[defined] = corr_r[defined] < cov_corr
+
+        return outlier
+
     def compatible(self, scaffolds_of_interest,
                         scaffold_stats,
                         genome_stats,
                         gc_per, td_per,
                         cov_corr, cov_perc,
-                        report_type, output_file):
+                        report_type, output_file,
+                        top_k=0):
         """Identify scaffolds with compatible genomic characteristics.
 
         Compatible scaffolds are identified based on GC content,
@@ -330,6 +962,18 @@ class Outliers():
         mean absolute percent error of coverage profile. The coverage correlation
         check is ignored if the coverage profile consists of a single value.
 
+        When reporting scaffolds compatible with 'all' distributions, a
+        scaffold can only be compatible with genomes that are within the
+        widest possible GC bound of the scaffold or within its TD bound. These
+        genomes are found using a sorted list of mean genome GC values and
+        a KD-tree over the leading principal components of the mean genome
+        signatures, and only these genomes are evaluated.
+
+        If top_k is specified, only the k compatible genomes closest to
+        each scaffold are reported. Genomes are ranked by the mean of the
+        change in GC, TD, and coverage error relative to their bounds, and
+        the rank and score of each genome are reported.
+
         Parameters
         ----------
         scaffolds_of_interest : d[scaffold_id] -> [no. genes, perc. genes with homology]
@@ -350,13 +994,16 @@ class Outliers():
             Report scaffolds that are outliers in 'all' or 'any' distribution.
         output_file : str
             Name of output file.
+        top_k : int
+            Number of closest compatible genomes to report for each scaffold (0 = all).
         """
 
         # read reference distributions from file
         self.logger.info('')
-        self.logger.info('  Reading reference distributions.')
-        self.gc_dist = self._read_distribution('gc_dist')
-        self.td_dist = self._read_distribution('td_dist')
+        if self.gc_dist is None or self.td_dist is None:
+            self.logger.info('  Reading reference distributions.')
+            self.gc_dist = read_distribution('gc_dist')
+            self.td_dist = read_distribution('td_dist')
 
         # identify compatible scaffolds in each genome
         fout = open(output_file, 'w')
@@ -364,81 +1011,304 @@ class Outliers():
         fout.write('\tScaffold GC\tMean genome GC\tLower GC bound (%s%%)\tUpper GC bound (%s%%)' % (gc_per, gc_per))
         fout.write('\tScaffold TD\tMean genome TD\tUpper TD bound (%s%%)' % td_per)
         fout.write('\tMean scaffold coverage\tMean genome coverage\tCoverage correlation\tMean coverage error')
-        fout.write('\t# genes\t% genes with homology\n')
-
-        genomic_signature = GenomicSignature(0)
-
-        self.logger.info('  Identifying scaffolds compatible with bins.')
-        processed_scaffolds = 0
-        for scaffold_id, ss in scaffold_stats.stats.iteritems():
-            processed_scaffolds += 1
-            sys.stdout.write('    Processed %d of %d (%.1f%%) scaffolds.\r' % (processed_scaffolds,
-                                                                         len(scaffold_stats.stats),
-                                                                         processed_scaffolds * 100.0 / len(scaffold_stats.stats)))
+        fout.write('\t# genes\t% genes with homology')
+        if top_k > 0:
+            fout.write('\tRank\tScore')
+        fout.write('\n')
+
+        # determine scaffolds to consider for compatibility
+        candidate_ids = []
+        for scaffold_name in scaffolds_of_interest:
+            if scaffold_name in scaffold_stats.scaffold_registry:
+                scaffold_id = scaffold_stats.scaffold_index(scaffold_name)
+                if scaffold_id in scaffold_stats.stats:
+                    candidate_ids.append(scaffold_id)
+        candidate_ids = np.array(sorted(candidate_ids), dtype=int)
+
+        all_scaffold_ids, _genome_ids, gc, length, coverage, signature = scaffold_stats.matrices()
+        rows = np.searchsorted(all_scaffold_ids, candidate_ids)
+
+        # calculate per-genome statistics and GC bounds at
+        # each reference scaffold length once
+        genome_ids = genome_stats.keys()
+        genomes = [genome_stats[genome_id] for genome_id in genome_ids]
+        num_genomes = len(genomes)
+        num_coverage = scaffold_stats.coverage_profile_length()
+
+        mean_gc = np.array([gs.mean_gc for gs in genomes], dtype=float)
+        mean_td = np.array([gs.mean_td for gs in genomes], dtype=float)
+        genome_coverage = np.array([gs.mean_coverage for gs in genomes], dtype=float).reshape(num_genomes, num_coverage)
+        genome_signature = np.array([gs.mean_signature for gs in genomes], dtype=float).reshape(num_genomes, scaffold_stats.signature_length())
+
+        with np.errstate(invalid='ignore'):
+            mean_genome_coverage = genome_coverage.mean(axis=1)
+
+        ref_lengths = self.gc_dist.lengths[np.newaxis, :]
+        genome_gc_lower_bound = self.gc_dist.lookup(ref_lengths, (100 - gc_per) / 2.0, mean_gc[:, np.newaxis] / 100.0)
+        genome_gc_upper_bound = self.gc_dist.lookup(ref_lengths, (100 + gc_per) / 2.0, mean_gc[:, np.newaxis] / 100.0)
+
+        # index genomes by GC and signature in order to prune genomes
+        # which can not be compatible with a scaffold
+        prune = (report_type == 'all' and num_genomes > 0)
+        if prune:
+            genome_index = self._genome_index(mean_gc, genome_signature)
+
+            widest_gc_lower_bound = genome_gc_lower_bound.min(axis=0)
+            widest_gc_upper_bound = genome_gc_upper_bound.max(axis=0)
+
+            # with a coverage correlation test a scaffold must pass either
+            # the GC or TD test, otherwise it must pass both
+            require_gc_and_td = (num_coverage <= 1)
+
+        # compare scaffolds to genomes in chunks of
+        # scaffolds in order to bound memory requirements
+        chunk_size = max(1, self.max_chunk_elements // max(1, num_genomes * signature.shape[1]))
+
+        self.logger.info('  Identifying compatibility of %d scaffolds with %d bins.' % (len(rows), num_genomes))
+        for chunk_start in xrange(0, len(rows), chunk_size):
+            chunk_rows = rows[chunk_start:chunk_start + chunk_size]
+            num_rows = len(chunk_rows)
+
+            sys.stdout.write('    Processed %d of %d (%.1f%%) scaffolds.\r' % (chunk_start + num_rows,
+                                                                         len(rows),
+                                                                         (chunk_start + num_rows) * 100.0 / len(rows)))
             sys.stdout.flush()
 
-            if scaffold_id not in scaffolds_of_interest:
-                continue
-
-            for genome_id, gs in genome_stats.iteritems():
-                # find keys into GC and TD distributions
-                # gc -> [mean GC][scaffold length][percentile]
-                # td -> [scaffold length][percentile]
-                closest_gc = find_nearest(self.gc_dist.keys(), gs.mean_gc / 100.0)
-                sample_seq_len = self.gc_dist[closest_gc].keys()[0]
-                d = self.gc_dist[closest_gc][sample_seq_len]
-                gc_lower_bound_key = find_nearest(d.keys(), (100 - gc_per) / 2.0)
-                gc_upper_bound_key = find_nearest(d.keys(), (100 + gc_per) / 2.0)
-
-                td_bound_key = find_nearest(self.td_dist[self.td_dist.keys()[0]].keys(), td_per)
-
-                # find GC and TD bounds
-                closest_seq_len = find_nearest(self.gc_dist[closest_gc].keys(), ss.length)
-                gc_lower_bound = self.gc_dist[closest_gc][closest_seq_len][gc_lower_bound_key]
-                gc_upper_bound = self.gc_dist[closest_gc][closest_seq_len][gc_upper_bound_key]
-
-                closest_seq_len = find_nearest(self.td_dist.keys(), ss.length)
-                td_bound = self.td_dist[closest_seq_len][td_bound_key]
-
-                # find changes from mean
-                delta_gc = (ss.gc - gs.mean_gc) / 100.0
-                delta_td = genomic_signature.manhattan(ss.signature, gs.mean_signature)
-
-                # determine if scaffold compatible
-                compatible_dists = []
-                if delta_gc >= gc_lower_bound and delta_gc <= gc_upper_bound:
-                    compatible_dists.append('GC')
-
-                if delta_td <= td_bound:
-                    compatible_dists.append('TD')
-
-                corr_r = 1.0
-                if len(gs.mean_coverage) > 1:
-                    corr_r, _corr_p = pearsonr(gs.mean_coverage, ss.coverage)
-                    if  corr_r >= cov_corr:
-                        compatible_dists.append('COV_CORR')
-
-                mean_cp = []
-                for cov_genome, cov_scaffold in itertools.izip(gs.mean_coverage, ss.coverage):
-                    if cov_genome >= self.min_required_coverage:
-                        mean_cp.append(abs(cov_genome - cov_scaffold) * 100.0 / cov_genome)
-
-                mean_cp = np_mean(mean_cp)
-                if mean_cp <= cov_perc:
-                    compatible_dists.append('COV_PERC')
-
-                # report compatible scaffolds
-                if (report_type == 'any' and len(compatible_dists) >= 1) or (report_type == 'all' and len(compatible_dists) >= 3):
-                    fout.write('%s\t%s\t%s\t%s' % (scaffold_id, genome_id, ss.length, ','.join(compatible_dists)))
-                    fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (ss.gc, gs.mean_gc, gs.mean_gc + gc_lower_bound * 100, gs.mean_gc + gc_upper_bound * 100))
-                    fout.write('\t%.3f\t%.3f\t%.3f' % (delta_td, gs.mean_td, td_bound))
-                    fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (np_mean(ss.coverage), np_mean(gs.mean_coverage), corr_r, mean_cp))
-                    fout.write('\t%d\t%.1f' % (scaffolds_of_interest[scaffold_id][0], scaffolds_of_interest[scaffold_id][1]))
-                    fout.write('\n')
+            chunk_length = length[chunk_rows]
+            chunk_gc = gc[chunk_rows]
+            length_index = self.gc_dist.nearest(self.gc_dist.lengths, chunk_length)
+            chunk_td_bound = self.td_dist.lookup(chunk_length, td_per)
+
+            # determine scaffold and genome pairs to evaluate,
+            # ordered by scaffold and then genome
+            if prune:
+                pair_scaffold, pair_genome = self._candidate_pairs(genome_index,
+                                                                    chunk_gc,
+                                                                    signature[chunk_rows],
+                                                                    widest_gc_lower_bound[length_index],
+                                                                    widest_gc_upper_bound[length_index],
+                                                                    chunk_td_bound,
+                                                                    require_gc_and_td)
+            else:
+                pair_scaffold, pair_genome = np.divmod(np.arange(num_rows * num_genomes), num_genomes)
+
+            pair_rows = chunk_rows[pair_scaffold]
+
+            # find GC and TD bounds
+            gc_lower_bound = genome_gc_lower_bound[pair_genome, length_index[pair_scaffold]]
+            gc_upper_bound = genome_gc_upper_bound[pair_genome, length_index[pair_scaffold]]
+            td_bound = chunk_td_bound[pair_scaffold]
+
+            # find changes from mean
+            delta_gc = (gc[pair_rows] - mean_gc[pair_genome]) / 100.0
+            delta_td = paired_manhattan(signature[pair_rows], genome_signature[pair_genome])
+
+            pair_genome_coverage = genome_coverage[pair_genome]
+            pair_coverage = coverage[pair_rows]
+
+            corr_r = np.ones(len(pair_rows))
+            if num_coverage > 1:
+                corr_r = paired_pearson(pair_genome_coverage, pair_coverage)
+
+            mean_cp = paired_percent_error(pair_genome_coverage, pair_coverage, self.min_required_coverage)
+
+            # determine if scaffolds are compatible
+            with np.errstate(invalid='ignore'):
+                gc_compatible = (delta_gc >= gc_lower_bound) & (delta_gc <= gc_upper_bound)
+                td_compatible = delta_td <= td_bound
+
+                cov_corr_compatible = np.zeros(len(pair_rows), dtype=bool)
+                if num_coverage > 1:
+                    cov_corr_compatible = corr_r >= cov_corr
+
+                cov_perc_compatible = mean_cp <= cov_perc
+
+                mean_coverage = pair_coverage.mean(axis=1)
+
+            num_compatible = (gc_compatible.astype(int) + td_compatible
+                              + cov_corr_compatible + cov_perc_compatible)
+            if report_type == 'any':
+                reported = num_compatible >= 1
+            else:
+                reported = num_compatible >= 3
+
+            # keep the k closest genomes to each scaffold, noting
+            # that pairs are ordered by scaffold
+            reported = np.flatnonzero(reported)
+            ranks = {}
+            if top_k > 0:
+                score = self._compatibility_score(delta_gc, gc_lower_bound, gc_upper_bound,
+                                                    delta_td, td_bound,
+                                                    mean_cp, cov_perc)
+
+                closest = []
+                for _, pairs in itertools.groupby(reported, key=lambda k: pair_scaffold[k]):
+                    best = heapq.nsmallest(top_k, pairs, key=lambda k: (score[k], pair_genome[k]))
+                    for rank, k in enumerate(best):
+                        ranks[k] = rank + 1
+                    closest.extend(best)
+                reported = closest
+
+            # report compatible scaffolds
+            for k in reported:
+                compatible_dists = [test for test, compatible in [('GC', gc_compatible[k]),
+                                                                  ('TD', td_compatible[k]),
+                                                                  ('COV_CORR', cov_corr_compatible[k]),
+                                                                  ('COV_PERC', cov_perc_compatible[k])] if compatible]
+
+                j = pair_genome[k]
+                scaffold_name = scaffold_stats.scaffold_name(candidate_ids[chunk_start + pair_scaffold[k]])
+                fout.write('%s\t%s\t%s\t%s' % (scaffold_name,
+                                              scaffold_stats.genome_name(genome_ids[j]),
+                                              length[pair_rows[k]],
+                                              ','.join(compatible_dists)))
+                fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (gc[pair_rows[k]],
+                                                       mean_gc[j],
+                                                       mean_gc[j] + gc_lower_bound[k] * 100,
+                                                       mean_gc[j] + gc_upper_bound[k] * 100))
+                fout.write('\t%.3f\t%.3f\t%.3f' % (delta_td[k], mean_td[j], td_bound[k]))
+                fout.write('\t%.2f\t%.2f\t%.2f\t%.2f' % (mean_coverage[k], mean_genome_coverage[j], corr_r[k], mean_cp[k]))
+                fout.write('\t%d\t%.1f' % (scaffolds_of_interest[scaffold_name][0], scaffolds_of_interest[scaffold_name][1]))
+                if top_k > 0:
+                    fout.write('\t%d\t%.3f' % (ranks[k], score[k]))
+                fout.write('\n')
 
         sys.stdout.write('\n')
         fout.close()
 
+    def _compatibility_score(self, delta_gc, gc_lower_bound, gc_upper_bound,
+                                    delta_td, td_bound,
+                                    mean_cp, cov_perc):
+        """Distance of scaffolds from genomes relative to test bounds.
+
+        Parameters
+        ----------
+        delta_gc : ndarray
+            Change in GC of each scaffold relative to genome.
+        gc_lower_bound : ndarray
+            Lower bound on change in GC.
+        gc_upper_bound : ndarray
+            Upper bound on change in GC.
+        delta_td : ndarray
+            TD of each scaffold relative to genome.
+        td_bound : ndarray
+            Upper bound on TD.
+        mean_cp : ndarray
+            Mean absolute percent error of coverage.
+        cov_perc : int
+            Mean absolute percent error for identifying divergent coverage profiles.
+
+        Returns
+        -------
+        ndarray
+            Mean fraction of each bound covered by the scaffold, with smaller
+            values indicating closer genomes.
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gc_score = np.abs(np.where(delta_gc >= 0, delta_gc / gc_upper_bound, delta_gc / gc_lower_bound))
+            td_score = delta_td / td_bound
+            cov_score = mean_cp / float(cov_perc)
+
+            score = (gc_score + td_score + cov_score) / 3.0
+
+        score[np.isnan(score)] = np.inf
+        return score
+
+    def _genome_index(self, mean_gc, genome_signature):
+        """Index genomes by mean GC and mean tetranucleotide signature.
+
+        Parameters
+        ----------
+        mean_gc : ndarray
+            Mean GC of each genome.
+        genome_signature : ndarray
+            Mean tetranucleotide signature of each genome.
+
+        Returns
+        -------
+        dict
+            Genome indices sorted by GC (gc_order), sorted GC values (sorted_gc),
+            signature centre (centre), orthonormal projection (projection),
+            and KD-tree over projected signatures (tree).
+        """
+
+        gc_order = np.argsort(mean_gc, kind='mergesort')
+
+        # project signatures onto leading principal components; as the
+        # projection is orthonormal, the Euclidean distance between projected
+        # signatures is at most the Manhattan distance between signatures
+        centre = genome_signature.mean(axis=0)
+        _u, _s, vt = np.linalg.svd(genome_signature - centre, full_matrices=False)
+        projection = vt[0:self.signature_components].T
+
+        return {'gc_order': gc_order,
+                'sorted_gc': mean_gc[gc_order],
+                'centre': centre,
+                'projection': projection,
+                'tree': cKDTree(np.dot(genome_signature - centre, projection))}
+
+    def _candidate_pairs(self, genome_index,
+                                gc, signature,
+                                gc_lower_bound, gc_upper_bound,
+                                td_bound, require_gc_and_td):
+        """Find genomes a scaffold may be compatible with.
+
+        Parameters
+        ----------
+        genome_index : dict
+            Index of genomes created by _genome_index().
+        gc : ndarray
+            GC of each scaffold.
+        signature : ndarray
+            Tetranucleotide signature of each scaffold.
+        gc_lower_bound : ndarray
+            Smallest lower bound on change in GC across genomes for each scaffold.
+        gc_upper_bound : ndarray
+            Largest upper bound on change in GC across genomes for each scaffold.
+        td_bound : ndarray
+            Upper bound on TD for each scaffold.
+        require_gc_and_td : boolean
+            Flag indicating if genomes must be within both the GC and TD bounds.
+
+        Returns
+        -------
+        ndarray
+            Index of scaffold in each scaffold and genome pair.
+        ndarray
+            Index of genome in each scaffold and genome pair.
+        """
+
+        # allow for rounding when comparing
+        # bounds to the exact test statistics
+        tolerance = 1e-9
+
+        # mean genome GC must be within [gc - upper bound, gc - lower bound]
+        sorted_gc = genome_index['sorted_gc']
+        gc_start = np.searchsorted(sorted_gc, gc - gc_upper_bound * 100 - tolerance, side='left')
+        gc_end = np.searchsorted(sorted_gc, gc - gc_lower_bound * 100 + tolerance, side='right')
+
+        points = np.dot(signature - genome_index['centre'], genome_index['projection'])
+
+        pair_scaffold = []
+        pair_genome = []
+        for i in xrange(len(gc)):
+            gc_genomes = genome_index['gc_order'][gc_start[i]:gc_end[i]]
+            td_genomes = genome_index['tree'].query_ball_point(points[i], td_bound[i] * (1 + tolerance) + tolerance)
+
+            if require_gc_and_td:
+                genomes = np.intersect1d(gc_genomes, td_genomes)
+            else:
+                genomes = np.union1d(gc_genomes, td_genomes)
+
+            pair_scaffold.append(np.repeat(i, len(genomes)))
+            pair_genome.append(genomes.astype(int))
+
+        if not pair_scaffold:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        return np.concatenate(pair_scaffold), np.concatenate(pair_genome)
+
     def create_html_index(self, plot_dir, genome_plots):
         """Create HTML index for navigating outlier plots.
 
@@ -497,25 +1367,3 @@ class Outliers():
         fout.write('</body>\n')
         fout.write('</html>\n')
         fout.close()
-
-    def _read_distribution(self, prefix):
-        """Read distribution file.
-
-        Parameters
-        ----------
-        prefix : str
-            Prefix of distibution to read (gc_dist or td_dist)
-
-        Returns
-        -------
-        dict : d[percentile] -> critical value
-            Critical values at integer percentiles.
-        """
-
-        dist_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'distributions', prefix + '.txt')
-
-        with open(dist_file, 'r') as f:
-            s = f.read()
-            d = ast.literal_eval(s)
-
-        return d
@@ -0,0 +1,174 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+import numpy as np
+
+# maximum number of rows processed at once
+MAX_CHUNK_ROWS = 2 ** 16
+
+
+class TruncatedPCA(object):
+    """Principal component analysis restricted to the leading components.
+
+    The scatter matrix of the data is accumulated over chunks of rows,
+    so data can be fitted incrementally without holding a full (n x d)
+    matrix, and only the requested components are used to project
+    data. For profiles with few columns, such as tetranucleotide
+    signatures, the eigendecomposition of the (d x d) scatter matrix
+    is far cheaper than a full decomposition of the data matrix and
+    still gives the proportion of variance captured by every component.
+    """
+
+    def __init__(self, num_components, center=True):
+        """Initialization.
+
+        Parameters
+        ----------
+        num_components : int
+            Number of principal components to compute.
+        center : boolean
+            Flag indicating if data should be centered.
+        """
+
+        self.num_components = num_components
+        self.center = center
+
+        self.num_rows = 0
+        self._shift = None
+        self._sum = None
+        self._scatter = None
+
+        self.mean = None
+        self.components = None
+        self.variance = None
+
+    def partial_fit(self, chunk):
+        """Add rows to the fitted data.
+
+        Parameters
+        ----------
+        chunk : ndarray (n x d)
+            Rows of data matrix.
+
+        Returns
+        -------
+        TruncatedPCA
+            Self.
+        """
+
+        chunk = np.asarray(chunk, dtype=float)
+        if chunk.shape[0] == 0:
+            return self
+
+        # rows are shifted by an estimate of the mean to
+        # avoid loss of precision in the scatter matrix
+        if self._shift is None:
+            if self.center:
+                self._shift = chunk.mean(axis=0)
+            else:
+                self._shift = np.zeros(chunk.shape[1])
+            self._sum = np.zeros(chunk.shape[1])
+            self._scatter = np.zeros((chunk.shape[1], chunk.shape[1]))
+
+        x = chunk - self._shift
+        self._sum += x.sum(axis=0)
+        self._scatter += np.dot(x.T, x)
+        self.num_rows += chunk.shape[0]
+
+        self.components = None
+
+        return self
+
+    def _solve(self):
+        """Determine principal components from the fitted data."""
+
+        if self.center:
+            shifted_mean = self._sum / self.num_rows
+        else:
+            shifted_mean = np.zeros(len(self._sum))
+        self.mean = self._shift + shifted_mean
+
+        scatter = self._scatter - self.num_rows * np.outer(shifted_mean, shifted_mean)
+        eigenvalues, eigenvectors = np.linalg.eigh(scatter)
+
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues = np.clip(eigenvalues[order], 0, None)
+        eigenvectors = eigenvectors[:, order]
+
+        total = eigenvalues.sum()
+        if total > 0:
+            self.variance = eigenvalues / total
+        else:
+            self.variance = np.zeros(len(eigenvalues))
+
+        # orient each component so its largest loading is
+        # positive in order to give reproducible projections
+        components = eigenvectors[:, 0:min(self.num_components, eigenvectors.shape[1])]
+        signs = np.sign(components[np.abs(components).argmax(axis=0), np.arange(components.shape[1])])
+        signs[signs == 0] = 1
+        self.components = components * signs
+
+    def transform(self, data, chunk_rows=MAX_CHUNK_ROWS):
+        """Project data onto the principal components.
+
+        Parameters
+        ----------
+        data : ndarray (n x d)
+            Data matrix.
+        chunk_rows : int
+            Maximum number of rows to project at once.
+
+        Returns
+        -------
+        ndarray (n x k)
+            Projection of each row onto the leading principal components.
+        """
+
+        if self.components is None:
+            self._solve()
+
+        data = np.asarray(data, dtype=float)
+
+        pc = np.empty((data.shape[0], self.components.shape[1]))
+        for start in xrange(0, data.shape[0], chunk_rows):
+            pc[start:start + chunk_rows] = np.dot(data[start:start + chunk_rows] - self.mean, self.components)
+
+        return pc
+
+    def fit_transform(self, data, chunk_rows=MAX_CHUNK_ROWS):
+        """Fit data in chunks and project it onto the principal components.
+
+        Parameters
+        ----------
+        data : ndarray (n x d)
+            Data matrix.
+        chunk_rows : int
+            Maximum number of rows to process at once.
+
+        Returns
+        -------
+        ndarray (n x k)
+            Projection of each row onto the leading principal components.
+        ndarray
+            Proportion of variance captured by each principal component.
+        """
+
+        data = np.asarray(data, dtype=float)
+        for start in xrange(0, data.shape[0], chunk_rows):
+            self.partial_fit(data[start:start + chunk_rows])
+
+        return self.transform(data, chunk_rows), self.variance
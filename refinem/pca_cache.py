@@ -0,0 +1,310 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+"""Cache of tetranucleotide PCA results for each genome.
+
+PCA of the tetranucleotide signatures of a genome is required by the
+tetranucleotide PCA plot, the combined plot, and the cluster command.
+Results are cached by genome id and the set of scaffolds in the genome,
+so they are reused whenever the membership of a genome is unchanged,
+and the cache is persisted alongside the scaffold statistics file.
+Only entries used during a run are persisted, so results for previous
+memberships of a genome are evicted.
+The cache is discarded if the statistics file has been modified since
+the cache was written.
+"""
+
+import os
+import logging
+import hashlib
+import zipfile
+from contextlib import closing
+
+import numpy as np
+
+from refinem.pca import TruncatedPCA
+
+# fields stored for each cached genome
+FIELDS = ('genome_id', 'scaffold_ids', 'pc', 'variance', 'components', 'mean')
+
+
+def pca_cache_file(stats_file):
+    """Determine cache file for a scaffold statistics file.
+
+    Parameters
+    ----------
+    stats_file : str
+        File with scaffold statistics.
+
+    Returns
+    -------
+    str
+        File used to persist PCA results.
+    """
+
+    return os.path.splitext(stats_file)[0] + '.pca.npz'
+
+
+class PcaCache(object):
+    """Per-genome cache of PCA components, variance, and projected coordinates."""
+
+    def __init__(self, cache_file, stats_file=None):
+        """Initialization.
+
+        Parameters
+        ----------
+        cache_file : str
+            File used to persist PCA results.
+        stats_file : str
+            Scaffold statistics file the cached results were calculated from.
+        """
+
+        self.logger = logging.getLogger()
+
+        self.cache_file = cache_file
+        self.stats_file = stats_file
+
+        self.entries = {}
+        self.modified = set()
+
+        # keys of entries used during this run, and since
+        # the cache was last reported to another instance
+        self.used = set()
+        self.accessed = set()
+
+        self._load()
+
+    def _stats_version(self):
+        """Modification time and size of statistics file."""
+
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return np.zeros(2)
+
+        return np.array([os.path.getmtime(self.stats_file), os.path.getsize(self.stats_file)], dtype=float)
+
+    def _load(self):
+        """Read cached results if they are consistent with the statistics file."""
+
+        if not os.path.exists(self.cache_file):
+            return
+
+        try:
+            with closing(np.load(self.cache_file)) as cache:
+                if not np.array_equal(cache['stats_version'], self._stats_version()):
+                    self.logger.info('  Scaffold statistics have changed, ignoring PCA cache: ' + self.cache_file)
+                    return
+
+                for name in cache.files:
+                    if name == 'stats_version':
+                        continue
+
+                    key, field = name.split('_', 1)
+                    self.entries.setdefault(key, {})[field] = cache[name]
+        except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+            self.logger.warning('  [Warning] Failed to read PCA cache: ' + self.cache_file)
+            self.entries = {}
+
+    def key(self, genome_id, scaffold_ids):
+        """Determine cache key of a genome.
+
+        Parameters
+        ----------
+        genome_id : str
+            Unique identifier of genome.
+        scaffold_ids : iterable
+            Scaffolds in genome.
+
+        Returns
+        -------
+        str
+            Key identifying genome and its scaffolds.
+        """
+
+        h = hashlib.sha1(genome_id)
+        for scaffold_id in sorted(scaffold_ids):
+            h.update('\n' + scaffold_id)
+
+        return h.hexdigest()
+
+    def get(self, genome_id, scaffold_ids, num_components):
+        """Get cached PCA results for a genome.
+
+        Parameters
+        ----------
+        genome_id : str
+            Unique identifier of genome.
+        scaffold_ids : list of str
+            Scaffolds in genome, in the order of the rows of the projection.
+        num_components : int
+            Number of principal components required.
+
+        Returns
+        -------
+        ndarray (n x k)
+            Projection of each scaffold onto the leading principal components.
+        ndarray
+            Proportion of variance captured by each principal component.
+
+        None is returned if the genome is not cached or fewer
+        principal components were cached than are required.
+        """
+
+        key = self.key(genome_id, scaffold_ids)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        num_features, cached_components = entry['components'].shape
+        if cached_components < min(num_components, num_features):
+            return None
+
+        self.used.add(key)
+        self.accessed.add(key)
+
+        # cached rows are ordered by scaffold id
+        rows = np.searchsorted(entry['scaffold_ids'], np.array(scaffold_ids))
+        pc = entry['pc'][rows, 0:num_components]
+
+        return pc, entry['variance']
+
+    def add(self, genome_id, scaffold_ids, pca, pc):
+        """Add PCA results for a genome.
+
+        Parameters
+        ----------
+        genome_id : str
+            Unique identifier of genome.
+        scaffold_ids : list of str
+            Scaffolds in genome, in the order of the rows of the projection.
+        pca : TruncatedPCA
+            Fitted PCA of genome.
+        pc : ndarray (n x k)
+            Projection of each scaffold onto the leading principal components.
+        """
+
+        key = self.key(genome_id, scaffold_ids)
+
+        scaffold_ids = np.array(scaffold_ids)
+        order = np.argsort(scaffold_ids, kind='mergesort')
+        self.entries[key] = {'genome_id': np.array(genome_id),
+                             'scaffold_ids': scaffold_ids[order],
+                             'pc': pc[order],
+                             'variance': pca.variance,
+                             'components': pca.components,
+                             'mean': pca.mean}
+        self.modified.add(key)
+        self.used.add(key)
+        self.accessed.add(key)
+
+    def pca(self, genome_id, scaffold_ids, data_matrix, num_components):
+        """Get PCA results for a genome, calculating them if they are not cached.
+
+        Parameters
+        ----------
+        genome_id : str
+            Unique identifier of genome.
+        scaffold_ids : list of str
+            Scaffolds in genome.
+        data_matrix : list of lists
+            Tetranucleotide signature of each scaffold.
+        num_components : int
+            Number of principal components required.
+
+        Returns
+        -------
+        ndarray (n x k)
+            Projection of each scaffold onto the leading principal components.
+        ndarray
+            Proportion of variance captured by each principal component.
+        """
+
+        cached = self.get(genome_id, scaffold_ids, num_components)
+        if cached is not None:
+            return cached
+
+        pca = TruncatedPCA(num_components)
+        pc, variance = pca.fit_transform(data_matrix)
+        self.add(genome_id, scaffold_ids, pca, pc)
+
+        return pc, variance
+
+    def new_entries(self):
+        """Get and reset entries added and used since the cache was last saved or reset.
+
+        Returns
+        -------
+        dict : d[key] -> d[field] -> ndarray
+            Entries added to the cache.
+        set
+            Keys of all entries used, including those added.
+        """
+
+        entries = dict((key, self.entries[key]) for key in self.modified)
+        accessed = self.accessed
+        self.modified = set()
+        self.accessed = set()
+
+        return entries, accessed
+
+    def update(self, entries, used_keys=()):
+        """Add entries calculated by another cache instance.
+
+        Parameters
+        ----------
+        entries : dict : d[key] -> d[field] -> ndarray
+            Entries to add, as returned by new_entries().
+        used_keys : iterable
+            Keys of entries used by the other instance.
+        """
+
+        self.entries.update(entries)
+        self.modified.update(entries)
+        self.used.update(entries)
+        self.used.update(used_keys)
+
+    def save(self):
+        """Write cache to file if entries have been added or evicted.
+
+        Entries not used during this run are evicted. The cache is
+        written to a temporary file which then replaces the cache
+        file, so concurrent runs never see a partial cache.
+        """
+
+        unused = set(self.entries) - self.used
+        if not self.modified and not unused:
+            return
+
+        arrays = {'stats_version': self._stats_version()}
+        for key in self.used:
+            for field in FIELDS:
+                arrays[key + '_' + field] = self.entries[key][field]
+
+        tmp_file = self.cache_file + '.%d.tmp' % os.getpid()
+        try:
+            fout = open(tmp_file, 'wb')
+            np.savez(fout, **arrays)
+            fout.close()
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError):
+            self.logger.warning('  [Warning] Failed to write PCA cache: ' + self.cache_file)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return
+
+        for key in unused:
+            del self.entries[key]
+        self.modified = set()
@@ -29,10 +29,23 @@ from refinem.plots.mpld3_plugins import LinkedBrush, Tooltip
 
 
 class CombinedPlots(AbstractPlot):
-    def __init__(self, options):
-        """Initialize."""
+    def __init__(self, options, genome_id=None, pca_cache=None):
+        """Initialize.
+
+        Parameters
+        ----------
+        options : argparse.Namespace
+            Plot options.
+        genome_id : str
+            Unique identifier of genome being plotted.
+        pca_cache : PcaCache
+            Cache of PCA results used by the tetranucleotide PCA plots.
+        """
         AbstractPlot.__init__(self, options)
 
+        self.genome_id = genome_id
+        self.pca_cache = pca_cache
+
     def plot(self, genome_scaffold_stats,
              highlight_scaffold_ids, link_scaffold_ids,
              genome_stats,
@@ -50,9 +63,9 @@ class CombinedPlots(AbstractPlot):
             Pairs of scaffolds to link together.
         genome_stats : float
           Mean statistics for genome.
-        gc_dist : d[gc][length][percentile] -> critical value
+        gc_dist : DistributionTable
           GC distribution.
-        td_dist : d[length][percentile] -> critical value
+        td_dist : DistributionTable
           TD distribution.
         gc_perc : float
           GC percentile value to mark on plot.
@@ -126,7 +139,7 @@ class CombinedPlots(AbstractPlot):
                                 True)
 
         # tetranucleotide signature PCA plots
-        tetra = TetraPcaPlot(self.options)
+        tetra = TetraPcaPlot(self.options, self.genome_id, self.pca_cache)
         tetra.plot_on_axes(self.fig, 0, 1,
                           genome_scaffold_stats,
                           highlight_scaffold_ids,
@@ -15,15 +15,13 @@
 #                                                                             #
 ###############################################################################
 
-import itertools
-
 import mpld3
 
-from scipy.stats import pearsonr
 import numpy as np
 
 from refinem.plots.base_plot import BasePlot
 from refinem.plots.mpld3_plugins import Tooltip
+from refinem.kernels import pearson
 
 
 class CovCorrPlots(BasePlot):
@@ -98,17 +96,15 @@ class CovCorrPlots(BasePlot):
         """
 
         # calculate percent deviant of coverage profiles for each scaffold
-        correlations = []
-        for stats in genome_scaffold_stats.values():
-            corr_r = 1.0
-            if len(mean_coverage) >= 1:
-                corr_r, _corr_p = pearsonr(mean_coverage, stats.coverage)
-                if np.isnan(corr_r):
-                    # both coverage profiles contain identical values,
-                    # e.g. pearsonr([1,1,1],[2,2,2]) -> exception
-                    corr_r = 1.0
-
-            correlations.append(corr_r)
+        correlations = np.ones(len(genome_scaffold_stats))
+        if len(mean_coverage) >= 1:
+            coverage = [stats.coverage for stats in genome_scaffold_stats.values()]
+            correlations = pearson(np.array(coverage).reshape(len(coverage), len(mean_coverage)),
+                                   np.array([mean_coverage]))[:, 0]
+
+            # both coverage profiles contain identical values,
+            # e.g. pearsonr([1,1,1],[2,2,2]) -> exception
+            correlations[np.isnan(correlations)] = 1.0
 
         # histogram plot
         if axes_hist:
@@ -15,8 +15,6 @@
 #                                                                             #
 ###############################################################################
 
-import itertools
-
 import mpld3
 
 import numpy as np
@@ -96,20 +94,19 @@ class CovPercPlots(BasePlot):
           Coverage percentile values to mark on plot.
         """
 
-        # calculate percent difference of coverage profiles for each scaffold
-        mean_perc_diffs = []
-        for stats in genome_scaffold_stats.values():
+        # calculate percent difference of coverage profiles for each scaffold,
+        # with samples where the genome has no coverage contributing zero
+        genome_coverage = np.array(mean_coverage, dtype=float)
+        coverage = np.array([stats.coverage for stats in genome_scaffold_stats.values()], dtype=float)
+        coverage = coverage.reshape(len(coverage), len(genome_coverage))
 
-            mean_perc_diff = []
-            for cov_genome, cov_scaffold in itertools.izip(mean_coverage, stats.coverage):
-                if cov_genome == 0:
-                    mean_perc_diff.append(0)
-                elif len(mean_coverage) >= 2:
-                    mean_perc_diff.append(abs(cov_scaffold - cov_genome) * 100 / cov_genome)
-                else:
-                    mean_perc_diff.append((cov_scaffold - cov_genome) * 100 / cov_genome)
+        covered = genome_coverage != 0
+        perc_diffs = np.zeros(coverage.shape)
+        perc_diffs[:, covered] = (coverage[:, covered] - genome_coverage[covered]) * 100 / genome_coverage[covered]
+        if len(mean_coverage) >= 2:
+            perc_diffs = np.abs(perc_diffs)
 
-            mean_perc_diffs.append(np.mean(mean_perc_diff))
+        mean_perc_diffs = perc_diffs.mean(axis=1)
 
         # histogram plot
         if axes_hist:
@@ -48,9 +48,9 @@ class DistributionPlots(AbstractPlot):
             Pairs of scaffolds to link together.
         genome_stats : float
           Mean statistics for genome.
-        gc_dist : d[gc][length][percentile] -> critical value
+        gc_dist : DistributionTable
           GC distribution.
-        td_dist : d[length][percentile] -> critical value
+        td_dist : DistributionTable
           TD distribution.
         gc_perc : float
           GC percentile value to mark on plot.
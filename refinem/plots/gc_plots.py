@@ -20,7 +20,6 @@ import numpy as np
 import matplotlib
 import mpld3
 
-from biolib.common import find_nearest
 
 from refinem.plots.base_plot import BasePlot
 from refinem.plots.mpld3_plugins import Tooltip
@@ -46,7 +45,7 @@ class GcPlots(BasePlot):
             Pairs of scaffolds to link together.
         mean_gc : float
           Mean GC of genome.
-        gc_dist : d[gc][length][percentile] -> critical value
+        gc_dist : DistributionTable
           GC distribution.
         percentiles_to_plot : iterable
           Percentile values to mark on plot.
@@ -92,7 +91,7 @@ class GcPlots(BasePlot):
             Pairs of scaffolds to link together.
         mean_gc : float
           Mean GC of genome.
-        gc_dist : d[gc][length][percentile] -> critical value
+        gc_dist : DistributionTable
           GC distribution.
         percentiles_to_plot : iterable
           Percentile values to mark on plot.
@@ -125,27 +124,14 @@ class GcPlots(BasePlot):
         axes_scatter.plot([0, 0], [0, ymax], linestyle='dashed', color=self.axes_colour, lw=1.0, zorder=0)
 
         # plot reference distributions
-        closest_gc = find_nearest(np.array(gc_dist.keys()), mean_gc / 100)
         for percentile in percentiles_to_plot:
-            # find closest distribution values
-            temp_scaffold_len = gc_dist[closest_gc].keys()[0]
-            d = gc_dist[closest_gc][temp_scaffold_len]
-            gc_lower_bound_key = find_nearest(d.keys(), (100 - percentile) / 2.0)
-            gc_upper_bound_key = find_nearest(d.keys(), (100 + percentile) / 2.0)
-
-            xL = []
-            xU = []
-            y = []
-            for window_size in gc_dist[closest_gc]:
-                xL.append(gc_dist[closest_gc][window_size][gc_lower_bound_key] * 100)
-                xU.append(gc_dist[closest_gc][window_size][gc_upper_bound_key] * 100)
-                y.append(window_size / 1000.0)
-
-            # sort by y-values
-            sort_indexY = np.argsort(y)
-            xL = np.array(xL)[sort_indexY]
-            xU = np.array(xU)[sort_indexY]
-            y = np.array(y)[sort_indexY]
+            # find closest distribution values sorted by scaffold length
+            window_sizes, xL = gc_dist.curve((100 - percentile) / 2.0, mean_gc / 100)
+            _, xU = gc_dist.curve((100 + percentile) / 2.0, mean_gc / 100)
+
+            xL = xL * 100
+            xU = xU * 100
+            y = window_sizes / 1000.0
             axes_scatter.plot(xL, y, 'r--', lw=1.0, zorder=0)
             axes_scatter.plot(xU, y, 'r--', lw=1.0, zorder=0)
 
@@ -19,11 +19,9 @@ import numpy as np
 
 import mpld3
 
-from biolib.common import find_nearest
-from biolib.genomic_signature import GenomicSignature
-
 from refinem.plots.base_plot import BasePlot
 from refinem.plots.mpld3_plugins import Tooltip
+from refinem.kernels import manhattan
 
 
 class TdPlots(BasePlot):
@@ -48,7 +46,7 @@ class TdPlots(BasePlot):
             Pairs of scaffolds to link together.
         mean_signature : float
           Mean tetranucleotide signature of genome.
-        td_dist : d[length][percentile] -> critical value
+        td_dist : DistributionTable
           TD distribution.
         percentiles_to_plot : iterable
           Percentile values to mark on plot.
@@ -95,18 +93,16 @@ class TdPlots(BasePlot):
             Pairs of scaffolds to link together.
         mean_signature : float
           Mean tetranucleotide signature of genome.
-        td_dist : d[length][percentile] -> critical value
+        td_dist : DistributionTable
           TD distribution.
         percentiles_to_plot : iterable
           Percentile values to mark on plot.
         """
 
         # histogram plot
-        genomic_signature = GenomicSignature(0)
-
-        delta_tds = []
-        for stats in genome_scaffold_stats.values():
-            delta_tds.append(genomic_signature.manhattan(stats.signature, mean_signature))
+        signatures = [stats.signature for stats in genome_scaffold_stats.values()]
+        delta_tds = manhattan(np.array(signatures).reshape(len(signatures), len(mean_signature)),
+                              np.array([mean_signature]))[:, 0]
 
         if axes_hist:
             axes_hist.hist(delta_tds, bins=20, color=(0.5, 0.5, 0.5))
@@ -133,19 +129,10 @@ class TdPlots(BasePlot):
 
         # plot reference distributions
         for percentile in percentiles_to_plot:
-            # find closest distribution values
-            td_bound_key = find_nearest(td_dist[td_dist.keys()[0]].keys(), percentile)
-
-            x = []
-            y = []
-            for window_size in td_dist:
-                x.append(td_dist[window_size][td_bound_key])
-                y.append(window_size / 1000.0)
-
-            # sort by y-values
-            sort_indexY = np.argsort(y)
-            x = np.array(x)[sort_indexY]
-            y = np.array(y)[sort_indexY]
+            # find closest distribution values sorted by scaffold length
+            window_sizes, x = td_dist.curve(percentile)
+            x = np.array(x)
+            y = window_sizes / 1000.0
 
             # make sure x-values are strictly decreasing as y increases
             # as this is conservative and visually satisfying
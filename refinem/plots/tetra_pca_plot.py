@@ -22,17 +22,29 @@ import numpy as np
 
 from refinem.plots.base_plot import BasePlot
 from refinem.plots.mpld3_plugins import LinkedBrush, Tooltip
-
-from biolib.pca import PCA
+from refinem.pca import TruncatedPCA
 
 
 class TetraPcaPlot(BasePlot):
     """Create a scatterplot of the first 2 tetranucleotide principal components."""
 
-    def __init__(self, options):
-        """Initialize."""
+    def __init__(self, options, genome_id=None, pca_cache=None):
+        """Initialize.
+
+        Parameters
+        ----------
+        options : argparse.Namespace
+            Plot options.
+        genome_id : str
+            Unique identifier of genome being plotted.
+        pca_cache : PcaCache
+            Cache of PCA results used if a genome id is given.
+        """
         BasePlot.__init__(self, options)
 
+        self.genome_id = genome_id
+        self.pca_cache = pca_cache
+
         self.pca_computed = False
         self.pc = None
         self.variance = None
@@ -49,15 +61,20 @@ class TetraPcaPlot(BasePlot):
           Statistics for scaffolds in genome.
         """
 
+        scaffold_ids = []
         data_matrix = []
-        for stats in genome_scaffold_stats.values():
+        for scaffold_id, stats in genome_scaffold_stats.iteritems():
             cols = len(stats.signature)
+            scaffold_ids.append(scaffold_id)
             data_matrix.append(stats.signature)
 
         data_matrix = np.reshape(np.array(data_matrix), (len(data_matrix), cols))
 
-        pca = PCA()
-        self.pc, self.variance = pca.pca_matrix(data_matrix, 3, bCenter=True, bScale=False)
+        if self.pca_cache is not None and self.genome_id is not None:
+            self.pc, self.variance = self.pca_cache.pca(self.genome_id, scaffold_ids, data_matrix, 3)
+        else:
+            pca = TruncatedPCA(3)
+            self.pc, self.variance = pca.fit_transform(data_matrix)
 
         # ensure pc matrix has at least 2 dimensions
         if self.pc.shape[1] == 1:
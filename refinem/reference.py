@@ -98,12 +98,6 @@ class Reference(object):
             Percent identity threshold used by blast.
         """
 
-        # read statistics file
-        self.logger.info('')
-        self.logger.info('  Reading scaffold statistics.')
-        scaffold_stats = ScaffoldStats()
-        scaffold_stats.read(stat_file)
-
         # perform homology searches
         self.logger.info('')
         self.logger.info('  Creating diamond database for reference genomes.')
@@ -146,6 +140,12 @@ class Reference(object):
             scaffold_id = gene_id[0:gene_id.rfind('_')]
             hits_to_scaffold[scaffold_id].append(hit)
 
+        # read statistics for scaffolds with hits
+        self.logger.info('')
+        self.logger.info('  Reading scaffold statistics.')
+        scaffold_stats = ScaffoldStats()
+        scaffold_stats.read(stat_file, scaffold_ids=hits_to_scaffold.keys())
+
         # report summary stats for each scaffold
         reference_out = os.path.join(self.output_dir, 'references.tsv')
         fout = open(reference_out, 'w')
@@ -22,13 +22,21 @@ __license__ = 'GPL3'
 __maintainer__ = 'Donovan Parks'
 __email__ = 'donovan.parks@gmail.com'
 
+import os
 import sys
+import heapq
+import shutil
 import logging
+import tempfile
+import itertools
 from collections import namedtuple, defaultdict
 
+import numpy as np
+
 from refinem.coverage import Coverage
 from refinem.tetranucleotide import Tetranucleotide
 from refinem.errors import ParsingError
+from refinem.id_registry import IdRegistry
 
 from biolib.common import remove_extension
 import biolib.seq_io as seq_io
@@ -53,6 +61,12 @@ class ScaffoldStats(object):
      - len
      - coverage
      - tetranucleotide signature
+
+    Scaffold and genome ids are interned as dense integers when
+    statistics are read. The stats and scaffolds_in_genome
+    dictionaries are keyed by these integers and the genome_id of
+    each scaffold is an integer. Use scaffold_name() and
+    genome_name() to resolve integer ids when writing results.
     """
 
     def __init__(self, cpus=1):
@@ -69,13 +83,19 @@ class ScaffoldStats(object):
 
         self.unbinned = 'unbinned'
 
+        self.scaffold_registry = IdRegistry()
+        self.genome_registry = IdRegistry()
+        self.unbinned_id = self.genome_registry.intern(self.unbinned)
+
+        self._matrices = None
+
         self.ScaffoldStats = namedtuple('ScaffoldStats', """genome_id
                                                             gc
                                                             length
                                                             coverage
                                                             signature""")
 
-    def run(self, scaffold_file, genome_files, tetra_file, coverage_file, output_file):
+    def run(self, scaffold_file, genome_files, tetra_file, coverage_file, output_file, min_len=0):
         """Calculate statistics for scaffolds.
 
         Parameters
@@ -90,15 +110,21 @@ class ScaffoldStats(object):
             Coverage profiles for scaffolds
         output_file : str
             Output file for scaffolds statistics.
+        min_len : int
+            Ignore scaffolds shorter than the specified length.
         """
 
+        # scaffolds are keyed by integer ids shared by
+        # the signature and coverage tables
+        registry = IdRegistry()
+
         tetra = Tetranucleotide(self.cpus)
-        signatures = tetra.read(tetra_file)
+        signatures = tetra.read(tetra_file, registry)
 
         cov_profiles = None
         if coverage_file:
             coverage = Coverage(self.cpus)
-            cov_profiles, _ = coverage.read(coverage_file)
+            cov_profiles, _ = coverage.read(coverage_file, registry)
 
         # determine bin assignment for each scaffold
         self.logger.info('')
@@ -108,7 +134,7 @@ class ScaffoldStats(object):
         for gf in genome_files:
             genome_id = remove_extension(gf)
             for scaffold_id, _seq in seq_io.read_seq(gf):
-                scaffold_id_genome_id[scaffold_id] = genome_id
+                scaffold_id_genome_id[registry.intern(scaffold_id)] = genome_id
 
         # write out scaffold statistics
         fout = open(output_file, 'w')
@@ -124,7 +150,11 @@ class ScaffoldStats(object):
         fout.write('\n')
 
         for scaffold_id, seq in seq_io.read_seq(scaffold_file):
+            if len(seq) < min_len:
+                continue
+
             fout.write(scaffold_id)
+            scaffold_id = registry.intern(scaffold_id)
             fout.write('\t' + scaffold_id_genome_id.get(scaffold_id, self.unbinned))
             fout.write('\t%.2f' % (seq_tk.gc(seq) * 100.0))
             fout.write('\t%d' % len(seq))
@@ -138,49 +168,160 @@ class ScaffoldStats(object):
 
         fout.close()
 
-    def read(self, stats_file):
+    def _parse_stats(self, line_split, tetra_index):
+        """Parse statistics for a single scaffold.
+
+        Parameters
+        ----------
+        line_split : list of str
+            Tab separated fields of a line in the statistics file.
+        tetra_index : int
+            Index of first tetranucleotide frequency.
+
+        Returns
+        -------
+        namedtuple -> genome_id, gc, scaffold_len, coverage, signature
+            Statistics for scaffold with genome_id given as an integer id.
+        """
+
+        genome_id = self.genome_registry.intern(line_split[1])
+        gc = float(line_split[2])
+        scaffold_len = int(line_split[3])
+
+        coverage = []
+        for cov in line_split[4:tetra_index]:
+            coverage.append(float(cov))
+
+        signature = []
+        for freq in line_split[tetra_index:]:
+            signature.append(float(freq))
+
+        return self.ScaffoldStats(genome_id, gc, scaffold_len, coverage, signature)
+
+    def _index_file(self, stats_file):
+        """Name of byte-offset index for statistics file."""
+
+        return stats_file + '.idx'
+
+    def _build_index(self, stats_file):
+        """Build byte-offset index over statistics file.
+
+        The index gives the offset of each scaffold line along
+        with the genome assignment of the scaffold. It is written
+        next to the statistics file and is rebuilt whenever the
+        size or modification time of the statistics file changes.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+
+        Returns
+        -------
+        list of (str, str, int)
+            Scaffold id, genome id, and byte offset of each scaffold.
+        """
+
+        index = []
+        with open(stats_file) as f:
+            f.readline()
+
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+
+                line_split = line.split('\t', 2)
+                index.append((line_split[0], line_split[1], offset))
+
+        stat_info = os.stat(stats_file)
+        try:
+            fout = open(self._index_file(stats_file), 'w')
+            fout.write('%d\t%d\n' % (stat_info.st_size, int(stat_info.st_mtime)))
+            for scaffold_id, genome_id, offset in index:
+                fout.write('%s\t%s\t%d\n' % (scaffold_id, genome_id, offset))
+            fout.close()
+        except IOError:
+            self.logger.warning('  [Warning] Failed to write index for scaffold statistics file: %s' % stats_file)
+
+        return index
+
+    def _read_index(self, stats_file):
+        """Read byte-offset index over statistics file.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+
+        Returns
+        -------
+        list of (str, str, int)
+            Scaffold id, genome id, and byte offset of each scaffold.
+        """
+
+        index_file = self._index_file(stats_file)
+        if not os.path.exists(index_file):
+            return self._build_index(stats_file)
+
+        stat_info = os.stat(stats_file)
+        with open(index_file) as f:
+            file_size, mtime = [int(x) for x in f.readline().split('\t')]
+            if file_size != stat_info.st_size or mtime != int(stat_info.st_mtime):
+                return self._build_index(stats_file)
+
+            index = []
+            for line in f:
+                scaffold_id, genome_id, offset = line.rstrip('\n').split('\t')
+                index.append((scaffold_id, genome_id, int(offset)))
+
+        return index
+
+    def read(self, stats_file, genome_ids=None, scaffold_ids=None):
         """Read statistics for scaffolds.
 
+        If genome or scaffold ids are specified, only the
+        statistics for these scaffolds are read. This is done
+        using a byte-offset index over the statistics file so
+        the cost of reading is proportional to the number of
+        requested scaffolds.
+
         Parameters
         ----------
         stats_file : str
             File with statistics for individual scaffolds.
+        genome_ids : iterable
+            Only read scaffolds assigned to these genomes.
+        scaffold_ids : iterable
+            Only read these scaffolds.
         """
 
         try:
             sig = {}
             self.genome_ids = set()
             with open(stats_file) as f:
-                header = f.readline().split('\t')
-
-                if 'AAAA' not in header:
-                    raise ParsingError("[Error] Statistics file is missing tetranucleotide signature data: %s" % stats_file)
-
-                tetra_index = header.index('AAAA')
-                self.signature_headers = [x.strip() for x in header[tetra_index:]]
-                self.coverage_headers = [x.strip() for x in header[4:tetra_index]]
+                tetra_index = self._parse_header(f.readline(), stats_file)
 
                 self.scaffolds_in_genome = defaultdict(set)
                 self.stats = {}
-                for line in f:
-                    line_split = line.split('\t')
-                    scaffold_id = line_split[0]
-                    genome_id = line_split[1]
-                    gc = float(line_split[2])
-                    scaffold_len = int(line_split[3])
+                self._matrices = None
 
-                    coverage = []
-                    for cov in line_split[4:tetra_index]:
-                        coverage.append(float(cov))
+                if genome_ids is None and scaffold_ids is None:
+                    lines = f
+                else:
+                    genome_ids = set(genome_ids) if genome_ids is not None else set()
+                    scaffold_ids = set(scaffold_ids) if scaffold_ids is not None else set()
 
-                    signature = []
-                    for freq in line_split[tetra_index:]:
-                        signature.append(float(freq))
+                    offsets = []
+                    for scaffold_id, genome_id, offset in self._read_index(stats_file):
+                        if scaffold_id in scaffold_ids or genome_id in genome_ids:
+                            offsets.append(offset)
 
-                    self.stats[scaffold_id] = self.ScaffoldStats(genome_id, gc, scaffold_len, coverage, signature)
+                    lines = self._read_lines(f, sorted(offsets))
 
-                    if genome_id != self.unbinned:
-                        self.scaffolds_in_genome[genome_id].add(scaffold_id)
+                for line in lines:
+                    self._add_line(line, tetra_index)
 
             return sig
         except IOError:
@@ -189,6 +330,324 @@ class ScaffoldStats(object):
         except ParsingError:
             sys.exit()
 
+    def _parse_header(self, header_line, stats_file):
+        """Parse header of statistics file.
+
+        Parameters
+        ----------
+        header_line : str
+            First line of statistics file.
+        stats_file : str
+            File with statistics for individual scaffolds.
+
+        Returns
+        -------
+        int
+            Index of first tetranucleotide frequency.
+        """
+
+        header = header_line.split('\t')
+
+        if 'AAAA' not in header:
+            raise ParsingError("[Error] Statistics file is missing tetranucleotide signature data: %s" % stats_file)
+
+        tetra_index = header.index('AAAA')
+        self.signature_headers = [x.strip() for x in header[tetra_index:]]
+        self.coverage_headers = [x.strip() for x in header[4:tetra_index]]
+
+        return tetra_index
+
+    def _add_line(self, line, tetra_index):
+        """Add statistics for scaffold given by a line in the statistics file.
+
+        Parameters
+        ----------
+        line : str
+            Line in statistics file.
+        tetra_index : int
+            Index of first tetranucleotide frequency.
+        """
+
+        line_split = line.split('\t')
+        scaffold_id = self.scaffold_registry.intern(line_split[0])
+
+        stats = self._parse_stats(line_split, tetra_index)
+        self.stats[scaffold_id] = stats
+
+        if stats.genome_id != self.unbinned_id:
+            self.scaffolds_in_genome[stats.genome_id].add(scaffold_id)
+
+    def _line_genome(self, line):
+        """Genome assignment of scaffold given by a line in the statistics file."""
+
+        return line.split('\t', 2)[1]
+
+    def _is_grouped(self, stats_file):
+        """Check if binned scaffolds in statistics file are grouped by genome.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+
+        Returns
+        -------
+        bool
+            True if the scaffolds of each genome are on consecutive lines.
+        """
+
+        seen_genomes = set()
+        prev_genome = None
+        for line in self._binned_lines(stats_file):
+            genome_id = self._line_genome(line)
+            if genome_id != prev_genome:
+                if genome_id in seen_genomes:
+                    return False
+
+                seen_genomes.add(genome_id)
+                prev_genome = genome_id
+
+        return True
+
+    def _binned_lines(self, stats_file):
+        """Lines of statistics file for binned scaffolds.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+        """
+
+        with open(stats_file) as f:
+            f.readline()
+
+            for line in f:
+                if self._line_genome(line) != self.unbinned:
+                    if not line.endswith('\n'):
+                        line += '\n'
+                    yield line
+
+    def _write_run(self, lines, run_dir, run_index):
+        """Write lines sorted by genome to a temporary file.
+
+        Parameters
+        ----------
+        lines : list of (str, str)
+            Genome assignment and line of each scaffold.
+        run_dir : str
+            Directory for temporary files.
+        run_index : int
+            Index of sorted run.
+
+        Returns
+        -------
+        str
+            Name of temporary file.
+        """
+
+        run_file = os.path.join(run_dir, 'run_%d.tsv' % run_index)
+
+        lines.sort()
+        fout = open(run_file, 'w')
+        for _genome_id, line in lines:
+            fout.write(line)
+        fout.close()
+
+        return run_file
+
+    def _read_run(self, run_file):
+        """Read sorted run written by _write_run()."""
+
+        with open(run_file) as f:
+            for line in f:
+                yield (self._line_genome(line), line)
+
+    def _sorted_lines(self, stats_file, max_scaffolds, run_dir):
+        """Lines of binned scaffolds sorted by genome.
+
+        An external merge sort is used so at most
+        max_scaffolds lines are held in memory.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+        max_scaffolds : int
+            Maximum number of lines to sort in memory.
+        run_dir : str
+            Directory for temporary files.
+        """
+
+        run_files = []
+        lines = []
+        for line in self._binned_lines(stats_file):
+            lines.append((self._line_genome(line), line))
+            if len(lines) >= max_scaffolds:
+                run_files.append(self._write_run(lines, run_dir, len(run_files)))
+                lines = []
+
+        if lines:
+            run_files.append(self._write_run(lines, run_dir, len(run_files)))
+            lines = []
+
+        runs = [self._read_run(run_file) for run_file in run_files]
+        for _genome_id, line in heapq.merge(*runs):
+            yield line
+
+    def _batch_stats(self, header_line, lines, stats_file):
+        """Statistics for a batch of lines from the statistics file."""
+
+        batch_stats = ScaffoldStats(self.cpus)
+        tetra_index = batch_stats._parse_header(header_line, stats_file)
+
+        batch_stats.scaffolds_in_genome = defaultdict(set)
+        batch_stats.stats = {}
+        for line in lines:
+            batch_stats._add_line(line, tetra_index)
+
+        return batch_stats
+
+    def read_genome_batches(self, stats_file, max_scaffolds=1000000, tmp_dir=None):
+        """Read statistics for batches of complete genomes.
+
+        Binned scaffolds are streamed from the statistics file
+        grouped by genome, so memory is bounded by the larger of
+        max_scaffolds and the largest genome rather than by the
+        size of the assembly. If the scaffolds of each genome are
+        not on consecutive lines, they are first grouped with an
+        external merge sort using temporary files. Unbinned
+        scaffolds are not read.
+
+        Parameters
+        ----------
+        stats_file : str
+            File with statistics for individual scaffolds.
+        max_scaffolds : int
+            Maximum number of scaffolds to read in a batch, unless a single genome is larger.
+        tmp_dir : str
+            Directory for temporary files.
+
+        Yields
+        ------
+        ScaffoldStats
+            Statistics for the scaffolds of one or more complete genomes.
+        """
+
+        run_dir = None
+        try:
+            with open(stats_file) as f:
+                header_line = f.readline()
+            self._parse_header(header_line, stats_file)
+
+            if self._is_grouped(stats_file):
+                lines = self._binned_lines(stats_file)
+            else:
+                self.logger.info('  Grouping scaffolds by genome.')
+                run_dir = tempfile.mkdtemp(prefix='refinem_', dir=tmp_dir)
+                lines = self._sorted_lines(stats_file, max_scaffolds, run_dir)
+
+            batch = []
+            for _genome_id, genome_lines in itertools.groupby(lines, key=self._line_genome):
+                genome_lines = list(genome_lines)
+                if batch and len(batch) + len(genome_lines) > max_scaffolds:
+                    yield self._batch_stats(header_line, batch, stats_file)
+                    batch = []
+
+                batch.extend(genome_lines)
+
+            if batch:
+                yield self._batch_stats(header_line, batch, stats_file)
+        except IOError:
+            print '[Error] Failed to open scaffold statistics file: %s' % stats_file
+            sys.exit()
+        except ParsingError:
+            sys.exit()
+        finally:
+            if run_dir:
+                shutil.rmtree(run_dir, ignore_errors=True)
+
+    def _read_lines(self, f, offsets):
+        """Read lines starting at the specified byte offsets.
+
+        Parameters
+        ----------
+        f : file
+            Open statistics file.
+        offsets : list of int
+            Sorted byte offsets of lines to read.
+        """
+
+        for offset in offsets:
+            f.seek(offset)
+            yield f.readline()
+
+    def matrices(self):
+        """Statistics for all scaffolds as numpy arrays.
+
+        Rows are ordered by integer scaffold id and are
+        computed once and cached until statistics are re-read.
+
+        Returns
+        -------
+        ndarray : n
+            Integer id of each scaffold.
+        ndarray : n
+            Integer id of genome each scaffold is assigned to.
+        ndarray : n
+            GC of each scaffold.
+        ndarray : n
+            Length of each scaffold.
+        ndarray : n x c
+            Coverage profile of each scaffold.
+        ndarray : n x 136
+            Tetranucleotide signature of each scaffold.
+        """
+
+        if self._matrices is None:
+            scaffold_ids = sorted(self.stats)
+            rows = [self.stats[scaffold_id] for scaffold_id in scaffold_ids]
+
+            num_rows = len(rows)
+            self._matrices = (np.array(scaffold_ids, dtype=int),
+                                np.array([s.genome_id for s in rows], dtype=int),
+                                np.array([s.gc for s in rows], dtype=float),
+                                np.array([s.length for s in rows], dtype=int),
+                                np.array([s.coverage for s in rows], dtype=float).reshape(num_rows, self.coverage_profile_length()),
+                                np.array([s.signature for s in rows], dtype=float).reshape(num_rows, self.signature_length()))
+
+        return self._matrices
+
+    def assign(self, scaffold_id, genome_id):
+        """Assign scaffold to a genome.
+
+        Parameters
+        ----------
+        scaffold_id : int
+            Integer id of scaffold.
+        genome_id : int
+            Integer id of genome, or the unbinned id to remove
+            the scaffold from its current genome.
+        """
+
+        stats = self.stats[scaffold_id]
+        if stats.genome_id == genome_id:
+            return
+
+        if stats.genome_id != self.unbinned_id:
+            scaffold_ids = self.scaffolds_in_genome[stats.genome_id]
+            scaffold_ids.discard(scaffold_id)
+            if not scaffold_ids:
+                del self.scaffolds_in_genome[stats.genome_id]
+
+        if genome_id != self.unbinned_id:
+            self.scaffolds_in_genome[genome_id].add(scaffold_id)
+
+        self.stats[scaffold_id] = stats._replace(genome_id=genome_id)
+
+        if self._matrices is not None:
+            row = np.searchsorted(self._matrices[0], scaffold_id)
+            self._matrices[1][row] = genome_id
+
     def num_scaffolds(self):
         """Number of scaffolds.
 
@@ -233,6 +692,70 @@ class ScaffoldStats(object):
 
         return len(self.signature_headers)
 
+    def scaffold_name(self, scaffold_id):
+        """Name of scaffold with the specified integer id.
+
+        Parameters
+        ----------
+        scaffold_id : int
+            Integer id of scaffold.
+
+        Returns
+        -------
+        str
+            Name of scaffold.
+        """
+
+        return self.scaffold_registry.name(scaffold_id)
+
+    def genome_name(self, genome_id):
+        """Name of genome with the specified integer id.
+
+        Parameters
+        ----------
+        genome_id : int
+            Integer id of genome.
+
+        Returns
+        -------
+        str
+            Name of genome.
+        """
+
+        return self.genome_registry.name(genome_id)
+
+    def scaffold_index(self, scaffold_name):
+        """Integer id of scaffold.
+
+        Parameters
+        ----------
+        scaffold_name : str
+            Name of scaffold.
+
+        Returns
+        -------
+        int
+            Integer id of scaffold.
+        """
+
+        return self.scaffold_registry.index(scaffold_name)
+
+    def genome_index(self, genome_name):
+        """Integer id of genome.
+
+        Parameters
+        ----------
+        genome_name : str
+            Name of genome.
+
+        Returns
+        -------
+        int
+            Integer id of genome.
+        """
+
+        return self.genome_registry.index(genome_name)
+
     def get(self, scaffold_id):
         """Statistics of scaffold.
 
@@ -243,11 +766,12 @@ class ScaffoldStats(object):
 
         Returns
         -------
-        namedtuple -> genome_id, gc, scaffold_len, coverage, signature
-            Statistics for scaffold.
+        namedtuple -> genome_id, gc, length, coverage, signature
+            Statistics for scaffold with genome_id given as the name of the genome.
         """
 
-        return self.stats[scaffold_id]
+        stats = self.stats[self.scaffold_registry.index(scaffold_id)]
+        return stats._replace(genome_id=self.genome_name(stats.genome_id))
 
     def genome_id(self, scaffold_id):
         """Genome assignment of scaffold.
@@ -263,7 +787,7 @@ class ScaffoldStats(object):
             Genome assignment of scaffold.
         """
 
-        return self.stats[scaffold_id].genome_id
+        return self.genome_name(self.stats[self.scaffold_registry.index(scaffold_id)].genome_id)
 
     def gc(self, scaffold_id):
         """GC of scaffold.
@@ -279,7 +803,7 @@ class ScaffoldStats(object):
             GC of scaffold.
         """
 
-        return self.stats[scaffold_id].gc
+        return self.stats[self.scaffold_registry.index(scaffold_id)].gc
 
     def scaffold_length(self, scaffold_id):
         """Length of scaffold.
@@ -295,7 +819,7 @@ class ScaffoldStats(object):
             Length of scaffold.
         """
 
-        return self.stats[scaffold_id].length
+        return self.stats[self.scaffold_registry.index(scaffold_id)].length
 
     def coverage(self, scaffold_id):
         """Coverage profile of scaffold.
@@ -311,7 +835,7 @@ class ScaffoldStats(object):
             Coverage profile of scaffold.
         """
 
-        return self.stats[scaffold_id].coverage
+        return self.stats[self.scaffold_registry.index(scaffold_id)].coverage
 
     def signature(self, scaffold_id):
         """Tetranucleotide signature of scaffold.
@@ -327,7 +851,7 @@ class ScaffoldStats(object):
            Tetranucleotide signature of scaffold.
         """
 
-        return self.stats[scaffold_id].signature
+        return self.stats[self.scaffold_registry.index(scaffold_id)].signature
 
     def print_coverage_header(self):
         """Print header line for coverage profile."""
@@ -353,7 +877,7 @@ class ScaffoldStats(object):
             String indicating genome id, scaffold length, and scaffold GC
         """
 
-        stats = self.stats[scaffold_id]
+        stats = self.get(scaffold_id)
         return '%s\t%d\t%.2f' % (stats.genome_id, stats.length, stats.gc)
 
     def print_coverage(self, scaffold_id):
@@ -371,7 +895,7 @@ class ScaffoldStats(object):
         """
 
         cov_strs = []
-        for cov in self.stats[scaffold_id].coverage:
+        for cov in self.get(scaffold_id).coverage:
             cov_strs.append('%.2f' % cov)
 
         return '\t'.join(cov_strs)
@@ -391,7 +915,7 @@ class ScaffoldStats(object):
         """
 
         tetra_strs = []
-        for tetra in self.stats[scaffold_id].signature:
+        for tetra in self.get(scaffold_id).signature:
             tetra_strs.append('%.2f' % tetra)
 
         return '\t'.join(tetra_strs)
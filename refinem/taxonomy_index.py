@@ -0,0 +1,316 @@
+###############################################################################
+#                                                                             #
+#    This program is free software: you can redistribute it and/or modify     #
+#    it under the terms of the GNU General Public License as published by     #
+#    the Free Software Foundation, either version 3 of the License, or        #
+#    (at your option) any later version.                                      #
+#                                                                             #
+#    This program is distributed in the hope that it will be useful,          #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of           #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the            #
+#    GNU General Public License for more details.                             #
+#                                                                             #
+#    You should have received a copy of the GNU General Public License        #
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.     #
+#                                                                             #
+###############################################################################
+
+"""Integer-coded taxonomy of reference genomes.
+
+Taxa are interned so each taxon at each rank is identified by an
+integer id. The lineage of each reference genome is a row of taxon
+ids, and the expected parent of each taxon is given by a parent-id
+array. Ranks without a named taxon (e.g., 's__') are given as
+UNCLASSIFIED rather than treated as a taxon. This allows hits to reference genomes to be classified over
+arrays of integers rather than taxonomy strings.
+
+The index is compiled once from a taxonomy file, after the file
+has been validated, and is stored in a binary file next to the
+taxonomy file. It is recompiled if the taxonomy file changes.
+"""
+
+import os
+import sys
+import logging
+import zipfile
+
+import numpy as np
+
+from biolib.taxonomy import Taxonomy
+
+# id indicating a sequence is unclassified at a rank
+UNCLASSIFIED = -1
+
+# format of compiled index, incremented when its encoding changes
+INDEX_FORMAT = 2
+
+
+def taxonomy_index_file(taxonomy_file):
+    """Determine compiled index file for a taxonomy file.
+
+    Parameters
+    ----------
+    taxonomy_file : str
+        File containing taxonomy strings for reference genomes.
+
+    Returns
+    -------
+    str
+        File containing compiled taxonomy index.
+    """
+
+    return taxonomy_file + '.idx.npz'
+
+
+def _file_version(taxonomy_file):
+    """Modification time and size of taxonomy file."""
+
+    return np.array([os.path.getmtime(taxonomy_file), os.path.getsize(taxonomy_file)], dtype=float)
+
+
+class TaxonomyIndex(object):
+    """Interned taxon ids, parent ids, and lineages of reference genomes."""
+
+    def __init__(self, taxonomy=None):
+        """Initialization.
+
+        Parameters
+        ----------
+        taxonomy : d[ref_genome_id] -> [domain, phylum, ..., species]
+            Taxonomic assignment of each reference genome.
+        """
+
+        self.logger = logging.getLogger()
+
+        self.genome_ids = []
+        self.genome_index = {}
+        self.taxa = []
+        self.ranks = np.zeros(0, dtype=np.int8)
+        self.parents = np.zeros(0, dtype=np.int32)
+        self.lineages = np.zeros((0, len(Taxonomy.rank_prefixes)), dtype=np.int32)
+
+        if taxonomy is not None:
+            self._build(taxonomy)
+
+    def _build(self, taxonomy):
+        """Intern taxa of each reference genome.
+
+        Parameters
+        ----------
+        taxonomy : d[ref_genome_id] -> [domain, phylum, ..., species]
+            Taxonomic assignment of each reference genome.
+        """
+
+        num_ranks = len(Taxonomy.rank_prefixes)
+
+        self.genome_ids = sorted(taxonomy)
+        self.genome_index = dict((genome_id, i) for i, genome_id in enumerate(self.genome_ids))
+
+        # intern taxa separately at each rank
+        self.taxa = []
+        ranks = []
+        taxon_ids = [{} for _ in xrange(num_ranks)]
+
+        self.lineages = np.empty((len(self.genome_ids), num_ranks), dtype=np.int32)
+        for i, genome_id in enumerate(self.genome_ids):
+            for r, taxon in enumerate(taxonomy[genome_id]):
+                if taxon == Taxonomy.rank_prefixes[r]:
+                    self.lineages[i, r] = UNCLASSIFIED
+                    continue
+
+                taxon_id = taxon_ids[r].get(taxon)
+                if taxon_id is None:
+                    taxon_id = len(self.taxa)
+                    taxon_ids[r][taxon] = taxon_id
+                    self.taxa.append(taxon)
+                    ranks.append(r)
+
+                self.lineages[i, r] = taxon_id
+
+        self.ranks = np.array(ranks, dtype=np.int8)
+
+        # expected parent of each taxon, taken from the first
+        # genome with the taxon in its lineage
+        self.parents = np.empty(len(self.taxa), dtype=np.int32)
+        self.parents.fill(UNCLASSIFIED)
+        for r in xrange(num_ranks - 1, 0, -1):
+            named = self.lineages[::-1, r] != UNCLASSIFIED
+            self.parents[self.lineages[::-1, r][named]] = self.lineages[::-1, r - 1][named]
+
+    def inconsistent_taxa(self):
+        """Identify taxa with more than one parent.
+
+        Returns
+        -------
+        list of str
+            Named taxa assigned to different parents in different genomes.
+        """
+
+        inconsistent = set()
+        for r in xrange(1, self.lineages.shape[1]):
+            rank_taxa = self.lineages[:, r]
+            named = rank_taxa != UNCLASSIFIED
+            mismatch = self.parents[rank_taxa[named]] != self.lineages[named, r - 1]
+            for taxon_id in np.unique(rank_taxa[named][mismatch]):
+                inconsistent.add(self.taxa[taxon_id])
+
+        return sorted(inconsistent)
+
+    @staticmethod
+    def compile(taxonomy_file):
+        """Read and validate taxonomy file, and store compiled index next to it.
+
+        Parameters
+        ----------
+        taxonomy_file : str
+            File containing GreenGenes taxonomy strings for reference genomes.
+
+        Returns
+        -------
+        TaxonomyIndex
+            Index of taxonomy.
+        """
+
+        logger = logging.getLogger()
+
+        t = Taxonomy()
+        taxonomy = t.read(taxonomy_file)
+        if not t.validate(taxonomy, check_prefixes=True, check_ranks=True, check_hierarchy=False, check_species=False, report_errors=True):
+            logger.error('[Error]  Invalid taxonomy file.')
+            sys.exit()
+
+        index = TaxonomyIndex(taxonomy)
+
+        inconsistent = index.inconsistent_taxa()
+        if inconsistent:
+            logger.warning('  [Warning] %d taxa have inconsistent parents, e.g. %s.' % (len(inconsistent), inconsistent[0]))
+
+        index.save(taxonomy_index_file(taxonomy_file), _file_version(taxonomy_file))
+
+        return index
+
+    @staticmethod
+    def load(taxonomy_file):
+        """Load compiled index of a taxonomy file, compiling it if required.
+
+        Parameters
+        ----------
+        taxonomy_file : str
+            File containing GreenGenes taxonomy strings for reference genomes.
+
+        Returns
+        -------
+        TaxonomyIndex
+            Index of taxonomy.
+        """
+
+        index_file = taxonomy_index_file(taxonomy_file)
+        if os.path.exists(index_file):
+            try:
+                index_data = np.load(index_file)
+                if ('format' in index_data.files
+                        and int(index_data['format']) == INDEX_FORMAT
+                        and np.array_equal(index_data['version'], _file_version(taxonomy_file))):
+                    index = TaxonomyIndex()
+                    index.genome_ids = index_data['genome_ids'].tolist()
+                    index.genome_index = dict((genome_id, i) for i, genome_id in enumerate(index.genome_ids))
+                    index.taxa = index_data['taxa'].tolist()
+                    index.ranks = index_data['ranks']
+                    index.parents = index_data['parents']
+                    index.lineages = index_data['lineages']
+                    return index
+            except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+                logging.getLogger().warning('  [Warning] Failed to read taxonomy index: ' + index_file)
+
+        return TaxonomyIndex.compile(taxonomy_file)
+
+    def save(self, index_file, version):
+        """Write compiled index.
+
+        The index is written to a temporary file which then replaces
+        the index file, so concurrent runs never see a partial index.
+
+        Parameters
+        ----------
+        index_file : str
+            File to contain compiled index.
+        version : ndarray
+            Modification time and size of the source taxonomy file.
+        """
+
+        arrays = {'format': np.array(INDEX_FORMAT),
+                  'version': version,
+                  'genome_ids': np.array(self.genome_ids),
+                  'taxa': np.array(self.taxa),
+                  'ranks': self.ranks,
+                  'parents': self.parents,
+                  'lineages': self.lineages}
+
+        tmp_file = index_file + '.%d.tmp' % os.getpid()
+        try:
+            fout = open(tmp_file, 'wb')
+            np.savez(fout, **arrays)
+            fout.close()
+            os.rename(tmp_file, index_file)
+        except (IOError, OSError):
+            self.logger.warning('  [Warning] Failed to write taxonomy index: ' + index_file)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def num_taxa(self):
+        """Number of interned taxa."""
+
+        return len(self.taxa)
+
+    def taxon(self, taxon_id):
+        """Name of taxon.
+
+        Parameters
+        ----------
+        taxon_id : int
+            Id of taxon, or UNCLASSIFIED.
+
+        Returns
+        -------
+        str
+            Name of taxon.
+        """
+
+        if taxon_id == UNCLASSIFIED:
+            return Taxonomy.unclassified_rank
+
+        return self.taxa[taxon_id]
+
+    def lineage(self, genome_index):
+        """Taxonomy string of a reference genome.
+
+        Parameters
+        ----------
+        genome_index : int
+            Index of reference genome.
+
+        Returns
+        -------
+        str
+            Taxa at each rank separated by semicolons.
+        """
+
+        return ';'.join(self._lineage_names(self.lineages[genome_index]))
+
+    def _lineage_names(self, lineage):
+        """Names of taxa in a lineage, with unnamed ranks given by their rank prefix."""
+
+        return [self.taxa[taxon_id] if taxon_id != UNCLASSIFIED else Taxonomy.rank_prefixes[r]
+                for r, taxon_id in enumerate(lineage)]
+
+    def taxonomy(self):
+        """Taxonomy of each reference genome.
+
+        Returns
+        -------
+        d[ref_genome_id] -> [domain, phylum, ..., species]
+            Taxonomic assignment of each reference genome.
+        """
+
+        return dict((genome_id, self._lineage_names(lineage))
+                    for genome_id, lineage in zip(self.genome_ids, self.lineages.tolist()))
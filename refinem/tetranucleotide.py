@@ -48,6 +48,8 @@ class Tetranucleotide(object):
         self.cpus = cpus
 
         self.signatures = GenomicSignature(4)
+
+        self.min_len = 0
         
 
     def canonical_order(self):
@@ -73,6 +75,9 @@ class Tetranucleotide(object):
 
         seq_id, seq = seq_info
 
+        if len(seq) < self.min_len:
+            return (seq_id, None)
+
         sig = self.signatures.seq_signature(seq)
 
         total_kmers = sum(sig)
@@ -100,7 +105,8 @@ class Tetranucleotide(object):
             consumer_data = {}
 
         seq_id, sig = produced_data
-        consumer_data[seq_id] = sig
+        if sig is not None:
+            consumer_data[seq_id] = sig
 
         return consumer_data
 
@@ -122,13 +128,15 @@ class Tetranucleotide(object):
 
         return '    Finished processing %d of %d (%.2f%%) sequences.' % (processed_items, total_items, float(processed_items) * 100 / total_items)
 
-    def run(self, seq_file):
+    def run(self, seq_file, min_len=0):
         """Calculate tetranucleotide signatures of sequences.
 
         Parameters
         ----------
         seq_file : str
             Name of fasta/q file to read.
+        min_len : int
+            Ignore sequences shorter than the specified length.
 
         Returns
         -------
@@ -138,18 +146,23 @@ class Tetranucleotide(object):
 
         self.logger.info('  Calculating tetranucleotide signature for each sequence:')
 
+        self.min_len = min_len
+
         parallel = Parallel(self.cpus)
         seq_signatures = parallel.run_seqs_file(self._producer, self._consumer, seq_file, self._progress)
 
         return seq_signatures
 
-    def read(self, signature_file):
+    def read(self, signature_file, registry=None):
         """Read tetranucleotide signatures.
 
         Parameters
         ----------
         signature_file : str
             Name of file to read.
+        registry : IdRegistry
+            Registry used to key signatures by integer
+            sequence id, or None to key signatures by name.
 
         Returns
         -------
@@ -173,7 +186,10 @@ class Tetranucleotide(object):
 
                 for line in f:
                     line_split = line.split('\t')
-                    sig[line_split[0]] = [float(line_split[i + 1]) for i in canonical_order_index]
+                    seq_id = line_split[0]
+                    if registry is not None:
+                        seq_id = registry.intern(seq_id)
+                    sig[seq_id] = [float(line_split[i + 1]) for i in canonical_order_index]
 
             return sig
         except IOError:
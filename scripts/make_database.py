@@ -45,6 +45,8 @@ from biolib.taxonomy import Taxonomy
 from biolib.external.execute import check_dependencies
 from biolib.misc.time_keeper import TimeKeeper
 
+from refinem.taxonomy_index import TaxonomyIndex
+
 
 class MakeDatabase(object):
     """Make a dereplicated database of genes.
@@ -88,6 +90,9 @@ class MakeDatabase(object):
             where taxonomy_str is in GreenGenes format:
                 d__Bacteria;p__Firmicutes;...
 
+        The taxonomy is read from its compiled index,
+        which is created if it does not exist.
+
         Parameters
         ----------
         input_taxonomy : str
@@ -99,13 +104,7 @@ class MakeDatabase(object):
             Taxonomy for each genome id.
         """
 
-        taxonomy = {}
-        for line in open(input_taxonomy):
-            line_split = line.split('\t')
-
-            taxonomy[line_split[0]] = [x.strip() for x in line_split[1].split(';')]
-
-        return taxonomy
+        return TaxonomyIndex.load(input_taxonomy).taxonomy()
 
     def read_type_strain(self, type_strain_file):
         """Read type strain file.
@@ -493,7 +492,8 @@ class MakeDatabase(object):
         gene_file = os.path.join(output_dir, 'genome_db.%s.genes.faa' % str(datetime.date.today()))
         gene_out = open(gene_file, 'w')
 
-        taxonomy_out = open(os.path.join(output_dir, 'taxonomy.%s.tsv' % str(datetime.date.today())), 'w')
+        taxonomy_file = os.path.join(output_dir, 'taxonomy.%s.tsv' % str(datetime.date.today()))
+        taxonomy_out = open(taxonomy_file, 'w')
 
         tmp_dir = tempfile.mkdtemp()
         total_genes_removed = 0
@@ -551,6 +551,11 @@ class MakeDatabase(object):
         taxonomy_out.close()
         gene_out.close()
 
+        # compile taxonomy of database for use by gene_profile
+        print ''
+        print 'Compiling taxonomy index.'
+        TaxonomyIndex.compile(taxonomy_file)
+
         print ''
         print 'Retain %d of %d (%.1f%%) genomes' % (total_genomes_kept, total_genomes_to_process, total_genomes_kept * 100.0 / (total_genomes_to_process))
         print '  Total genes kept: %d' % total_genes_kept